@@ -0,0 +1,163 @@
+"""
+Метрики эндпоинтов в формате Prometheus.
+
+Каждый процесс копит счётчики в памяти и раз в METRICS_FLUSH_INTERVAL
+секунд сбрасывает приращения в общий SQLite-файл METRICS_DB. Так
+данные всех воркеров gunicorn собираются в одном месте, а запрос
+платит только за обновление словаря.
+"""
+import contextvars
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import closing
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2)
+
+METRICS = [
+	("http_requests_total", "counter", "Число запросов"),
+	("http_request_duration_seconds", "histogram", "Время обработки запроса"),
+	("http_request_sql_queries_total", "counter", "Число SQL-запросов"),
+	("http_request_sql_duration_seconds_total", "counter", "Время в SQL-запросах"),
+	("http_response_size_bytes", "histogram", "Размер ответа"),
+]
+
+# Метод из запроса - метка серии: произвольные глаголы сводятся в "other",
+# иначе каждый из них заводил бы новые серии навсегда
+METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "TRACE", "CONNECT"))
+
+_lock = threading.Lock()
+_pending = defaultdict(float)
+_last_flush = time.monotonic()
+
+
+def _labels(**labels):
+	return ",".join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def _observe(metric, labels, value, buckets):
+	for bound in buckets:
+		if value <= bound:
+			_pending[(f"{metric}_bucket", f'{labels},le="{bound}"')] += 1
+	_pending[(f"{metric}_bucket", f'{labels},le="+Inf"')] += 1
+	_pending[(f"{metric}_sum", labels)] += value
+	_pending[(f"{metric}_count", labels)] += 1
+
+
+def record(method, route, status, duration, queries, sql_duration, size):
+	if method not in METHODS:
+		method = "other"
+	labels = _labels(method=method, route=route)
+	with _lock:
+		_pending[("http_requests_total", _labels(method=method, route=route, status=status))] += 1
+		_observe("http_request_duration_seconds", labels, duration, LATENCY_BUCKETS)
+		_pending[("http_request_sql_queries_total", labels)] += queries
+		_pending[("http_request_sql_duration_seconds_total", labels)] += sql_duration
+		if size is not None:
+			_observe("http_response_size_bytes", labels, size, SIZE_BUCKETS)
+
+	if time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+		flush()
+
+
+def _connect():
+	connection = sqlite3.connect(settings.METRICS_DB, timeout=5)
+	connection.execute("PRAGMA journal_mode=WAL")
+	connection.execute(
+		"CREATE TABLE IF NOT EXISTS samples ("
+		"name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL, "
+		"PRIMARY KEY (name, labels))"
+	)
+	return connection
+
+
+def flush():
+	global _last_flush
+	with _lock:
+		if not _pending:
+			_last_flush = time.monotonic()
+			return
+		rows = [(name, labels, value) for (name, labels), value in _pending.items()]
+		_pending.clear()
+		_last_flush = time.monotonic()
+
+	try:
+		with closing(_connect()) as connection, connection:
+			connection.executemany(
+				"INSERT INTO samples (name, labels, value) VALUES (?, ?, ?) "
+				"ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value",
+				rows,
+			)
+	except sqlite3.Error:
+		# Не удалось записать - вернём приращения, чтобы не потерять их
+		with _lock:
+			for name, labels, value in rows:
+				_pending[(name, labels)] += value
+
+
+def render():
+	flush()
+	with closing(_connect()) as connection:
+		samples = connection.execute("SELECT name, labels, value FROM samples ORDER BY name, labels").fetchall()
+
+	by_metric = defaultdict(list)
+	for name, labels, value in samples:
+		for metric, _, _ in METRICS:
+			if name == metric or name.startswith(metric + "_"):
+				by_metric[metric].append((name, labels, value))
+				break
+
+	lines = []
+	for metric, kind, description in METRICS:
+		lines.append(f"# HELP {metric} {description}")
+		lines.append(f"# TYPE {metric} {kind}")
+		for name, labels, value in by_metric[metric]:
+			lines.append(f"{name}{{{labels}}} {int(value) if value.is_integer() else value!r}")
+	return "\n".join(lines) + "\n"
+
+
+class QueryTimer:
+	"""Счётчик запросов и их времени для одного HTTP-запроса."""
+
+	def __init__(self):
+		self.count = 0
+		self.duration = 0.0
+		self._lock = threading.Lock()
+
+	def __call__(self, execute, sql, params, many, context):
+		started = time.perf_counter()
+		try:
+			return execute(sql, params, many, context)
+		finally:
+			elapsed = time.perf_counter() - started
+			# Под ASGI запросы одного HTTP-запроса идут из разных потоков
+			with self._lock:
+				self.duration += elapsed
+				self.count += 1
+
+
+# Таймер текущего запроса. Контекст копируется в потоки sync_to_async,
+# поэтому запросы из них попадают в тот же таймер, хотя у каждого потока
+# своё соединение
+current_timer = contextvars.ContextVar("current_timer", default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+	timer = current_timer.get()
+	if timer is None:
+		return execute(sql, params, many, context)
+	return timer(execute, sql, params, many, context)
+
+
+def watch(connection, **kwargs):
+	"""
+	Ставит `count_queries` на соединение потока; обработчик
+	`connection_created`, так что его получает и каждое соединение,
+	открытое в потоке sync_to_async.
+	"""
+	if count_queries not in connection.execute_wrappers:
+		connection.execute_wrappers.append(count_queries)
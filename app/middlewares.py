@@ -1,6 +1,172 @@
-from rest_framework.authentication import SessionAuthentication, BasicAuthentication 
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core import signing
+from django.core.cache import cache
+from django.db import connection
+from django.utils.crypto import salted_hmac
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, SessionAuthentication, BasicAuthentication, get_authorization_header
+
+from app import metrics
 
 class CsrfExemptSessionAuthentication(SessionAuthentication):
 
     def enforce_csrf(self, request):
-        return 
\ No newline at end of file
+        return
+
+
+def cached_user(user_id):
+    """Пользователь по id через кэш на USER_CACHE_TIMEOUT секунд."""
+    key = f"auth-user:{user_id}"
+    user = cache.get(key)
+    if user is None:
+        user = get_user_model()._default_manager.filter(pk=user_id).first()
+        if user is not None:
+            cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+    return user
+
+
+def forget_user(sender, instance, **kwargs):
+    # Смена пароля, прав или удаление - запись в кэше больше не годится
+    cache.delete(f"auth-user:{instance.pk}")
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend, который берёт пользователя сессии из кэша: проверка
+    сессии обходится без SELECT из auth_user. Сохранение пользователя
+    сбрасывает запись в этом процессе, в остальных она живёт не дольше
+    USER_CACHE_TIMEOUT.
+    """
+
+    def get_user(self, user_id):
+        user = cached_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+
+def password_fingerprint(user):
+    # Меняется вместе с хэшем пароля; сам хэш в кэш не кладётся
+    return salted_hmac("app.auth.password", user.password, algorithm="sha256").hexdigest()
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """
+    BasicAuthentication, который помнит удачную проверку пароля
+    BASIC_AUTH_CACHE_TIMEOUT секунд, чтобы PBKDF2 не считался на каждый
+    запрос. Ключ кэша - HMAC от логина и пароля на SECRET_KEY, в значении
+    только id пользователя и отпечаток хэша пароля: после смены пароля
+    запись не подходит и удаляется. Неудачные попытки не кэшируются.
+    """
+
+    def authenticate_credentials(self, userid, password, request=None):
+        key = "basic-auth:" + salted_hmac("app.auth.basic", f"{userid}\0{password}", algorithm="sha256").hexdigest()
+        cached = cache.get(key)
+        if cached is not None:
+            user_id, fingerprint = cached
+            user = cached_user(user_id)
+            if user is not None and user.is_active and password_fingerprint(user) == fingerprint:
+                return (user, None)
+            cache.delete(key)
+
+        user, auth = super().authenticate_credentials(userid, password, request)
+        cache.set(key, (user.pk, password_fingerprint(user)), settings.BASIC_AUTH_CACHE_TIMEOUT)
+        return (user, auth)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Подписанный токен `Authorization: Token <токен>` (см. `issue_token`).
+    Проверяются подпись и срок API_TOKEN_MAX_AGE, а пользователь берётся
+    через `cached_user` - обычно без запроса в базу. Права и активность -
+    текущие, а не на момент выдачи; смена пароля отзывает токен: в нём
+    отпечаток хэша пароля.
+    """
+
+    keyword = "Token"
+    salt = "app.auth.token"
+
+    @classmethod
+    def issue_token(cls, user):
+        payload = {"id": user.pk, "fp": password_fingerprint(user)}
+        return signing.dumps(payload, salt=cls.salt, compress=True)
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed("Invalid token header")
+
+        try:
+            payload = signing.loads(auth[1].decode(), salt=self.salt, max_age=settings.API_TOKEN_MAX_AGE)
+            user_id, fingerprint = payload["id"], payload["fp"]
+        except (signing.BadSignature, UnicodeDecodeError, KeyError, TypeError):
+            raise exceptions.AuthenticationFailed("Invalid or expired token")
+
+        user = cached_user(user_id)
+        if user is None or not user.is_active or password_fingerprint(user) != fingerprint:
+            raise exceptions.AuthenticationFailed("Invalid or expired token")
+        return (user, None)
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+class MetricsMiddleware:
+    """
+    Пишет по каждому маршруту число запросов, гистограммы задержки и
+    размера ответа, число и время SQL-запросов. Маршрут берётся из имени
+    представления, чтобы id в адресе не плодили отдельные серии.
+
+    Работает и в синхронной, и в асинхронной цепочке: иначе под ASGI
+    Django гонял бы каждый запрос через один общий поток. SQL-запросы
+    считаются во всех потоках запроса, в том числе из sync_to_async.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        metrics.watch(connection)
+        timer = metrics.QueryTimer()
+        token = metrics.current_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_timer.reset(token)
+        self.record(request, response, timer, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        timer = metrics.QueryTimer()
+        token = metrics.current_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_timer.reset(token)
+        self.record(request, response, timer, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, timer, duration):
+        match = request.resolver_match
+        route = (match.view_name or match.route) if match else "unmatched"
+        if response.streaming:
+            size = int(response["Content-Length"]) if response.has_header("Content-Length") else None
+        else:
+            size = len(response.content)
+
+        metrics.record(request.method, route, response.status_code, duration, timer.count, timer.duration, size)
@@ -29,6 +29,9 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', 'localhost,127.0.0.1,0.0.0.0,backend'
 
 MEDIA_ROOT = BASE_DIR / "media"
 MEDIA_URL = "/media/"
+# Файлы с данными пользователей (выгрузки): nginx их не раздаёт, только API
+# с проверкой владельца
+PRIVATE_MEDIA_ROOT = Path(os.getenv('PRIVATE_MEDIA_ROOT', BASE_DIR / "private"))
 
 
 # Application definition
@@ -47,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.middlewares.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,13 +86,73 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Профиль базы выбирается переменной DB_PROFILE:
+# sqlite - файл в режиме WAL: читатели не ждут писателя, а писатели ждут
+#   друг друга до SQLITE_TIMEOUT секунд вместо "database is locked";
+# sqlite-legacy - прежние настройки по умолчанию, для сравнения в benchmark;
+# postgres - PostgreSQL с пулом соединений (нужен psycopg[pool]).
+# Перенос данных из SQLite в PostgreSQL - manage.py transfer_data.
+DB_PROFILE = os.getenv('DB_PROFILE', 'sqlite')
+
+
+def database(profile, name=None):
+    if profile == 'sqlite-legacy':
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': name or os.getenv('SQLITE_PATH', str(BASE_DIR / 'db.sqlite3')),
+        }
+    if profile == 'sqlite':
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': name or os.getenv('SQLITE_PATH', str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Ожидание блокировки (busy timeout), секунды
+                'timeout': float(os.getenv('SQLITE_TIMEOUT', '20')),
+                # Транзакция сразу берёт блокировку записи: без этого две
+                # транзакции, начавшие с чтения, падают при попытке записать
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': ';'.join([
+                    'PRAGMA journal_mode=WAL',
+                    'PRAGMA synchronous=NORMAL',
+                    'PRAGMA cache_size=-20000',
+                    'PRAGMA temp_store=MEMORY',
+                    'PRAGMA mmap_size=134217728',
+                ]),
+            },
+        }
+    if profile == 'postgres':
+        pool = os.getenv('POSTGRES_POOL', 'True').lower() == 'true'
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': name or os.getenv('POSTGRES_DB', 'dormitory'),
+            'USER': os.getenv('POSTGRES_USER', 'dormitory'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            # Пул сам держит соединения открытыми, CONN_MAX_AGE с ним несовместим
+            'CONN_MAX_AGE': 0 if pool else int(os.getenv('DB_CONN_MAX_AGE', '600')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.getenv('POSTGRES_POOL_MIN', '2')),
+                    'max_size': int(os.getenv('POSTGRES_POOL_MAX', '10')),
+                    'timeout': float(os.getenv('POSTGRES_POOL_TIMEOUT', '10')),
+                },
+            } if pool else {},
+        }
+    raise ValueError(f'Unknown database profile: {profile}')
+
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database(DB_PROFILE),
 }
 
+# Откуда transfer_data берёт данные: файл прежней базы SQLite
+if os.getenv('SOURCE_SQLITE_PATH'):
+    DATABASES['source'] = database('sqlite-legacy', os.getenv('SOURCE_SQLITE_PATH'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -133,4 +197,74 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 SESSION_COOKIE_SAMESITE = 'Lax'  # или None, если нужно
-SESSION_COOKIE_HTTPONLY = True
\ No newline at end of file
+SESSION_COOKIE_HTTPONLY = True
+
+# Сколько помнить удачную проверку пароля Basic-аутентификации, и срок API-токенов
+BASIC_AUTH_CACHE_TIMEOUT = int(os.getenv('BASIC_AUTH_CACHE_TIMEOUT', '300'))
+API_TOKEN_MAX_AGE = int(os.getenv('API_TOKEN_MAX_AGE', '3600'))
+
+# Фоновые выгрузки: local - пул процессов в веб-воркере, worker - только manage.py run_export_worker
+EXPORT_JOBS_DISPATCH = os.getenv('EXPORT_JOBS_DISPATCH', 'local')
+EXPORT_WORKER_PROCESSES = int(os.getenv('EXPORT_WORKER_PROCESSES', '2'))
+EXPORT_JOB_TIMEOUT = int(os.getenv('EXPORT_JOB_TIMEOUT', '3600'))
+# В режиме local задача теряется, если процесс пула или веб-воркер умер до
+# запуска: не чаще раза в столько секунд веб-воркер подбирает такие задачи
+EXPORT_RECOVERY_INTERVAL = int(os.getenv('EXPORT_RECOVERY_INTERVAL', '60'))
+
+# Обработка загруженных фото идёт тем же пулом и воркером, что и выгрузки
+PICTURE_JOBS_DISPATCH = os.getenv('PICTURE_JOBS_DISPATCH', EXPORT_JOBS_DISPATCH)
+PICTURE_JOB_TIMEOUT = int(os.getenv('PICTURE_JOB_TIMEOUT', '300'))
+
+
+# Метрики эндпоинтов (/api/metrics): общий для всех воркеров файл и период сброса в него
+METRICS_DB = os.getenv('METRICS_DB', str(BASE_DIR / 'metrics.sqlite3'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+# Кэши: locmem живёт внутри процесса, поэтому при нескольких воркерах
+# нужен file или redis (общие для всех процессов)
+def cache_backend(kind, name):
+    if kind == 'locmem':
+        return {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': name, 'OPTIONS': {'MAX_ENTRIES': 10000}}
+    if kind == 'file':
+        location = os.path.join(os.getenv('CACHE_DIR', str(BASE_DIR / 'cache')), name)
+        return {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location, 'OPTIONS': {'MAX_ENTRIES': 10000}}
+    if kind == 'redis':
+        return {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1'), 'KEY_PREFIX': name}
+    if kind == 'dummy':
+        return {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    raise ValueError(f'Unknown cache backend: {kind}')
+
+
+# Кэш ответов списков и карточек API. Его версии сбрасывает и фоновая
+# обработка в других процессах, поэтому locmem годится только для
+# разработки (проверка studentDormitory.E001 при DEBUG=False)
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', '300'))
+
+# Сессии: db - как раньше, cached_db - чтение из кэша с записью в базу,
+# cache - только кэш, signed_cookies - данные сессии в подписанной куке.
+# cached_db и cache с locmem при нескольких воркерах небезопасны: выход
+# из системы не виден другим процессам - для них нужен file или redis
+SESSION_STRATEGY = os.getenv('SESSION_STRATEGY', 'db')
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSION_STRATEGY]
+SESSION_CACHE_ALIAS = 'sessions'
+
+CACHES = {
+    'default': cache_backend(os.getenv('CACHE_BACKEND', 'locmem'), 'default'),
+    RESPONSE_CACHE_ALIAS: cache_backend(os.getenv('RESPONSE_CACHE_BACKEND', 'locmem'), 'responses'),
+    SESSION_CACHE_ALIAS: cache_backend(os.getenv('SESSION_CACHE_BACKEND', 'locmem'), 'sessions'),
+}
+
+# Пользователь по id из сессии берётся из кэша default, а не из auth_user.
+# ModelBackend остаётся следом: сессии, открытые до перехода, хранят его
+# путь в _auth_user_backend, и без него пользователей бы разлогинило
+AUTHENTICATION_BACKENDS = [
+    'app.middlewares.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+USER_CACHE_TIMEOUT = int(os.getenv('USER_CACHE_TIMEOUT', '60'))
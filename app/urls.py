@@ -15,10 +15,10 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
-from studentDormitory.api import StudentViewset, RoomViewset, DutyScheduleViewset, StaffViewset, RepairRequestsViewset, UserViewset
-from studentDormitory import views
+from studentDormitory.api import StudentViewset, RoomViewset, DutyScheduleViewset, StaffViewset, RepairRequestsViewset, ExportJobViewset, MetricsViewset, SearchViewset, UserViewset
+from studentDormitory import views, async_views
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -28,10 +28,16 @@ router.register("rooms", RoomViewset, basename="rooms")
 router.register("dutySchedule", DutyScheduleViewset, basename="dutySchedule")
 router.register("staff", StaffViewset, basename="staff")
 router.register("repairRequests", RepairRequestsViewset, basename="repairRequests")
+router.register("exportJobs", ExportJobViewset, basename="exportJobs")
 router.register("user", UserViewset, basename="user")
+router.register("metrics", MetricsViewset, basename="metrics")
+router.register("search", SearchViewset, basename="search")
 
 urlpatterns = [
 	path('', views.ShowStudentsDormitoryView.as_view()),
     path('admin/', admin.site.urls),
+	path('api/async/', include(async_views)),
 	path('api/', include(router.urls)),
+	# До раздачи media: пропавший вариант фото перестраивается при первом запросе
+	re_path(r'^media/variants/(?P<prefix>[0-9a-f]{2})/(?P<digest>[0-9a-f]{64})_(?P<size>[a-z]+)\.(?P<extension>[a-z]+)$', views.picture_variant),
 ] + static(settings.MEDIA_URL, document_root = settings.MEDIA_ROOT)
@@ -0,0 +1,113 @@
+"""
+Профиль запуска gunicorn, все параметры - через переменные окружения.
+
+GUNICORN_WORKER_CLASS:
+  sync    - процесс на запрос, воркеров 2 * CPU + 1;
+  gthread - GUNICORN_THREADS потоков в процессе, воркеров CPU + 1;
+  uvicorn - ASGI (app.asgi), воркеров CPU + 1; нужен пакет uvicorn.
+            Только под ним /api/async/ отдаёт списки потоком - под
+            WSGI ответ собирается в памяти целиком.
+WEB_CONCURRENCY задаёт число воркеров явно.
+"""
+import gc
+import os
+
+
+def env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+def env_bool(name, default):
+    return os.getenv(name, default).lower() == 'true'
+
+
+def cpu_count():
+    # В контейнере с ограничением по CPU os.cpu_count() видит все ядра хоста
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+WORKER_CLASSES = {
+    'sync': ('sync', 'app.wsgi:application'),
+    'gthread': ('gthread', 'app.wsgi:application'),
+    'uvicorn': ('uvicorn.workers.UvicornWorker', 'app.asgi:application'),
+}
+kind = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+worker_class, wsgi_app = WORKER_CLASSES[kind]
+
+cpus = cpu_count()
+workers = env_int('WEB_CONCURRENCY', 2 * cpus + 1 if kind == 'sync' else cpus + 1)
+workers = min(workers, env_int('GUNICORN_MAX_WORKERS', '16'))
+threads = env_int('GUNICORN_THREADS', '4') if kind == 'gthread' else 1
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Приложение загружается в мастере до fork: воркеры делят его память
+# (copy-on-write) и стартуют быстрее
+preload_app = env_bool('GUNICORN_PRELOAD', 'True')
+
+# Перезапуск воркера после N запросов от утечек памяти; разброс, чтобы
+# воркеры не перезапускались одновременно
+max_requests = env_int('GUNICORN_MAX_REQUESTS', '1000')
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', '100')
+
+timeout = env_int('GUNICORN_TIMEOUT', '120')
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', '30')
+keepalive = env_int('GUNICORN_KEEPALIVE', '5')
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-')
+errorlog = '-'
+
+# Настройки Django ещё не загружены - значения по умолчанию можно
+# поправить. Кэш locmem у каждого процесса свой: сброс версий кэша
+# ответов, выход из системы и смена пароля не были бы видны другим
+# воркерам, поэтому при нескольких процессах по умолчанию берётся file.
+# Версии кэша ответов сбрасывает и фоновая обработка в пуле процессов,
+# так что для него file нужен всегда.
+os.environ.setdefault('RESPONSE_CACHE_BACKEND', 'file')
+if workers > 1:
+    for name in ('CACHE_BACKEND', 'SESSION_CACHE_BACKEND'):
+        os.environ.setdefault(name, 'file')
+
+# Под ASGI синхронный код идёт в разных потоках, постоянные соединения
+# копились бы по потокам - соединения держит пул базы (postgres)
+if kind == 'uvicorn':
+    os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+
+
+def pre_fork(server, worker):
+    # Объекты загруженного приложения уходят из-под сборщика мусора:
+    # иначе его проходы трогают их и копируют страницы в каждый воркер
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    # Соединения, открытые мастером при загрузке, воркерам не годятся
+    if preload_app:
+        from django.db import connections
+
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    # Gunicorn сам проверок Django не запускает: ошибка настроек (например,
+    # кэш ответов locmem) должна остановить воркер, а не всплыть устаревшими ответами
+    from django.core.management import call_command
+
+    call_command('check')
+
+    # Задачи и фото, потерянные перезапущенным воркером, отдаются пулу
+    # нового (режим local; у run_export_worker своё восстановление)
+    from studentDormitory import jobs
+
+    jobs.recover(force=True)
+
+
+def worker_exit(server, worker):
+    # Перезапуск по max_requests не должен терять накопленные метрики
+    from app import metrics
+
+    metrics.flush()
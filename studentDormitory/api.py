@@ -1,241 +1,284 @@
 from rest_framework.viewsets import GenericViewSet
 from rest_framework import mixins, serializers
+from app.middlewares import CsrfExemptSessionAuthentication, SignedTokenAuthentication, CachedBasicAuthentication
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from rest_framework.authentication import BasicAuthentication
-from app.middlewares import CsrfExemptSessionAuthentication
-from studentDormitory.models import Student, Room, DutySchedule, Staff, RepairRequests
-from studentDormitory.serializers import StudentSerializer, RoomSerializer, DutyScheduleSerializer, StaffSerializer, RepairRequestsSerializer
-from django.db.models import Avg, Count, Max, Min
+from rest_framework.utils.urls import replace_query_param
+from studentDormitory.models import Student, Room, DutySchedule, Staff, RepairRequests, ExportJob
+from studentDormitory.serializers import StudentSerializer, RoomSerializer, DutyScheduleSerializer, StaffSerializer, RepairRequestsSerializer, ExportJobSerializer, no_staff_message
+from studentDormitory import jobs, rotation, search, workload
+from studentDormitory.filters import Contains, Exact, DateParts
+from studentDormitory.viewsets import DormitoryViewset, ImportMixin
+from studentDormitory.pagination import KeysetPagination
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import  User
-from django.http import FileResponse
-from openpyxl import Workbook
-from docx import Document 
-import io
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import patch_cache_control
+from app import metrics
 
-class StudentViewset(
-	mixins.CreateModelMixin,
-	mixins.UpdateModelMixin,
-	mixins.RetrieveModelMixin,
-	mixins.DestroyModelMixin,
-	mixins.ListModelMixin,
-	GenericViewSet):
+class StudentViewset(ImportMixin, DormitoryViewset):
 	queryset = Student.objects.all()
 	serializer_class = StudentSerializer
-	authentication_classes =  (CsrfExemptSessionAuthentication, BasicAuthentication)
-	def get_queryset(self):
-		qs = super().get_queryset()
-		
-		if self.request.user.is_superuser:
-				return qs
-		
-		return qs.filter(user=self.request.user)
-	
-	class StatsSerializer(serializers.Serializer):
-		count = serializers.IntegerField()
-		avg = serializers.FloatField()
-		max = serializers.IntegerField()
-		min = serializers.IntegerField()
-
-	@action(detail=False, methods=["GET"], url_path="stats")
-	def get_stats(self, *args, **kwargs):
-		stats = Student.objects.aggregate(
-			count = Count("*"),
-			avg = Avg("id"),
-			max = Max("id"),
-			min = Min("id"),
-		)
-
-		serializer = self.StatsSerializer(instance = stats)
-
-		return Response(serializer.data)
-
-	@action(detail=False, methods=["GET"], url_path="export-excel")
-	def export_to_excel(self, request, *args, **kwargs):
-		workbook = Workbook()
-		sheet = workbook.active
-		sheet.title = "Students"
-		sheet.append(["ID", "ФИО", "Группа", "Номер комнаты"])
-		for student in Student.objects.select_related('room').all():
-			sheet.append([student.id, student.name, student.group, student.room.number])
-
-		file_stream = io.BytesIO()
-		workbook.save(file_stream)
-		file_stream.seek(0)
-
-		response = FileResponse(file_stream, as_attachment=True, filename="students.xlsx")
-		return response
-
-	@action(detail=False, methods=["GET"], url_path="export-word")
-	def export_to_word(self, request, *args, **kwargs):
-		document = Document()
-		document.add_heading("Students List", level=1)
-
-		# Данные
-		for student in Student.objects.select_related('room').all():
-				document.add_paragraph(f"ID: {student.id}, ФИО: {student.name}, Группа: {student.group}, Номер комнаты: {student.room.number}")
-
-		# Создаем файл в памяти
-		file_stream = io.BytesIO()
-		document.save(file_stream)
-		file_stream.seek(0)
-
-		response = FileResponse(file_stream, as_attachment=True, filename="students.docx")
-		return response
-
-
-class RoomViewset(
-	mixins.CreateModelMixin,
-	mixins.UpdateModelMixin,
-	mixins.RetrieveModelMixin,
-	mixins.DestroyModelMixin,
-	mixins.ListModelMixin,
-	GenericViewSet):
+	export_name = "students"
+	export_title = "Students"
+	export_columns = (
+		("ID", "id"),
+		("ФИО", "name"),
+		("Группа", "group"),
+		("Номер комнаты", "room.number"),
+	)
+	query_filters = (
+		Contains("name", "name"),
+		Exact("group", "group"),
+		Contains("room__number", "room"),
+		Exact("room_id", "room_id", int),
+		Exact("user_id", "user", int),
+	)
+	import_aliases = {
+		"ФИО": "name",
+		"Группа": "group",
+		"ID комнаты": "room_id",
+	}
+
+
+class AvailableRoomsPagination(KeysetPagination):
+	# Свободных комнат могут быть десятки тысяч - только постранично
+	paginate_always = True
+
+
+class RoomViewset(ImportMixin, DormitoryViewset):
 	queryset = Room.objects.all()
 	serializer_class = RoomSerializer
-	authentication_classes =  (CsrfExemptSessionAuthentication, BasicAuthentication)
-	def get_queryset(self):
-		qs = super().get_queryset()
-		
-		if self.request.user.is_superuser:
-				return qs
-		
-		return qs.filter(user=self.request.user)
-	
-	class StatsSerializer(serializers.Serializer):
-		count = serializers.IntegerField()
-		avg = serializers.FloatField()
-		max = serializers.IntegerField()
-		min = serializers.IntegerField()
-
-	@action(detail=False, methods=["GET"], url_path="stats")
-	def get_stats(self, *args, **kwargs):
-		stats = Room.objects.aggregate(
-			count = Count("*"),
-			avg = Avg("id"),
-			max = Max("id"),
-			min = Min("id"),
-		)
-
-		serializer = self.StatsSerializer(instance = stats)
-
-		return Response(serializer.data)
-
-class DutyScheduleViewset(
-	mixins.CreateModelMixin,
-	mixins.UpdateModelMixin,
-	mixins.RetrieveModelMixin,
-	mixins.DestroyModelMixin,
-	mixins.ListModelMixin,
-	GenericViewSet):
+	export_name = "rooms"
+	export_title = "Rooms"
+	export_columns = (
+		("ID", "id"),
+		("Номер комнаты", "number"),
+	)
+	query_filters = (
+		Contains("number", "number"),
+		Exact("user_id", "user", int),
+	)
+	import_aliases = {
+		"Номер комнаты": "number",
+		"Мест": "capacity",
+	}
+
+	@action(detail=False, methods=["GET"], url_path="available", pagination_class=AvailableRoomsPagination, cursor_ordering=("free_beds", "id"))
+	def available(self, request, *args, **kwargs):
+		"""
+		Комнаты, где свободно не меньше `beds` мест (по умолчанию одно), от
+		самых заполненных: заселение идёт плотно. Читается по индексу на
+		`free_beds` страницами, фильтры - как у списка.
+		"""
+		try:
+			beds = int(request.query_params.get("beds", 1))
+		except ValueError:
+			return Response({"error": "beds должно быть целым числом"}, status=400)
+		if beds < 1:
+			return Response({"error": "beds должно быть не меньше 1"}, status=400)
+
+		queryset = self.get_queryset().filter(free_beds__gte=beds)
+		page = self.paginate_queryset(queryset)
+		return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+
+class DutyScheduleViewset(DormitoryViewset):
 	queryset = DutySchedule.objects.all()
 	serializer_class = DutyScheduleSerializer
-	authentication_classes =  (CsrfExemptSessionAuthentication, BasicAuthentication)
-	def get_queryset(self):
-		qs = super().get_queryset()
-		
-		if self.request.user.is_superuser:
-				return qs
-		
-		return qs.filter(user=self.request.user)
-	
-	class StatsSerializer(serializers.Serializer):
-		count = serializers.IntegerField()
-		avg = serializers.FloatField()
-		max = serializers.IntegerField()
-		min = serializers.IntegerField()
-
-	@action(detail=False, methods=["GET"], url_path="stats")
-	def get_stats(self, *args, **kwargs):
-		stats = DutySchedule.objects.aggregate(
-			count = Count("*"),
-			avg = Avg("id"),
-			max = Max("id"),
-			min = Min("id"),
-		)
-
-		serializer = self.StatsSerializer(instance = stats)
-
-		return Response(serializer.data)
-
-class StaffViewset(
-	mixins.CreateModelMixin,
-	mixins.UpdateModelMixin,
-	mixins.RetrieveModelMixin,
-	mixins.DestroyModelMixin,
-	mixins.ListModelMixin,
-	GenericViewSet):
+	export_name = "duty_schedule"
+	export_title = "Duty Schedule"
+	export_columns = (
+		("ID", "id"),
+		("Дата", "date"),
+		("ФИО", "student.name"),
+		("Номер комнаты", "student.room.number"),
+	)
+	cursor_ordering = ("date", "id")
+	query_filters = (
+		DateParts("date"),
+		Contains("student__name", "student_name"),
+		Exact("student_id", "student_id", int),
+		Exact("user_id", "user", int),
+	)
+
+	class RotationSerializer(serializers.Serializer):
+		start = serializers.DateField()
+		end = serializers.DateField()
+		rooms = serializers.ListField(child=serializers.IntegerField(), required=False)
+		dry_run = serializers.BooleanField(default=False)
+
+	@action(detail=False, methods=["POST"], url_path="rotate")
+	def rotate(self, request, *args, **kwargs):
+		"""
+		Заполняет график с `start` по `end` по комнатам (см. `rotation`).
+		С `dry_run` ничего не пишет и возвращает предпросмотр.
+		"""
+		if not request.user.is_authenticated:
+			return Response({"error": "Forbidden"}, status=403)
+
+		serializer = self.RotationSerializer(data=request.data)
+		serializer.is_valid(raise_exception=True)
+		try:
+			report = rotation.schedule(request.user, **serializer.validated_data)
+		except ValueError as error:
+			return Response({"error": str(error)}, status=400)
+
+		return Response(report, status=200 if report["dry_run"] else 201)
+
+
+class StaffViewset(ImportMixin, DormitoryViewset):
 	queryset = Staff.objects.all()
 	serializer_class = StaffSerializer
-	authentication_classes =  (CsrfExemptSessionAuthentication, BasicAuthentication)
-	def get_queryset(self):
-		qs = super().get_queryset()
-		
-		if self.request.user.is_superuser:
-				return qs
-		
-		return qs.filter(user=self.request.user)
-	
-	class StatsSerializer(serializers.Serializer):
-		count = serializers.IntegerField()
-		avg = serializers.FloatField()
-		max = serializers.IntegerField()
-		min = serializers.IntegerField()
-
-	@action(detail=False, methods=["GET"], url_path="stats")
-	def get_stats(self, *args, **kwargs):
-		stats = Staff.objects.aggregate(
-			count = Count("*"),
-			avg = Avg("id"),
-			max = Max("id"),
-			min = Min("id"),
-		)
-
-		serializer = self.StatsSerializer(instance = stats)
-
-		return Response(serializer.data)
-
-class RepairRequestsViewset(
+	export_name = "staff"
+	export_title = "Staff"
+	export_columns = (
+		("ID", "id"),
+		("ФИО", "name"),
+		("Должность", "post"),
+	)
+	query_filters = (
+		Contains("name", "name"),
+		Contains("post", "post"),
+		Exact("user_id", "user", int),
+	)
+	import_aliases = {
+		"ФИО": "name",
+		"Должность": "post",
+	}
+
+	@action(detail=False, methods=["GET"], url_path="workload")
+	def get_workload(self, request, *args, **kwargs):
+		"""
+		Свои сотрудники по возрастанию нагрузки (заявок new/in_progress), при
+		`post` - одной должности. Лёгкий список для выбора исполнителя:
+		без фото и пагинации, первым идёт тот, кого выбрало бы назначение.
+		"""
+		if not request.user.is_authenticated:
+			return Response({"error": "Forbidden"}, status=403)
+
+		staff = workload.candidates(request.user.pk, request.query_params.get("post"))
+		return Response(staff.order_by("open_requests", "id").values("id", "name", "post", "open_requests"))
+
+
+class RepairRequestsViewset(DormitoryViewset):
+	queryset = RepairRequests.objects.all()
+	serializer_class = RepairRequestsSerializer
+	export_name = "repair_requests"
+	export_title = "Repair Requests"
+	export_columns = (
+		("ID", "id"),
+		("Дата", "date"),
+		("Описание", "description"),
+		("Статус", "get_status_display"),
+		("Номер комнаты", "room.number"),
+		("Сотрудник", "staff.name"),
+	)
+	cursor_ordering = ("date", "id")
+	query_filters = (
+		Contains("description", "description"),
+		Exact("status", "status"),
+		Exact("room_id", "room", int),
+		Exact("staff_id", "staff", int),
+		DateParts("date"),
+		Exact("user_id", "user", int),
+	)
+
+	def build_bulk_instances(self, validated_data, user):
+		posts = [data.pop("staff_post", "") for data in validated_data]
+		instances = super().build_bulk_instances(validated_data, user)
+		# Исполнители без явного staff_id расходятся по нагрузке в пределах пачки
+		pending = [(instance, post) for instance, post in zip(instances, posts) if instance.staff_id is None]
+		unassigned = {id(instance) for instance in workload.assign(pending)}
+		if unassigned:
+			errors = [
+				{"index": index, "errors": {"staff_id": [no_staff_message(post)]}}
+				for index, (instance, post) in enumerate(zip(instances, posts))
+				if id(instance) in unassigned
+			]
+			raise serializers.ValidationError({"errors": errors})
+		return instances
+
+	class RebalanceSerializer(serializers.Serializer):
+		post = serializers.CharField(required=False, allow_blank=True)
+		dry_run = serializers.BooleanField(default=False)
+
+	@action(detail=False, methods=["POST"], url_path="rebalance")
+	def rebalance(self, request, *args, **kwargs):
+		"""
+		Перераспределяет новые заявки между сотрудниками (при `post` - одной
+		должности), пока их нагрузка не сравняется с точностью до одной
+		заявки (см. `workload.rebalance`). С `dry_run` ничего не пишет.
+		"""
+		if not request.user.is_authenticated:
+			return Response({"error": "Forbidden"}, status=403)
+
+		serializer = self.RebalanceSerializer(data=request.data)
+		serializer.is_valid(raise_exception=True)
+		return Response(workload.rebalance(request.user, **serializer.validated_data))
+
+
+# Разделы, которые можно выгрузить фоновой задачей, по именам из роутера
+EXPORT_TARGETS = {
+	"students": StudentViewset,
+	"rooms": RoomViewset,
+	"dutySchedule": DutyScheduleViewset,
+	"staff": StaffViewset,
+	"repairRequests": RepairRequestsViewset,
+}
+
+
+class ExportJobViewset(
 	mixins.CreateModelMixin,
-	mixins.UpdateModelMixin,
 	mixins.RetrieveModelMixin,
 	mixins.DestroyModelMixin,
 	mixins.ListModelMixin,
 	GenericViewSet):
-	queryset = RepairRequests.objects.all()
-	serializer_class = RepairRequestsSerializer
-	authentication_classes =  (CsrfExemptSessionAuthentication, BasicAuthentication)
+	queryset = ExportJob.objects.order_by("-id")
+	serializer_class = ExportJobSerializer
+	authentication_classes =  (CsrfExemptSessionAuthentication, SignedTokenAuthentication, CachedBasicAuthentication)
+
 	def get_queryset(self):
 		qs = super().get_queryset()
-		
+
 		if self.request.user.is_superuser:
 				return qs
-		
+
 		return qs.filter(user=self.request.user)
-	
-	class StatsSerializer(serializers.Serializer):
-		count = serializers.IntegerField()
-		avg = serializers.FloatField()
-		max = serializers.IntegerField()
-		min = serializers.IntegerField()
-
-	@action(detail=False, methods=["GET"], url_path="stats")
-	def get_stats(self, *args, **kwargs):
-		stats = RepairRequests.objects.aggregate(
-			count = Count("*"),
-			avg = Avg("id"),
-			max = Max("id"),
-			min = Min("id"),
-		)
-
-		serializer = self.StatsSerializer(instance = stats)
-
-		return Response(serializer.data)
-	
-	
+
+	def list(self, request, *args, **kwargs):
+		# Клиент опрашивает список, пока ждёт выгрузку - заодно подбираем потерянные задачи
+		jobs.recover()
+		return super().list(request, *args, **kwargs)
+
+	def perform_create(self, serializer):
+		job = serializer.save()
+		jobs.dispatch(job)
+
+	def perform_destroy(self, instance):
+		if instance.file:
+			instance.file.delete(save=False)
+		instance.delete()
+
+	@action(detail=True, methods=["GET"], url_path="download")
+	def download(self, request, *args, **kwargs):
+		"""Файл готовой выгрузки - только владельцу задачи (и суперпользователю)."""
+		if not request.user.is_authenticated:
+			return Response({"error": "Forbidden"}, status=403)
+
+		job = self.get_object()
+		if job.status != "done" or not job.file:
+			return Response({"error": "Выгрузка ещё не готова"}, status=404)
+
+		name = f"{EXPORT_TARGETS[job.target].export_name}.{job.format}"
+		response = FileResponse(job.file.open("rb"), as_attachment=True, filename=name)
+		patch_cache_control(response, private=True, no_store=True)
+		return response
+
+
 class UserViewset(GenericViewSet):
 	@action(url_path="info", methods=["GET"], detail=False)
 	def get_info(self, request,  *args, **kwargs):
@@ -272,7 +315,81 @@ class UserViewset(GenericViewSet):
 		else:
 				return Response({"error": "Invalid credentials"}, status=400)
 
+	@method_decorator(csrf_exempt)
+	@action(url_path="token", methods=["POST"], detail=False, authentication_classes=(CsrfExemptSessionAuthentication, CachedBasicAuthentication))
+	def issue_token(self, request, *args, **kwargs):
+		"""Подписанный API-токен для скриптов: вместо пароля в каждом запросе."""
+		user = request.user if request.user.is_authenticated else None
+		if user is None:
+			user = authenticate(request, username=request.data.get("user"), password=request.data.get("password"))
+		if user is None:
+			return Response({"error": "Invalid credentials"}, status=400)
+
+		return Response({
+			"token": SignedTokenAuthentication.issue_token(user),
+			"expires_in": settings.API_TOKEN_MAX_AGE,
+		})
+
 	@action(url_path="logout", methods=["POST"], detail=False)
 	def logout(self, request, *args, **kwargs):
 			logout(request)
-			return Response({"success": True})
\ No newline at end of file
+			return Response({"success": True})
+
+
+class MetricsViewset(GenericViewSet):
+	"""Метрики эндпоинтов в текстовом формате Prometheus, только для суперпользователя."""
+	authentication_classes =  (CsrfExemptSessionAuthentication, SignedTokenAuthentication, CachedBasicAuthentication)
+
+	def list(self, request, *args, **kwargs):
+		if not request.user.is_superuser:
+			return Response({"error": "Forbidden"}, status=403)
+
+		return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class SearchViewset(GenericViewSet):
+	"""
+	Полнотекстовый поиск: `?q=` - слова, каждое ищется по началу; `types=` -
+	разделы через запятую (students, staff, repairRequests, по умолчанию
+	все); `page_size` и `offset`. Выдача отсортирована по релевантности.
+	"""
+	authentication_classes =  (CsrfExemptSessionAuthentication, SignedTokenAuthentication, CachedBasicAuthentication)
+	page_size = 20
+	max_page_size = 100
+	max_offset = 1000
+
+	def list(self, request, *args, **kwargs):
+		if not request.user.is_authenticated:
+			return Response({"error": "Forbidden"}, status=403)
+
+		params = request.query_params
+		sections = [section for section in params.get("types", "").split(",") if section] or list(search.INDEXES)
+		unknown = [section for section in sections if section not in search.INDEXES]
+		if unknown:
+			return Response({"error": "Неизвестный раздел", "types": unknown}, status=400)
+		try:
+			page_size = min(int(params.get("page_size", self.page_size)), self.max_page_size)
+			offset = int(params.get("offset", 0))
+		except ValueError:
+			return Response({"error": "page_size и offset должны быть числами"}, status=400)
+		if page_size <= 0 or not 0 <= offset <= self.max_offset:
+			return Response({"error": f"offset от 0 до {self.max_offset}, page_size больше 0"}, status=400)
+
+		hits, more = search.search(params.get("q", ""), request.user, sections, page_size, offset)
+
+		# Строки каждого раздела - одним запросом, через выборку и сериализатор вьюсета
+		objects = {}
+		for section in {section for section, _, _ in hits}:
+			viewset = EXPORT_TARGETS[section]
+			ids = [pk for hit_section, pk, _ in hits if hit_section == section]
+			rows = viewset.build_queryset(request.user, {}).filter(id__in=ids)
+			for row in viewset.serializer_class(rows, many=True, context=self.get_serializer_context()).data:
+				objects[(section, row["id"])] = row
+
+		results = [
+			{"type": section, "id": pk, "rank": round(rank, 6), "object": objects[(section, pk)]}
+			for section, pk, rank in hits
+			if (section, pk) in objects
+		]
+		next_url = replace_query_param(request.build_absolute_uri(), "offset", offset + page_size) if more else None
+		return Response({"next": next_url, "results": results})
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class StudentdormitoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'studentDormitory'
+
+    def ready(self):
+        from studentDormitory import checks, signals, pictures, search  # noqa: F401
+
+        post_migrate.connect(search.on_post_migrate, sender=self)
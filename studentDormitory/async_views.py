@@ -0,0 +1,111 @@
+"""
+Асинхронное чтение разделов: `/api/async/<раздел>/` и
+`/api/async/<раздел>/<id>/`. Под ASGI (GUNICORN_WORKER_CLASS=uvicorn)
+медленный клиент не держит воркер: строки читаются через `aiterator`,
+сериализуются пачками вне цикла событий, а список без пагинации уходит
+потоком, пока клиент его забирает.
+
+Под WSGI (sync, gthread - по умолчанию) Django собирает асинхронный
+поток в память целиком и отдаёт его одним ответом: для этих адресов
+нужен воркер uvicorn.
+
+Аутентификация, фильтры, срез по владельцу и курсорная пагинация - те же,
+что у вьюсетов из `api.EXPORT_TARGETS`. Запись, кэш ответов и ETag
+остаются за синхронным API.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import path
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from studentDormitory.api import EXPORT_TARGETS
+
+# Строк на одно чтение из базы и одну сериализацию
+CHUNK_SIZE = 200
+
+
+def dumps(data):
+	return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":"))
+
+
+def json_response(data, status=200):
+	return HttpResponse(dumps(data), status=status, content_type="application/json")
+
+
+class AsyncReadView(View):
+	viewset = None
+	http_method_names = ["get"]
+
+	async def get(self, request, pk=None):
+		drf_request = Request(request, authenticators=[auth() for auth in self.viewset.authentication_classes])
+		try:
+			# Аутентификаторы синхронные: сессия, кэш, база
+			user = await sync_to_async(lambda: drf_request.user)()
+			if not user.is_authenticated:
+				raise exceptions.PermissionDenied(exceptions.NotAuthenticated.default_detail)
+
+			queryset = self.viewset.build_queryset(user, drf_request.query_params)
+			if pk is None:
+				response = await self.list(drf_request, queryset)
+			else:
+				response = await self.retrieve(drf_request, queryset, pk)
+		except exceptions.APIException as error:
+			detail = error.detail
+			response = json_response(detail if isinstance(detail, (list, dict)) else {"detail": detail}, error.status_code)
+
+		patch_cache_control(response, private=True, no_cache=True)
+		patch_vary_headers(response, ("Cookie", "Authorization"))
+		return response
+
+	def serialize(self, request, rows):
+		return self.viewset.serializer_class(rows, many=True, context={"request": request}).data
+
+	async def encode(self, request, rows):
+		# Сериализатор может обращаться к хранилищу и базе (фото) - в поток
+		return dumps(await sync_to_async(self.serialize)(request, rows))
+
+	async def retrieve(self, request, queryset, pk):
+		try:
+			instance = await queryset.aget(pk=pk)
+		except queryset.model.DoesNotExist:
+			raise exceptions.NotFound()
+		data = await sync_to_async(self.serialize)(request, [instance])
+		return json_response(data[0])
+
+	async def list(self, request, queryset):
+		paginator = self.viewset.pagination_class()
+		page = paginator.page_queryset(queryset, request, self.viewset)
+		if page is not None:
+			rows = paginator.set_page([row async for row in page])
+			data = await sync_to_async(self.serialize)(request, rows)
+			return json_response(paginator.get_page_data(data))
+
+		queryset = queryset.order_by(*self.viewset.cursor_ordering)
+		return StreamingHttpResponse(self.stream(request, queryset), content_type="application/json")
+
+	async def stream(self, request, queryset):
+		yield "["
+		separator, rows = "", []
+		async for row in queryset.aiterator(chunk_size=CHUNK_SIZE):
+			rows.append(row)
+			if len(rows) == CHUNK_SIZE:
+				yield separator + (await self.encode(request, rows))[1:-1]
+				separator, rows = ",", []
+		if rows:
+			yield separator + (await self.encode(request, rows))[1:-1]
+		yield "]"
+
+
+urlpatterns = []
+for section, viewset in EXPORT_TARGETS.items():
+	view = AsyncReadView.as_view(viewset=viewset)
+	urlpatterns += [
+		path(f"{section}/", view, name=f"async-{section}-list"),
+		path(f"{section}/<int:pk>/", view, name=f"async-{section}-detail"),
+	]
@@ -0,0 +1,191 @@
+import math
+import threading
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from studentDormitory.pagination import KeysetPagination
+
+SECTIONS = ["students", "rooms", "dutySchedule", "staff", "repairRequests"]
+
+# имя замера, шаблон адреса, во сколько раз меньше повторов делать
+ENDPOINTS = [
+	("list", "/api/{section}/?page_size=50", 1),
+	("list_deep", "/api/{section}/?page_size=50&cursor={cursor}", 1),
+	("retrieve", "/api/{section}/{pk}/", 1),
+	("stats", "/api/{section}/stats/", 1),
+	("export", "/api/{section}/export-excel/", 10),
+]
+
+# Разница меньше этой в миллисекундах считается шумом
+LATENCY_FLOOR_MS = 2.0
+
+
+def percentile(values, fraction):
+	"""Перцентиль методом ближайшего ранга."""
+	ordered = sorted(values)
+	index = max(0, math.ceil(fraction * len(ordered)) - 1)
+	return ordered[index]
+
+
+def _fetch(client, url):
+	response = client.get(url)
+	if response.status_code != 200:
+		raise RuntimeError(f"GET {url} -> {response.status_code}")
+	if response.streaming:
+		for _ in response.streaming_content:
+			pass
+	return response
+
+
+def measure(client, url, repeat):
+	timings, queries = [], []
+	for _ in range(repeat):
+		with CaptureQueriesContext(connection) as context:
+			started = time.perf_counter()
+			_fetch(client, url)
+			timings.append((time.perf_counter() - started) * 1000)
+		queries.append(len(context.captured_queries))
+
+	# Память меряется отдельным прогоном: tracemalloc сильно замедляет код
+	tracemalloc.start()
+	try:
+		_fetch(client, url)
+		_, peak = tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+
+	return {
+		"p50_ms": round(percentile(timings, 0.5), 3),
+		"p95_ms": round(percentile(timings, 0.95), 3),
+		"queries": max(queries),
+		"peak_kb": round(peak / 1024, 1),
+	}
+
+
+def endpoint_urls(section, viewset, user):
+	queryset = viewset.scope_queryset(viewset.queryset.model.objects.all(), user)
+	ordering = viewset.cursor_ordering
+	total = queryset.count()
+	if not total:
+		return []
+
+	middle = queryset.order_by(*ordering)[total // 2]
+	params = {
+		"section": section,
+		"pk": middle.pk,
+		"cursor": KeysetPagination.make_cursor(KeysetPagination.position(middle, ordering)),
+	}
+	return [(name, template.format(**params), divisor) for name, template, divisor in ENDPOINTS]
+
+
+def run(client, targets, user, repeat):
+	results = {}
+	for section in SECTIONS:
+		for name, url, divisor in endpoint_urls(section, targets[section], user):
+			results[f"{section}.{name}"] = measure(client, url, max(1, repeat // divisor))
+	return results
+
+
+def mixed_urls(targets, user):
+	"""Чтения (списки и карточки всех разделов) и записи - PATCH карточек."""
+	reads, writes = [], []
+	for section in SECTIONS:
+		for name, url, _ in endpoint_urls(section, targets[section], user):
+			if name in ("list", "list_deep", "retrieve"):
+				reads.append(url)
+			if name == "retrieve":
+				writes.append(url)
+	return reads, writes
+
+
+def run_concurrent(clients, targets, user, repeat, write_every=10):
+	"""
+	Смешанная нагрузка: по потоку на клиента, у каждого потока своё
+	соединение с базой, `repeat` запросов на поток, каждый `write_every`-й -
+	запись. Ошибки (в том числе "database is locked") считаются, а не
+	прерывают замер.
+	"""
+	reads, writes = mixed_urls(targets, user)
+	if not reads:
+		return {}
+
+	threads = len(clients)
+	timings, errors = [], []
+	lock = threading.Lock()
+	start = threading.Barrier(threads + 1)
+
+	def worker(index, client):
+		local_timings, local_errors = [], 0
+		start.wait()
+		try:
+			for step in range(repeat):
+				write = step % write_every == write_every - 1
+				started = time.perf_counter()
+				try:
+					if write:
+						url = writes[(index + step) % len(writes)]
+						response = client.patch(url, {}, format="json")
+					else:
+						url = reads[(index + step) % len(reads)]
+						response = client.get(url)
+					failed = response.status_code >= 500
+				except Exception:
+					failed = True
+				local_timings.append((time.perf_counter() - started) * 1000)
+				local_errors += failed
+		finally:
+			connection.close()
+		with lock:
+			timings.extend(local_timings)
+			errors.append(local_errors)
+
+	workers = [threading.Thread(target=worker, args=(index, client)) for index, client in enumerate(clients)]
+	for thread in workers:
+		thread.start()
+	start.wait()
+	started = time.perf_counter()
+	for thread in workers:
+		thread.join()
+	elapsed = time.perf_counter() - started
+
+	return {
+		"threads": threads,
+		"rps": round(len(timings) / elapsed, 1),
+		"p50_ms": round(percentile(timings, 0.5), 3),
+		"p95_ms": round(percentile(timings, 0.95), 3),
+		"errors": sum(errors),
+	}
+
+
+def compare(current, baseline, tolerance):
+	"""
+	Ищет ухудшения относительно базового прогона. Задержки и память могут
+	вырасти, а пропускная способность (rps) упасть не больше чем на
+	`tolerance` (доля), число запросов и ошибок - никак.
+	"""
+	regressions = []
+	for size, endpoints in current.items():
+		for endpoint, metrics in endpoints.items():
+			base = baseline.get(size, {}).get(endpoint)
+			if not base:
+				continue
+			for metric, value in metrics.items():
+				old = base.get(metric)
+				if old is None:
+					continue
+				if metric == "threads":
+					continue
+				if metric in ("queries", "errors"):
+					worse = value > old
+				elif metric == "rps":
+					worse = value < old * (1 - tolerance)
+				elif metric.endswith("_ms"):
+					worse = value > old * (1 + tolerance) and value - old > LATENCY_FLOOR_MS
+				else:
+					worse = value > old * (1 + tolerance)
+				if worse:
+					regressions.append(f"{size} {endpoint} {metric}: {old} -> {value}")
+	return regressions
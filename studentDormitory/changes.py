@@ -0,0 +1,190 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.models import Exists, Max, OuterRef, Q
+
+from studentDormitory.eager import plan_eager_loading
+from studentDormitory.models import ChangeLog
+
+PAGE_SIZE = 1000
+
+_pending = threading.local()
+
+
+def _label(model):
+	return model._meta.model_name
+
+
+@contextmanager
+def batch():
+	"""
+	Внутри блока записи журнала только копятся и вставляются одним
+	bulk_create на выходе - как `stats.batch()` для каскадных удалений.
+	"""
+	if getattr(_pending, "entries", None) is not None:
+		yield
+		return
+
+	_pending.entries = []
+	try:
+		yield
+		entries, _pending.entries = _pending.entries, None
+		ChangeLog.objects.bulk_create(entries, batch_size=1000)
+	finally:
+		_pending.entries = None
+
+
+def record(model, rows):
+	"""`rows` - тройки (id записи, id владельца, действие)."""
+	entries = [
+		ChangeLog(model=_label(model), object_id=pk, owner=owner or 0, action=action)
+		for pk, owner, action in rows
+	]
+	pending = getattr(_pending, "entries", None)
+	if pending is not None:
+		pending.extend(entries)
+		return
+	ChangeLog.objects.bulk_create(entries, batch_size=1000)
+
+
+def _moved(pk, old_owner, new_owner):
+	# Для прежнего владельца строка пропала из выборки - для него это удаление
+	return [(pk, old_owner, "deleted")] if old_owner != new_owner else []
+
+
+def record_saved(instance, created):
+	rows = []
+	previous = None if created else instance.loaded_values()
+	if previous:
+		rows += _moved(instance.pk, previous.get("user_id", instance.user_id), instance.user_id)
+	rows.append((instance.pk, instance.user_id, "created" if created else "updated"))
+	record(type(instance), rows)
+
+
+def record_deleted(instance):
+	record(type(instance), [(instance.pk, instance.user_id, "deleted")])
+
+
+def record_bulk_created(model, instances):
+	record(model, [(instance.pk, instance.user_id, "created") for instance in instances])
+
+
+def record_bulk_updated(model, before, after):
+	rows = []
+	for old, new in zip(before, after):
+		rows += _moved(new["id"], old["user_id"], new["user_id"])
+		rows.append((new["id"], new["user_id"], "updated"))
+	record(model, rows)
+
+
+def latest_token():
+	"""
+	Токен на текущий момент: (наибольший видимый id, xmin снимка или None).
+
+	Id журнала выдаются при вставке, а видны становятся при коммите. На
+	SQLite запись идёт по одной транзакции за раз, и порядки совпадают. На
+	PostgreSQL транзакция может взять меньший id и закоммитить его уже
+	после чтения с большим токеном - поэтому в токене запоминается и xmin
+	снимка: все транзакции, ещё не завершённые на момент чтения, имеют
+	номер не меньше него, и их записи следующее чтение возьмёт по `xact`.
+	"""
+	if connection.vendor != "postgresql":
+		return ChangeLog.objects.aggregate(token=Max("id"))["token"] or 0, None
+	with connection.cursor() as cursor:
+		# Одним запросом - максимум и xmin из одного снимка
+		cursor.execute(
+			f"SELECT MAX(id), pg_snapshot_xmin(pg_current_snapshot())::text::bigint FROM {ChangeLog._meta.db_table}"
+		)
+		upper, xmin = cursor.fetchone()
+	return upper or 0, xmin
+
+
+def format_token(token):
+	upper, xmin = token
+	return str(upper) if xmin is None else f"{upper}.{xmin}"
+
+
+def parse_token(value):
+	"""Токен из строки `id` или `id.xmin`; ValueError, если строка не токен."""
+	upper, dot, xmin = value.partition(".")
+	if dot and not xmin:
+		raise ValueError(value)
+	return int(upper), int(xmin) if dot else None
+
+
+def _after(since, upper):
+	"""Условие на записи журнала после токена `since` и не позже `upper`."""
+	since_id, since_xmin = since
+	condition = Q(id__gt=since_id, id__lte=upper)
+	if since_xmin is not None:
+		# Транзакции, незавершённые при прошлом чтении, могли закоммитить
+		# записи с id меньше прошлого токена
+		condition |= Q(id__lte=since_id, xact__gte=since_xmin)
+	return condition
+
+
+def read(model, serializer_class, user, since, limit=PAGE_SIZE):
+	"""
+	Изменения модели после токена `since` (пара из `parse_token`) в срезе
+	пользователя.
+
+	Возвращает словарь: `token` для следующего запроса, `changed` - условие
+	на строки, которые нужно отдать заново, `ids` - их id из журнала,
+	`deleted` - id удалённых строк и `more`, если журнал прочитан не до
+	конца. Строки, у которых поменялась вложенная запись (комната у
+	студента), тоже попадают в `changed`. Запись может прийти повторно,
+	но не пропадает.
+	"""
+	# Верхняя граница берётся до чтения, иначе запись, вставленная между
+	# чтением и подсчётом токена, была бы пропущена
+	upper, xmin = latest_token()
+	since_id, since_xmin = since
+	entries = ChangeLog.objects.filter(model=_label(model))
+	if not user.is_superuser:
+		entries = entries.filter(owner=user.id)
+
+	# Поздние записи (id не больше прошлого токена) берутся все: это записи
+	# транзакций, шедших одновременно с прошлым чтением, их немного
+	late = []
+	if since_xmin is not None:
+		late = list(entries.filter(id__lte=since_id, xact__gte=since_xmin).values_list("id", "object_id", "action"))
+	rows = list(entries.filter(id__gt=since_id, id__lte=upper).order_by("id").values_list("id", "object_id", "action")[:limit + 1])
+	more = len(rows) > limit
+	rows = rows[:limit]
+	# Всё закоммиченное до текущего снимка уже прочитано; незавершённые
+	# сейчас транзакции имеют номер не меньше текущего xmin
+	token = (rows[-1][0] if more else upper, xmin)
+
+	latest = {}
+	for _, object_id, action in sorted(late + rows):
+		latest[object_id] = action
+	ids = {object_id for object_id, action in latest.items() if action != "deleted"}
+	deleted = sorted(object_id for object_id, action in latest.items() if action == "deleted")
+
+	changed = Q(id__in=ids)
+	select, prefetch = plan_eager_loading(serializer_class)
+	for path in select + prefetch:
+		related = model
+		for name in path.split("__"):
+			related = related._meta.get_field(name).related_model
+		touched = ChangeLog.objects.filter(_after(since, token[0]), model=_label(related), action="updated")
+		changed |= Q(**{f"{path}__in": touched.values("object_id")})
+
+	return {"token": token, "changed": changed, "ids": ids, "deleted": deleted, "more": more}
+
+
+def compact():
+	"""
+	Удаляет записи журнала, у которых есть более новая запись о той же
+	строке того же владельца. Ответ на любой `since` от этого не меняется:
+	последнее действие по строке остаётся в журнале.
+	"""
+	newer = ChangeLog.objects.filter(
+		model=OuterRef("model"),
+		object_id=OuterRef("object_id"),
+		owner=OuterRef("owner"),
+		id__gt=OuterRef("id"),
+	)
+	deleted, _ = ChangeLog.objects.filter(Exists(newer)).delete()
+	return deleted
@@ -0,0 +1,25 @@
+"""
+Проверки настроек при запуске (`manage.py check`, `runserver`, воркер
+выгрузок, воркеры gunicorn).
+"""
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+@checks.register(checks.Tags.caches)
+def response_cache_shared(app_configs, **kwargs):
+	"""
+	Фото и выгрузки обрабатываются в других процессах (пул процессов
+	или `run_export_worker`), и версии кэша ответов они сбрасывают там же.
+	Кэш locmem у каждого процесса свой: список продолжал бы отдавать
+	фото в статусе `pending` до истечения RESPONSE_CACHE_TIMEOUT.
+	"""
+	if not isinstance(caches[settings.RESPONSE_CACHE_ALIAS], LocMemCache):
+		return []
+	message = "Кэш ответов locmem не видит изменений из фоновой обработки фото и выгрузок"
+	hint = "Задайте RESPONSE_CACHE_BACKEND=file, redis или dummy"
+	if settings.DEBUG:
+		return [checks.Warning(message, hint=hint, id="studentDormitory.W001")]
+	return [checks.Error(message, hint=hint, id="studentDormitory.E001")]
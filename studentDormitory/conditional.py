@@ -0,0 +1,28 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.http import quote_etag
+
+from studentDormitory.eager import related_models
+
+
+def fingerprint(queryset, serializer_class, user):
+	"""
+	Дешёвый отпечаток выборки: число строк и последний `updated_at` в ней,
+	плюс последний `updated_at` моделей вложенных сериализаторов. Удаление
+	меняет число строк, вставка и изменение - максимум времени.
+
+	Возвращает (etag, last_modified) или (None, None) для пустой выборки.
+	"""
+	row = queryset.select_related(None).order_by().aggregate(count=Count("id"), updated=Max("updated_at"))
+	if not row["count"]:
+		return None, None
+
+	stamps = [row["updated"]]
+	for related in related_models(serializer_class):
+		# По индексу на updated_at - один шаг, а не проход по таблице
+		stamps.append(related.objects.order_by("-updated_at").values_list("updated_at", flat=True).first())
+
+	source = "|".join([str(user.pk), str(row["count"])] + [stamp.isoformat() if stamp else "-" for stamp in stamps])
+	etag = quote_etag(hashlib.sha1(source.encode()).hexdigest())
+	return etag, max(stamp for stamp in stamps if stamp)
@@ -0,0 +1,73 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+
+@lru_cache(maxsize=None)
+def plan_eager_loading(serializer_class):
+	"""
+	Возвращает пути для `select_related` и `prefetch_related`, которые
+	нужны сериализатору, чтобы список не превращался в 1 + N запросов.
+
+	Вложенный сериализатор на прямой FK/OneToOne даёт `select_related`,
+	`many=True` или обратная связь даёт `prefetch_related`. Всё, что
+	лежит ниже prefetch-пути, тоже подгружается через prefetch.
+	"""
+	select, prefetch = [], []
+	_walk(serializer_class(), "", False, select, prefetch)
+	return tuple(select), tuple(prefetch)
+
+
+@lru_cache(maxsize=None)
+def related_models(serializer_class):
+	"""
+	Модели, чьи строки попадают в ответ через вложенные сериализаторы:
+	у студента это комната, у дежурства - студент и его комната.
+	"""
+	select, prefetch = plan_eager_loading(serializer_class)
+	found = []
+	for path in select + prefetch:
+		related = serializer_class.Meta.model
+		for name in path.split("__"):
+			related = related._meta.get_field(name).related_model
+		if related not in found:
+			found.append(related)
+	return tuple(found)
+
+
+def eager_load(queryset, serializer_class):
+	select, prefetch = plan_eager_loading(serializer_class)
+	if select:
+		queryset = queryset.select_related(*select)
+	if prefetch:
+		queryset = queryset.prefetch_related(*prefetch)
+	return queryset
+
+
+def _walk(serializer, prefix, prefetching, select, prefetch):
+	model = serializer.Meta.model
+	for field in serializer.fields.values():
+		if field.write_only or field.source == "*":
+			continue
+
+		many = isinstance(field, serializers.ListSerializer)
+		nested = field.child if many else field
+		if not isinstance(nested, serializers.ModelSerializer):
+			continue
+
+		source = field.source.split(".")[0]
+		try:
+			relation = model._meta.get_field(source)
+		except FieldDoesNotExist:
+			continue
+		if not relation.is_relation:
+			continue
+
+		path = prefix + source
+		if prefetching or many or relation.many_to_many or relation.one_to_many:
+			prefetch.append(path)
+			_walk(nested, path + "__", True, select, prefetch)
+		else:
+			select.append(path)
+			_walk(nested, path + "__", False, select, prefetch)
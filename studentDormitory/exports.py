@@ -0,0 +1,58 @@
+from openpyxl import Workbook
+from docx import Document
+
+# Сколько строк за раз забирается из базы при выгрузке
+CHUNK_SIZE = 2000
+
+
+def column_value(obj, path):
+	"""Значение по пути вида `room.number`; методы вызываются, None пропускается."""
+	for name in path.split("."):
+		if obj is None:
+			return None
+		obj = getattr(obj, name)
+		if callable(obj):
+			obj = obj()
+	return obj
+
+
+def iter_rows(queryset, columns, progress=None):
+	"""Строки для выгрузки; `progress(n)` вызывается после каждой порции."""
+	paths = [path for _, path in columns]
+	written = 0
+	for obj in queryset.iterator(chunk_size=CHUNK_SIZE):
+		yield [column_value(obj, path) for path in paths]
+		written += 1
+		if progress is not None and written % CHUNK_SIZE == 0:
+			progress(written)
+	if progress is not None:
+		progress(written)
+
+
+def write_xlsx(queryset, columns, title, file_stream, progress=None):
+	"""
+	Пишет таблицу в режиме write-only: строки сразу уходят во временный
+	файл openpyxl, а не копятся в памяти в виде ячеек.
+	"""
+	workbook = Workbook(write_only=True)
+	sheet = workbook.create_sheet(title)
+	sheet.append([header for header, _ in columns])
+	for row in iter_rows(queryset, columns, progress):
+		sheet.append(row)
+	workbook.save(file_stream)
+
+
+def write_docx(queryset, columns, title, file_stream, progress=None):
+	"""
+	Строки читаются из базы порциями, но python-docx не умеет писать
+	потоком: весь документ (абзац на строку) собирается в памяти и
+	сохраняется в конце. Для больших таблиц - xlsx.
+	"""
+	document = Document()
+	document.add_heading(f"{title} List", level=1)
+
+	headers = [header for header, _ in columns]
+	for row in iter_rows(queryset, columns, progress):
+		document.add_paragraph(", ".join(f"{header}: {value}" for header, value in zip(headers, row)))
+
+	document.save(file_stream)
@@ -0,0 +1,59 @@
+"""
+Генерация тестовых строк для `manage.py generate_data`.
+
+Модуль не зависит от Django, чтобы его можно было выполнять в пуле
+процессов. Каждая порция строк получает свой seed, поэтому результат
+не зависит от числа процессов и порядка их завершения. Внешние ключи
+возвращаются как индексы в списке родительских строк.
+"""
+import random
+from datetime import date, timedelta
+
+from faker import Faker
+
+STATUSES = ["new", "in_progress", "completed", "cancelled"]
+
+_fakers = {}
+
+
+def chunk_seed(seed, kind, index):
+	return random.Random(f"{seed}:{kind}:{index}").getrandbits(32)
+
+
+def _faker(locale):
+	if locale not in _fakers:
+		_fakers[locale] = Faker([locale])
+	return _fakers[locale]
+
+
+def generate(task):
+	kind, seed, count, refs, options = task
+	fake = _faker(options["locale"])
+	fake.seed_instance(seed)
+	rnd = random.Random(seed)
+	end = date.fromordinal(options["end_date"])
+
+	def pick(name):
+		return rnd.randrange(refs[name]) if refs.get(name) else None
+
+	def day():
+		return (end - timedelta(days=rnd.randrange(366))).toordinal()
+
+	rows = []
+	for _ in range(count):
+		if kind == "users":
+			rows.append((fake.user_name(),))
+		elif kind == "rooms":
+			rows.append((fake.building_number(), pick("users")))
+		elif kind == "students":
+			group = f"ИСТБ-{rnd.randint(20, 30)}-{rnd.randint(1, 5)}"
+			rows.append((fake.name(), group, pick("rooms"), pick("users")))
+		elif kind == "staff":
+			rows.append((fake.name(), fake.job(), pick("users")))
+		elif kind == "duties":
+			rows.append((day(), pick("students"), pick("users")))
+		elif kind == "requests":
+			rows.append((day(), fake.text(), rnd.choice(STATUSES), pick("rooms"), pick("staff"), pick("users")))
+		else:
+			raise ValueError(f"Unknown kind: {kind}")
+	return rows
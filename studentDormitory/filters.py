@@ -0,0 +1,117 @@
+import calendar
+from datetime import date
+
+from rest_framework.exceptions import ValidationError
+
+
+class QueryFilter:
+	"""
+	Переводит один параметр запроса в предикат SQL.
+
+	Фильтры повторяют то, что раньше делали `filteredStudents`,
+	`filteredDuty` и `filteredRequests` во Vue, только на стороне базы.
+	"""
+
+	params = ()
+
+	def __init__(self, field):
+		self.field = field
+
+	def apply(self, queryset, params):
+		raise NotImplementedError
+
+
+class Contains(QueryFilter):
+	"""Подстрока без учёта регистра, как `includes(...)` на клиенте."""
+
+	def __init__(self, field, param):
+		super().__init__(field)
+		self.params = (param,)
+
+	def apply(self, queryset, params):
+		value = params.get(self.params[0])
+		if not value:
+			return queryset
+		return queryset.filter(**{f"{self.field}__icontains": value})
+
+
+class Exact(QueryFilter):
+	"""Точное совпадение по индексированному полю."""
+
+	def __init__(self, field, param, cast=str):
+		super().__init__(field)
+		self.params = (param,)
+		self.cast = cast
+
+	def apply(self, queryset, params):
+		value = params.get(self.params[0])
+		if not value:
+			return queryset
+		try:
+			value = self.cast(value)
+		except (TypeError, ValueError):
+			raise ValidationError({self.params[0]: "Некорректное значение"})
+		return queryset.filter(**{self.field: value})
+
+
+class DateParts(QueryFilter):
+	"""
+	Фильтр по году/месяцу/дню.
+
+	Если задан год, части даты превращаются в диапазон `date >= ... AND
+	date < ...`, который идёт по индексу. Месяц или день без года
+	индексом не покрываются и фильтруются через извлечение части даты.
+	"""
+
+	params = ("year", "month", "day")
+
+	def apply(self, queryset, params):
+		parts = {}
+		for name, upper in (("year", 9999), ("month", 12), ("day", 31)):
+			value = params.get(name)
+			if not value:
+				continue
+			try:
+				value = int(value)
+			except ValueError:
+				raise ValidationError({name: "Ожидается число"})
+			if not 1 <= value <= upper:
+				raise ValidationError({name: "Значение вне допустимого диапазона"})
+			parts[name] = value
+
+		year = parts.get("year")
+		month = parts.get("month")
+		day = parts.get("day")
+
+		if year is None:
+			lookups = {f"{self.field}__{name}": value for name, value in parts.items()}
+			return queryset.filter(**lookups)
+
+		if month is None:
+			start, end = date(year, 1, 1), self._next_year(year)
+			if day is not None:
+				queryset = queryset.filter(**{f"{self.field}__day": day})
+		elif day is None:
+			start, end = date(year, month, 1), self._next_month(year, month)
+		else:
+			if day > calendar.monthrange(year, month)[1]:
+				return queryset.none()
+			return queryset.filter(**{self.field: date(year, month, day)})
+
+		return queryset.filter(**{f"{self.field}__gte": start, f"{self.field}__lt": end})
+
+	@staticmethod
+	def _next_year(year):
+		return date(year + 1, 1, 1) if year < 9999 else date.max
+
+	@classmethod
+	def _next_month(cls, year, month):
+		if month == 12:
+			return cls._next_year(year)
+		return date(year, month + 1, 1)
+
+
+def apply_filters(queryset, params, query_filters):
+	for query_filter in query_filters:
+		queryset = query_filter.apply(queryset, params)
+	return queryset
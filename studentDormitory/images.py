@@ -0,0 +1,96 @@
+import hashlib
+import io
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# имя варианта -> наибольшая сторона в пикселях
+SIZES = {"thumb": 96, "card": 320, "full": 1280}
+FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+QUALITY = 82
+
+
+def content_hash(picture):
+	"""sha256 содержимого файла, читается кусками."""
+	digest = hashlib.sha256()
+	with picture.open("rb"):
+		for chunk in picture.chunks():
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+def variant_name(digest, size, extension):
+	# Имя по хэшу: одинаковые фото хранятся один раз, а URL никогда не меняется
+	return f"variants/{digest[:2]}/{digest}_{size}.{extension}"
+
+
+def render(picture):
+	"""Все варианты изображения: {(размер, расширение): байты}."""
+	with picture.open("rb"), Image.open(picture) as source:
+		source = ImageOps.exif_transpose(source)
+		source.load()
+
+	results = {}
+	for size, side in SIZES.items():
+		image = source.copy()
+		image.thumbnail((side, side), Image.LANCZOS)
+		for extension, image_format in FORMATS.items():
+			converted = image
+			if image_format == "JPEG" and image.mode != "RGB":
+				converted = image.convert("RGB")
+			elif image_format == "WEBP" and image.mode not in ("RGB", "RGBA"):
+				converted = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+			buffer = io.BytesIO()
+			converted.save(buffer, image_format, quality=QUALITY, optimize=image_format == "JPEG")
+			results[(size, extension)] = buffer.getvalue()
+	return results
+
+
+def missing(storage, digest):
+	return {
+		(size, extension)
+		for size in SIZES
+		for extension in FORMATS
+		if not storage.exists(variant_name(digest, size, extension))
+	}
+
+
+def generate(picture, digest, only=None):
+	"""Пишет варианты в хранилище; `only` - какие именно (по умолчанию все)."""
+	if only is not None and not only:
+		return
+	storage = picture.storage
+	for (size, extension), data in render(picture).items():
+		if only is not None and (size, extension) not in only:
+			continue
+		name = variant_name(digest, size, extension)
+		saved = storage.save(name, ContentFile(data))
+		if saved != name:
+			# Вариант уже записал параллельный процесс - копия не нужна
+			storage.delete(saved)
+
+
+def variants(picture, digest, request=None):
+	"""
+	Ссылки на варианты для сериализатора: `{"thumb": {"webp": url,
+	"jpeg": url}, ..., "srcset": {"webp": "url 96w, ...", ...}}`.
+	Хранилище не опрашивается: хэш появляется только после того, как
+	обработка записала все варианты. Пропавшую с диска копию (очистили
+	каталог) перестраивает первый запрос к её адресу
+	(`views.picture_variant`), все сразу - `manage.py build_picture_variants`.
+	"""
+	if not picture or not digest:
+		return None
+
+	storage = picture.storage
+
+	def url(size, extension):
+		location = storage.url(variant_name(digest, size, extension))
+		return request.build_absolute_uri(location) if request is not None else location
+
+	result = {size: {extension: url(size, extension) for extension in FORMATS} for size in SIZES}
+	result["srcset"] = {
+		extension: ", ".join(f"{url(size, extension)} {side}w" for size, side in SIZES.items())
+		for extension in FORMATS
+	}
+	return result
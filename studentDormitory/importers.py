@@ -0,0 +1,140 @@
+import csv
+import io
+from itertools import islice
+
+from django.db import transaction
+from openpyxl import load_workbook
+from rest_framework import serializers
+
+from studentDormitory.serializers import BatchPrimaryKeyRelatedField
+from studentDormitory.signals import post_bulk_create
+
+# Сколько строк проверяется и вставляется за один проход
+BATCH_SIZE = 500
+
+
+class ImportFormatError(Exception):
+	pass
+
+
+def read_rows(upload):
+	"""
+	Построчно читает xlsx (openpyxl в режиме read-only) или CSV. Первая
+	строка - заголовки. Возвращает пары (номер строки в файле, список значений).
+	"""
+	name = (getattr(upload, "name", "") or "").lower()
+	if name.endswith(".csv"):
+		text = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+		sample = text.read(4096)
+		text.seek(0)
+		try:
+			dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+		except csv.Error:
+			dialect = csv.excel
+		rows = csv.reader(text, dialect)
+	elif name.endswith(".xlsx"):
+		try:
+			workbook = load_workbook(upload, read_only=True, data_only=True)
+		except Exception as error:
+			raise ImportFormatError(f"Не удалось прочитать xlsx: {error}")
+		rows = _workbook_rows(workbook)
+	else:
+		raise ImportFormatError("Поддерживаются только файлы .xlsx и .csv")
+
+	return enumerate(rows, start=1)
+
+
+def _workbook_rows(workbook):
+	# В режиме read-only книга держит файл открытым, пока её не закроют
+	try:
+		yield from workbook.active.iter_rows(values_only=True)
+	finally:
+		workbook.close()
+
+
+def map_headers(headers, serializer, aliases):
+	columns = []
+	for header in headers:
+		header = str(header).strip() if header is not None else ""
+		field = aliases.get(header, header)
+		# владелец всегда тот, кто импортирует
+		if field != "user" and field in serializer.fields and not serializer.fields[field].read_only:
+			columns.append(field)
+		else:
+			columns.append(None)
+	return columns
+
+
+def import_rows(serializer_class, rows, user, aliases=None, dry_run=False, batch_size=BATCH_SIZE):
+	"""
+	Проверяет строки сериализатором и пишет их через `bulk_create` в одной
+	транзакции. Связи по *_id подгружаются одним запросом на пачку.
+	Ошибки копятся по номерам строк, корректные строки всё равно пишутся.
+	"""
+	serializer = serializer_class()
+	model = serializer.Meta.model
+	rows = iter(rows)
+
+	try:
+		_, headers = next(rows)
+	except StopIteration:
+		raise ImportFormatError("Файл пуст")
+	columns = map_headers(headers, serializer, aliases or {})
+	if not any(columns):
+		raise ImportFormatError("Не найдено ни одной известной колонки")
+
+	related = related_fields(serializer, columns)
+
+	created = 0
+	errors = []
+	with transaction.atomic():
+		while True:
+			chunk = list(islice(rows, batch_size))
+			if not chunk:
+				break
+			batch = []
+			for number, values in chunk:
+				data = {column: value for column, value in zip(columns, values) if column and value not in (None, "")}
+				if data:
+					batch.append((number, data))
+
+			serializer = serializer_class(context={"related": load_related(related, (data for _, data in batch))})
+			instances = []
+			for number, data in batch:
+				try:
+					validated = serializer.run_validation(data)
+				except serializers.ValidationError as error:
+					errors.append({"row": number, "errors": error.detail})
+					continue
+				instances.append(model(**validated, user=user))
+
+			if instances and not dry_run:
+				model.objects.bulk_create(instances)
+				post_bulk_create.send(sender=model, instances=instances)
+			created += len(instances)
+
+	return {"created": created, "errors": errors, "dry_run": dry_run}
+
+
+def related_fields(serializer, columns):
+	return {
+		name: field for name, field in serializer.fields.items()
+		if isinstance(field, BatchPrimaryKeyRelatedField) and name in columns
+	}
+
+
+def load_related(fields, rows):
+	"""Один запрос `in_bulk` на каждое поле *_id для всей пачки строк."""
+	ids = {name: set() for name in fields}
+	for data in rows:
+		for name in fields:
+			try:
+				ids[name].add(int(data[name]))
+			except (KeyError, TypeError, ValueError):
+				continue
+
+	related = {}
+	for name, field in fields.items():
+		queryset = field.get_queryset()
+		related[queryset.model] = queryset.in_bulk(ids[name])
+	return related
@@ -0,0 +1,134 @@
+import logging
+import secrets
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from studentDormitory import exports, pool
+from studentDormitory.models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+# Сколько потерянных задач каждого вида отдать пулу за одно восстановление
+RECOVERY_BATCH = 100
+
+WRITERS = {
+	"xlsx": exports.write_xlsx,
+	"docx": exports.write_docx,
+}
+
+
+def export_targets():
+	from studentDormitory.api import EXPORT_TARGETS
+	return EXPORT_TARGETS
+
+
+def claim(job_id=None):
+	"""
+	Забирает задачу из очереди. Переход `queued -> running` делается одним
+	UPDATE с условием на статус, поэтому одну задачу не возьмут двое.
+	"""
+	queued = ExportJob.objects.filter(status="queued")
+	if job_id is None:
+		job_id = queued.order_by("id").values_list("id", flat=True).first()
+		if job_id is None:
+			return None
+	if not queued.filter(id=job_id).update(status="running", started_at=timezone.now()):
+		return None
+	return job_id
+
+
+def requeue_stale():
+	"""Возвращает в очередь задачи, чей процесс, видимо, умер."""
+	deadline = timezone.now() - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT)
+	return ExportJob.objects.filter(status="running", started_at__lt=deadline).update(status="queued", started_at=None)
+
+
+_recovery_lock = threading.Lock()
+_recovered_at = None
+
+
+def recover(force=False):
+	"""
+	Для режима local: задачи и фото, которые никто не выполняет (пул или
+	веб-воркер умер до запуска или во время работы), снова отдаются пулу.
+	Воркер `run_export_worker` делает то же на каждом проходе. Вызывается
+	при старте веб-воркера и при работе с очередью, но не чаще раза в
+	EXPORT_RECOVERY_INTERVAL секунд на процесс. Повторная отправка
+	безопасна: задачу забирает только один условный UPDATE в `claim`.
+	"""
+	global _recovered_at
+	with _recovery_lock:
+		now = time.monotonic()
+		if not force and _recovered_at is not None and now - _recovered_at < settings.EXPORT_RECOVERY_INTERVAL:
+			return 0
+		_recovered_at = now
+
+	from studentDormitory import pictures
+
+	# Свежая задача ещё может ждать своего on_commit
+	grace = timezone.now() - timedelta(seconds=settings.EXPORT_RECOVERY_INTERVAL)
+	submitted = 0
+	if settings.EXPORT_JOBS_DISPATCH == "local":
+		requeue_stale()
+		orphans = ExportJob.objects.filter(status="queued", created_at__lt=grace).order_by("id").values_list("id", flat=True)
+		for job_id in orphans[:RECOVERY_BATCH]:
+			pool.submit("studentDormitory.jobs.claim_and_run", job_id)
+			submitted += 1
+	if settings.PICTURE_JOBS_DISPATCH == "local":
+		for label in pictures.MODELS:
+			for pk in pictures.orphans(label, grace)[:RECOVERY_BATCH]:
+				pool.submit("studentDormitory.pictures.claim_and_run", label, pk)
+				submitted += 1
+	if submitted:
+		logger.warning("Resubmitted %s lost background tasks", submitted)
+	return submitted
+
+
+def run_job(job_id):
+	job = ExportJob.objects.select_related("user").get(id=job_id)
+	jobs = ExportJob.objects.filter(id=job_id)
+	try:
+		viewset = export_targets()[job.target]
+		queryset = viewset.build_queryset(job.user, job.filters).order_by(*viewset.cursor_ordering)
+		jobs.update(total=queryset.count(), processed=0)
+
+		with tempfile.TemporaryFile() as file_stream:
+			WRITERS[job.format](
+				queryset,
+				viewset.export_columns,
+				viewset.export_title,
+				file_stream,
+				progress=lambda processed: jobs.update(processed=processed),
+			)
+			file_stream.seek(0)
+			# Имя не угадать по id задачи, даже если каталог окажется доступен
+			job.file.save(f"{viewset.export_name}_{job.id}_{secrets.token_hex(8)}.{job.format}", File(file_stream), save=False)
+	except Exception as error:
+		logger.exception("Export job %s failed", job_id)
+		jobs.update(status="failed", error=str(error), finished_at=timezone.now())
+		return
+
+	jobs.update(status="done", file=job.file.name, finished_at=timezone.now())
+
+
+def claim_and_run(job_id):
+	if claim(job_id) is not None:
+		run_job(job_id)
+
+
+def dispatch(job):
+	"""
+	При EXPORT_JOBS_DISPATCH=local задача сразу после коммита уходит в пул
+	процессов веб-воркера. Иначе её заберёт `manage.py run_export_worker`.
+	"""
+	if settings.EXPORT_JOBS_DISPATCH != "local":
+		return
+	transaction.on_commit(lambda: pool.submit("studentDormitory.jobs.claim_and_run", job.id))
+	transaction.on_commit(recover)
@@ -0,0 +1,135 @@
+import io
+import json
+import os
+import platform
+import tempfile
+from datetime import datetime, timezone
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.conf import settings
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+
+from studentDormitory import benchmarks
+from studentDormitory.api import EXPORT_TARGETS
+
+
+class Command(BaseCommand):
+    help = "Замеряет задержку, число SQL-запросов и память эндпоинтов на наборах данных разного размера"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,100000", help="Размеры наборов через запятую (строк студентов, дежурств и заявок)")
+        parser.add_argument("--repeat", type=int, default=20, help="Повторов на эндпоинт")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Процессов для generate_data")
+        parser.add_argument("--output", default="bench_results.json", help="Куда записать результаты")
+        parser.add_argument("--baseline", default=None, help="JSON прошлого прогона для сравнения")
+        parser.add_argument("--tolerance", type=float, default=0.25, help="Допустимый рост задержки и памяти, доля")
+        parser.add_argument("--cache", action="store_true", help="Оставить кэш ответов включённым (по умолчанию мерится путь через ORM)")
+        parser.add_argument("--concurrency", type=int, default=0, help="Потоков для смешанной нагрузки чтение/запись (0 - не мерить)")
+        parser.add_argument("--concurrent-requests", type=int, default=100, help="Запросов на поток в смешанной нагрузке")
+        parser.add_argument("--write-every", type=int, default=10, help="Каждый какой запрос смешанной нагрузки - запись")
+        parser.add_argument("--superuser", action="store_true", help="Мерить от суперпользователя (вся таблица), а не от владельца части строк")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",") if size.strip()]
+        results = {}
+
+        caches = dict(settings.CACHES)
+        if not options["cache"]:
+            caches[settings.RESPONSE_CACHE_ALIAS] = {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+
+        setup_test_environment()
+        try:
+            with override_settings(CACHES=caches):
+                for size in sizes:
+                    self.stdout.write(f"Набор {size} строк...")
+                    results[str(size)] = self.run_size(size, options)
+        finally:
+            teardown_test_environment()
+
+        report = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "db_profile": settings.DB_PROFILE,
+            "repeat": options["repeat"],
+            "cache": options["cache"],
+            "results": results,
+        }
+        with open(options["output"], "w", encoding="utf-8") as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        self.print_table(results)
+        self.stdout.write(f"Результаты записаны в {options['output']}")
+
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as baseline:
+                regressions = benchmarks.compare(results, json.load(baseline)["results"], options["tolerance"])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(regression)
+                raise CommandError(f"Ухудшений: {len(regressions)}")
+            self.stdout.write(self.style.SUCCESS("Ухудшений относительно базового прогона нет"))
+
+    def run_size(self, size, options):
+        # Каждый размер мерится на отдельной временной базе, рабочая не трогается
+        old_name = connection.settings_dict["NAME"]
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        old_test_name = test_settings.get("NAME")
+        if connection.vendor == "sqlite":
+            test_settings["NAME"] = os.path.join(tempfile.gettempdir(), f"bench_{size}.sqlite3")
+
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            call_command(
+                "generate_data",
+                seed=options["seed"],
+                workers=options["workers"],
+                users=10,
+                rooms=max(1, size // 4),
+                students=size,
+                staff=max(10, size // 100),
+                duties=size,
+                requests=size,
+                stdout=io.StringIO(),
+            )
+            if options["superuser"]:
+                user = User.objects.create_superuser("bench", "bench@example.com", "bench")
+            else:
+                user = User.objects.order_by("id").first()
+
+            client = APIClient()
+            client.force_login(user)
+            results = benchmarks.run(client, EXPORT_TARGETS, user, options["repeat"])
+
+            if options["concurrency"]:
+                clients = [APIClient() for _ in range(options["concurrency"])]
+                for concurrent_client in clients:
+                    concurrent_client.force_login(user)
+                results["concurrent.mixed"] = benchmarks.run_concurrent(
+                    clients, EXPORT_TARGETS, user, options["concurrent_requests"], options["write_every"]
+                )
+            return results
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            test_settings["NAME"] = old_test_name
+
+    def print_table(self, results):
+        self.stdout.write(f"{'size':>8} {'endpoint':<30} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'peak KB':>10}")
+        for size, endpoints in results.items():
+            for endpoint, metrics in endpoints.items():
+                if endpoint == "concurrent.mixed":
+                    continue
+                self.stdout.write(
+                    f"{size:>8} {endpoint:<30} {metrics['p50_ms']:>9} {metrics['p95_ms']:>9} {metrics['queries']:>8} {metrics['peak_kb']:>10}"
+                )
+        for size, endpoints in results.items():
+            mixed = endpoints.get("concurrent.mixed")
+            if mixed:
+                self.stdout.write(
+                    f"{size:>8} смешанная нагрузка, потоков {mixed['threads']}: {mixed['rps']} запросов/с, "
+                    f"p50 {mixed['p50_ms']} ms, p95 {mixed['p95_ms']} ms, ошибок {mixed['errors']}"
+                )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from studentDormitory import images, pictures
+
+
+class Command(BaseCommand):
+    help = "Обрабатывает фото без уменьшенных копий прямо в этом процессе (после очистки media или со сбоем)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Пересоздать все копии, даже существующие")
+
+    def handle(self, *args, **options):
+        for label, model in pictures.MODELS.items():
+            done = {"ready": 0, "failed": 0}
+            for instance in model.objects.exclude(picture="").exclude(picture=None).iterator(chunk_size=500):
+                storage = instance.picture.storage
+                if options["force"] and instance.picture_hash:
+                    for size in images.SIZES:
+                        for extension in images.FORMATS:
+                            storage.delete(images.variant_name(instance.picture_hash, size, extension))
+                elif instance.picture_status == "ready" and not images.missing(storage, instance.picture_hash):
+                    continue
+
+                pictures.requeue(instance)
+                pictures.claim_and_run(label, instance.pk)
+                status = model.objects.filter(pk=instance.pk).values_list("picture_status", flat=True).first()
+                if status in done:
+                    done[status] += 1
+            self.stdout.write(f"{label}: готово {done['ready']}, ошибок {done['failed']}")
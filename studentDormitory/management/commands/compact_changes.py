@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from studentDormitory import changes
+
+
+class Command(BaseCommand):
+    help = "Сжимает журнал изменений: по каждой строке остаётся только последняя запись"
+
+    def handle(self, *args, **options):
+        deleted = changes.compact()
+        self.stdout.write(self.style.SUCCESS(f"Удалено записей журнала: {deleted}"))
@@ -1,64 +1,120 @@
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand
-from faker import Faker
+from django.db import transaction
+
+from studentDormitory import fakedata
 from studentDormitory.models import Student, Room, DutySchedule, Staff, RepairRequests
-from django.contrib.auth.models import User
-from random import randint, choice
-from datetime import timedelta
-import random
+from studentDormitory.signals import post_bulk_create
+
 
 class Command(BaseCommand):
+    help = "Генерирует тестовые данные пачками, параллельно и воспроизводимо"
+
+    # Порядок важен: ссылки идут только на уже созданные строки
+    KINDS = ["users", "rooms", "students", "staff", "duties", "requests"]
+    DEFAULTS = {"users": 10, "rooms": 300, "students": 300, "staff": 50, "duties": 200, "requests": 300}
+
+    def add_arguments(self, parser):
+        for kind, default in self.DEFAULTS.items():
+            parser.add_argument(f"--{kind}", type=int, default=default, help=f"Сколько строк создать (по умолчанию {default})")
+        parser.add_argument("--seed", type=int, default=None, help="Seed для воспроизводимого набора данных")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Строк в одной порции генерации и bulk_create")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Процессов для Faker; 1 - без пула")
+        parser.add_argument("--end-date", type=date.fromisoformat, default=None, help="Последняя дата для дежурств и заявок (YYYY-MM-DD)")
+        parser.add_argument("--locale", default="ru_RU")
+
     def handle(self, *args, **options):
-        fake = Faker(['ru_RU'])
-
-        # Создание пользователей
-        users = []
-        for _ in range(10):
-            user = User.objects.create_user(username=fake.user_name(), password="password123")
-            users.append(user)
-
-        # Создание комнат
-        for _ in range(300):
-            Room.objects.create(number=fake.building_number(), user=random.choice(users))
-
-        # Создание студентов
-        rooms = Room.objects.all()
-        for _ in range(300):
-            Student.objects.create(
-                name=fake.name(),
-                group=f"ИСТБ-{randint(20, 30)}-{randint(1, 5)}",
-                room=random.choice(rooms),
-                user=random.choice(users)
-            )
-
-        # Создание персонала
-        for _ in range(50):
-            Staff.objects.create(
-                name=fake.name(),
-                post=fake.job(),
-                picture=None,
-                user=random.choice(users)
-            )
-
-        # Создание графика дежурств
-        students = Student.objects.all()
-        for _ in range(200):
-            DutySchedule.objects.create(
-                date=fake.date_between(start_date='-1y', end_date='today'),
-                student=random.choice(students),
-                user=random.choice(users)
-            )
-
-        # Создание заявок на ремонт
-        statuses = ['new', 'in_progress', 'completed', 'cancelled']
-        staff = Staff.objects.all()
-        for _ in range(300):
-            RepairRequests.objects.create(
-                date=fake.date_between(start_date='-1y', end_date='today'),
-                description=fake.text(),
-                status=random.choice(statuses),
-                room=random.choice(rooms),
-                staff=random.choice(staff),
-                user=random.choice(users)
-            )
+        seed = options["seed"]
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.stdout.write(f"seed={seed}")
+
+        generation = {
+            "locale": options["locale"],
+            "end_date": (options["end_date"] or date.today()).toordinal(),
+        }
+        self.ids = {}
+        self.password = make_password("password123")
+
+        executor = None
+        if options["workers"] > 1:
+            executor = ProcessPoolExecutor(max_workers=options["workers"], mp_context=multiprocessing.get_context("spawn"))
+
+        try:
+            for kind in self.KINDS:
+                started = time.monotonic()
+                refs = {name: len(ids) for name, ids in self.ids.items()}
+                tasks = self.tasks(kind, options[kind], options["batch_size"], seed, refs, generation)
+                chunks = executor.map(fakedata.generate, tasks) if executor else map(fakedata.generate, tasks)
+
+                self.ids[kind] = []
+                for rows in chunks:
+                    self.ids[kind].extend(self.insert(kind, rows))
+
+                self.stdout.write(f"{kind}: {len(self.ids[kind])} за {time.monotonic() - started:.1f} с")
+        finally:
+            if executor:
+                executor.shutdown()
 
         self.stdout.write(self.style.SUCCESS("Данные успешно сгенерированы!"))
+
+    def tasks(self, kind, total, batch_size, seed, refs, generation):
+        for index, start in enumerate(range(0, total, batch_size)):
+            count = min(batch_size, total - start)
+            yield kind, fakedata.chunk_seed(seed, kind, index), count, refs, generation
+
+    def ref(self, kind, index):
+        return None if index is None else self.ids[kind][index]
+
+    def insert(self, kind, rows):
+        if kind == "users":
+            # Пароль хэшируется один раз: PBKDF2 на каждого пользователя занял бы минуты
+            names = [f"{username}_{len(self.ids['users']) + i}" for i, (username,) in enumerate(rows)]
+            User.objects.bulk_create([User(username=name, password=self.password) for name in names], ignore_conflicts=True)
+            by_name = dict(User.objects.filter(username__in=names).values_list("username", "id"))
+            return [by_name[name] for name in names]
+
+        if kind == "rooms":
+            model = Room
+            instances = [Room(number=number, user_id=self.ref("users", user)) for number, user in rows]
+        elif kind == "students":
+            model = Student
+            instances = [
+                Student(name=name, group=group, room_id=self.ref("rooms", room), user_id=self.ref("users", user))
+                for name, group, room, user in rows
+            ]
+        elif kind == "staff":
+            model = Staff
+            instances = [Staff(name=name, post=post, picture=None, user_id=self.ref("users", user)) for name, post, user in rows]
+        elif kind == "duties":
+            model = DutySchedule
+            instances = [
+                DutySchedule(date=date.fromordinal(day), student_id=self.ref("students", student), user_id=self.ref("users", user))
+                for day, student, user in rows
+            ]
+        else:
+            model = RepairRequests
+            instances = [
+                RepairRequests(
+                    date=date.fromordinal(day),
+                    description=description,
+                    status=status,
+                    room_id=self.ref("rooms", room),
+                    staff_id=self.ref("staff", staff),
+                    user_id=self.ref("users", user),
+                )
+                for day, description, status, room, staff, user in rows
+            ]
+
+        with transaction.atomic():
+            model.objects.bulk_create(instances)
+            post_bulk_create.send(sender=model, instances=instances)
+        return [instance.id for instance in instances]
@@ -0,0 +1,29 @@
+import time
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = "Удаляет истёкшие сессии из базы небольшими пачками, не держа долгую блокировку"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--pause", type=float, default=0.05, help="Пауза между пачками, секунд: даёт пройти запросам сайта")
+
+    def handle(self, *args, **options):
+        if settings.SESSION_STRATEGY not in ("db", "cached_db"):
+            self.stdout.write(f"Сессии {settings.SESSION_STRATEGY} не хранятся в базе, чистить нечего")
+            return
+
+        now = timezone.now()
+        expired = Session.objects.filter(expire_date__lt=now)
+        total = 0
+        while True:
+            keys = list(expired.values_list("session_key", flat=True)[:options["batch_size"]])
+            if not keys:
+                break
+            total += Session.objects.filter(session_key__in=keys).delete()[0]
+            time.sleep(options["pause"])
+        self.stdout.write(self.style.SUCCESS(f"Удалено сессий: {total}"))
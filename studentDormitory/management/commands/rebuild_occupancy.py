@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from studentDormitory import occupancy
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает заселённость комнат с нуля или сверяет её со студентами"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verify", action="store_true", help="Только сравнить счётчики со студентами, ничего не меняя")
+
+    def handle(self, *args, **options):
+        if not options["verify"]:
+            fixed = occupancy.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Заселённость пересчитана, исправлено комнат: {fixed}"))
+            return
+
+        expected = occupancy.compute()
+        actual = occupancy.stored()
+        mismatches = 0
+        for pk in sorted(expected):
+            if expected[pk] != actual.get(pk):
+                mismatches += 1
+                self.stderr.write(f"room {pk}: ожидалось {expected[pk]}, сохранено {actual.get(pk)}")
+
+        if mismatches:
+            raise CommandError(f"Расхождений: {mismatches}")
+        self.stdout.write(self.style.SUCCESS("Заселённость в порядке"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from studentDormitory import search
+
+
+class Command(BaseCommand):
+    help = "Пересоздаёт триггеры и перестраивает полнотекстовые индексы (SQLite FTS5) по данным таблиц"
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            self.stdout.write(f"На {connection.vendor} поиск идёт без индекса, перестраивать нечего")
+            return
+
+        rebuilt = search.install(connection, rebuild=True)
+        search.optimize(connection)
+        self.stdout.write(self.style.SUCCESS(f"Индексы перестроены: {', '.join(rebuilt)}"))
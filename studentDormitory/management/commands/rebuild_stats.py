@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from studentDormitory import stats
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики /stats/ с нуля или сверяет их с таблицами"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verify", action="store_true", help="Только сравнить счётчики с данными, ничего не меняя")
+
+    def handle(self, *args, **options):
+        mismatches = 0
+        for model in stats.DIMENSIONS:
+            name = model._meta.model_name
+            if not options["verify"]:
+                counters = stats.rebuild(model)
+                self.stdout.write(f"{name}: {len(counters)} счётчиков")
+                continue
+
+            expected = stats.compute(model)
+            actual = stats.stored(model)
+            for key in sorted(set(expected) | set(actual), key=str):
+                if expected.get(key) != actual.get(key):
+                    mismatches += 1
+                    self.stderr.write(f"{name} {key}: ожидалось {expected.get(key)}, сохранено {actual.get(key)}")
+
+        if mismatches:
+            raise CommandError(f"Расхождений: {mismatches}")
+        self.stdout.write(self.style.SUCCESS("Счётчики в порядке" if options["verify"] else "Счётчики пересчитаны"))
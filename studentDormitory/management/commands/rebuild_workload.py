@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from studentDormitory import workload
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает нагрузку персонала (заявок new/in_progress) с нуля или сверяет её с заявками"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verify", action="store_true", help="Только сравнить счётчики с заявками, ничего не меняя")
+
+    def handle(self, *args, **options):
+        if not options["verify"]:
+            fixed = workload.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Нагрузка пересчитана, исправлено сотрудников: {fixed}"))
+            return
+
+        expected = workload.compute()
+        actual = workload.stored()
+        mismatches = 0
+        for pk in sorted(expected):
+            if expected[pk] != actual.get(pk):
+                mismatches += 1
+                self.stderr.write(f"staff {pk}: ожидалось {expected[pk]}, сохранено {actual.get(pk)}")
+
+        if mismatches:
+            raise CommandError(f"Расхождений: {mismatches}")
+        self.stdout.write(self.style.SUCCESS("Нагрузка в порядке"))
@@ -0,0 +1,45 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from studentDormitory import jobs, pictures, pool
+
+
+class Command(BaseCommand):
+    help = "Выполняет задачи выгрузки и обработку загруженных фото пулом процессов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=None, help="Размер пула, по умолчанию EXPORT_WORKER_PROCESSES")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Пауза между опросами очереди, секунд")
+        parser.add_argument("--once", action="store_true", help="Разобрать очередь и завершиться")
+
+    def handle(self, *args, **options):
+        capacity = options["processes"] or settings.EXPORT_WORKER_PROCESSES
+        executor = pool.get_pool(capacity)
+        running = set()
+
+        while True:
+            jobs.requeue_stale()
+            for future in [future for future in running if future.done()]:
+                running.discard(future)
+                if future.exception() is not None:
+                    self.stderr.write(f"Процесс пула упал: {future.exception()!r}")
+
+            while len(running) < capacity:
+                job_id = jobs.claim()
+                if job_id is None:
+                    break
+                self.stdout.write(f"Задача {job_id} запущена")
+                running.add(executor.submit(pool.run, "studentDormitory.jobs.run_job", job_id))
+
+            for label in pictures.MODELS:
+                while len(running) < capacity:
+                    claimed = pictures.claim(label)
+                    if claimed is None:
+                        break
+                    running.add(executor.submit(pool.run, "studentDormitory.pictures.process", label, *claimed))
+
+            if options["once"] and not running:
+                break
+            time.sleep(options["poll_interval"])
+
+        executor.shutdown()
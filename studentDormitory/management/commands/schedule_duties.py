@@ -0,0 +1,50 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from studentDormitory import rotation
+
+
+class Command(BaseCommand):
+    help = "Заполняет график дежурств на диапазон дат: в каждой комнате по одному дежурному в день, поровну между студентами"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", required=True, help="Первый день, ГГГГ-ММ-ДД")
+        parser.add_argument("--end", required=True, help="Последний день, ГГГГ-ММ-ДД")
+        parser.add_argument("--rooms", default="", help="Id комнат через запятую (по умолчанию все)")
+        parser.add_argument("--user", default=None, help="Только студенты этого пользователя (по умолчанию все)")
+        parser.add_argument("--dry-run", action="store_true", help="Показать график, ничего не записывая")
+
+    def handle(self, *args, **options):
+        try:
+            start, end = date.fromisoformat(options["start"]), date.fromisoformat(options["end"])
+            rooms = [int(room) for room in options["rooms"].split(",") if room.strip()]
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+            if user is None:
+                raise CommandError(f"Нет пользователя {options['user']}")
+        else:
+            # Без --user график строится для всех студентов, как у суперпользователя
+            user = User(is_superuser=True)
+
+        try:
+            report = rotation.schedule(user, start, end, rooms=rooms, dry_run=options["dry_run"])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        if options["dry_run"]:
+            self.stdout.write(f"{'date':<12} {'room':>8} {'student':>8}")
+            for row in report["preview"]:
+                self.stdout.write(f"{row['date']:<12} {row['room_id']:>8} {row['student_id']:>8}")
+            if report["created"] > len(report["preview"]):
+                self.stdout.write(f"... и ещё {report['created'] - len(report['preview'])}")
+
+        verb = "Будет создано" if options["dry_run"] else "Создано"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} дежурств: {report['created']} в {report['rooms']} комнатах, уже занято дней: {report['covered']}, "
+            f"дежурств на студента: {report['per_student']['min']}-{report['per_student']['max']}"
+        ))
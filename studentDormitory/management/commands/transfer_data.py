@@ -0,0 +1,81 @@
+from django.apps import apps
+from django.contrib.auth.models import Group, Permission, User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+
+
+def transferred_models():
+    models = [Group, User, User.groups.through, User.user_permissions.through, Group.permissions.through]
+    models += apps.get_app_config("studentDormitory").get_models(include_auto_created=True)
+    return models
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит пользователей и данные общежития из другой базы (обычно прежнего файла SQLite, "
+        "SOURCE_SQLITE_PATH) в базу default, например в PostgreSQL. Целевая база должна быть "
+        "после migrate и без данных. Сессии и журнал админки не переносятся."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default="source", help="Алиас базы-источника в DATABASES")
+        parser.add_argument("--target", default="default", help="Алиас базы, куда переносить")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        source, target = options["source"], options["target"]
+        if source not in connections.settings:
+            raise CommandError(f"Базы {source!r} нет в DATABASES: задайте SOURCE_SQLITE_PATH")
+        if source == target:
+            raise CommandError("Источник и цель совпадают")
+
+        models = transferred_models()
+        for model in models:
+            if model._base_manager.using(target).exists():
+                raise CommandError(f"В целевой базе уже есть строки {model._meta.label}")
+
+        permissions = self.permission_map(source, target)
+        # Внешние ключи Django создаёт отложенными, поэтому внутри одной
+        # транзакции порядок таблиц не важен
+        with transaction.atomic(using=target):
+            for model in models:
+                copied = self.copy(model, source, target, options["batch_size"], permissions)
+                self.stdout.write(f"{model._meta.label}: {copied}")
+
+            connection = connections[target]
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                    cursor.execute(sql)
+        self.stdout.write(self.style.SUCCESS("Перенос завершён"))
+
+    def permission_map(self, source, target):
+        # id прав и типов содержимого в базах разные - сопоставляются по имени
+        def keyed(alias):
+            rows = Permission.objects.using(alias).values_list(
+                "id", "content_type__app_label", "content_type__model", "codename"
+            )
+            return {tuple(key): pk for pk, *key in rows}
+
+        found = keyed(target)
+        return {pk: found.get(key) for key, pk in keyed(source).items()}
+
+    def copy(self, model, source, target, batch_size, permissions):
+        # Вычисляемые столбцы база заполняет сама
+        fields = [field for field in model._meta.concrete_fields if not field.generated]
+        rows = model._base_manager.using(source).order_by("pk")
+        last, copied = None, 0
+        while True:
+            batch = list((rows if last is None else rows.filter(pk__gt=last))[:batch_size])
+            if not batch:
+                return copied
+            last = batch[-1].pk
+
+            if any(field.attname == "permission_id" for field in fields):
+                for row in batch:
+                    row.permission_id = permissions.get(row.permission_id)
+                batch = [row for row in batch if row.permission_id is not None]
+
+            # raw=True, как у loaddata: auto_now не перезаписывает даты изменений
+            model._base_manager.using(target)._insert(batch, fields=fields, raw=True, using=target)
+            copied += len(batch)
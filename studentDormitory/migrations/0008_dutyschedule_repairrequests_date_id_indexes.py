@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studentDormitory', '0007_dutyschedule_user_repairrequests_user_room_user_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dutyschedule',
+            index=models.Index(fields=['date', 'id'], name='dutyschedule_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='repairrequests',
+            index=models.Index(fields=['date', 'id'], name='repairrequests_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studentDormitory', '0008_dutyschedule_repairrequests_date_id_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dutyschedule',
+            index=models.Index(fields=['user', 'date'], name='dutyschedule_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='repairrequests',
+            index=models.Index(fields=['user', 'date'], name='repairrequests_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='repairrequests',
+            index=models.Index(fields=['user', 'status'], name='repairrequests_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='repairrequests',
+            index=models.Index(fields=['status', 'date'], name='repairrequests_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['user', 'group'], name='student_user_group_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:07
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+
+def populate_counters(apps, schema_editor):
+    StatsCounter = apps.get_model('studentDormitory', 'StatsCounter')
+    dimensions = {
+        'student': {},
+        'room': {},
+        'staff': {},
+        'dutyschedule': {'month': TruncMonth('date')},
+        'repairrequests': {'status': F('status'), 'month': TruncMonth('date')},
+    }
+    counters = []
+    for name, parts in dimensions.items():
+        model = apps.get_model('studentDormitory', name)
+        for prefix, part in [('total', None)] + list(parts.items()):
+            group = {} if part is None else {'part': part}
+            rows = model.objects.values('user_id', **group).order_by().annotate(count=Count('id'), id_sum=Sum('id'))
+            for row in rows:
+                if part is None:
+                    key = 'total'
+                elif row['part'] is None:
+                    continue
+                else:
+                    key = f"{prefix}:{str(row['part'])[:7] if prefix == 'month' else row['part']}"
+                counters.append(StatsCounter(model=name, owner=row['user_id'] or 0, key=key, count=row['count'], id_sum=row['id_sum']))
+    StatsCounter.objects.bulk_create(counters, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studentDormitory', '0009_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50, verbose_name='Модель')),
+                ('owner', models.BigIntegerField(default=0, verbose_name='Id пользователя')),
+                ('key', models.CharField(max_length=50, verbose_name='Ключ')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Количество')),
+                ('id_sum', models.BigIntegerField(default=0, verbose_name='Сумма id')),
+            ],
+            options={
+                'verbose_name': 'Счётчик статистики',
+                'verbose_name_plural': 'Счётчики статистики',
+                'constraints': [models.UniqueConstraint(fields=('model', 'owner', 'key'), name='statscounter_model_owner_key_uniq')],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studentDormitory', '0010_statscounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target', models.CharField(max_length=50, verbose_name='Раздел')),
+                ('format', models.CharField(choices=[('xlsx', 'Excel'), ('docx', 'Word')], default='xlsx', max_length=10, verbose_name='Формат')),
+                ('filters', models.JSONField(blank=True, default=dict, verbose_name='Фильтры')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='queued', max_length=20, verbose_name='Статус')),
+                ('total', models.BigIntegerField(default=0, verbose_name='Всего строк')),
+                ('processed', models.BigIntegerField(default=0, verbose_name='Обработано строк')),
+                ('file', models.FileField(null=True, upload_to='exports', verbose_name='Файл')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('started_at', models.DateTimeField(null=True, verbose_name='Начато')),
+                ('finished_at', models.DateTimeField(null=True, verbose_name='Завершено')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задача выгрузки',
+                'verbose_name_plural': 'Задачи выгрузки',
+                'indexes': [models.Index(fields=['status', 'id'], name='exportjob_status_id_idx')],
+            },
+        ),
+    ]
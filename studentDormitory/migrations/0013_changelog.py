@@ -0,0 +1,29 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studentDormitory', '0012_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50, verbose_name='Модель')),
+                ('object_id', models.BigIntegerField(verbose_name='Id записи')),
+                ('owner', models.BigIntegerField(default=0, verbose_name='Id пользователя')),
+                ('action', models.CharField(choices=[('created', 'Создание'), ('updated', 'Изменение'), ('deleted', 'Удаление')], max_length=10, verbose_name='Действие')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время')),
+            ],
+            options={
+                'verbose_name': 'Изменение',
+                'verbose_name_plural': 'Журнал изменений',
+                'indexes': [models.Index(fields=['model', 'owner', 'id'], name='changelog_model_owner_id_idx'), models.Index(fields=['model', 'id'], name='changelog_model_id_idx'), models.Index(fields=['model', 'object_id', 'owner'], name='changelog_model_object_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studentDormitory', '0013_changelog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='staff',
+            name='picture_hash',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Хэш изображения'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='picture_hash',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Хэш изображения'),
+        ),
+    ]
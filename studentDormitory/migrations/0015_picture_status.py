@@ -0,0 +1,43 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:38
+
+from django.db import migrations, models
+
+
+def set_picture_status(apps, schema_editor):
+    # Фото с посчитанным хэшем уже обработаны, остальные ждут фонового воркера
+    for name in ("Student", "Staff"):
+        model = apps.get_model("studentDormitory", name)
+        with_picture = model.objects.exclude(picture="").exclude(picture=None)
+        with_picture.exclude(picture_hash="").update(picture_status="ready")
+        with_picture.filter(picture_hash="").update(picture_status="pending")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studentDormitory', '0014_picture_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='staff',
+            name='picture_claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Обработка начата'),
+        ),
+        migrations.AddField(
+            model_name='staff',
+            name='picture_status',
+            field=models.CharField(blank=True, choices=[('', 'Нет изображения'), ('pending', 'Обрабатывается'), ('ready', 'Готово'), ('failed', 'Ошибка')], default='', max_length=10, verbose_name='Обработка изображения'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='picture_claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Обработка начата'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='picture_status',
+            field=models.CharField(blank=True, choices=[('', 'Нет изображения'), ('pending', 'Обрабатывается'), ('ready', 'Готово'), ('failed', 'Ошибка')], default='', max_length=10, verbose_name='Обработка изображения'),
+        ),
+        migrations.RunPython(set_picture_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:23
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_open_requests(apps, schema_editor):
+    Staff = apps.get_model("studentDormitory", "Staff")
+    loads = Staff.objects.annotate(
+        load=Count("repairrequests", filter=Q(repairrequests__status__in=("new", "in_progress")))
+    ).filter(load__gt=0).values_list("id", "load")
+    for pk, load in loads:
+        Staff.objects.filter(pk=pk).update(open_requests=load)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studentDormitory', '0015_picture_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='staff',
+            name='open_requests',
+            field=models.PositiveIntegerField(default=0, verbose_name='Заявок в работе'),
+        ),
+        migrations.AddIndex(
+            model_name='staff',
+            index=models.Index(fields=['user', 'open_requests', 'id'], name='staff_user_load_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staff',
+            index=models.Index(fields=['user', 'post', 'open_requests', 'id'], name='staff_user_post_load_idx'),
+        ),
+        migrations.RunPython(count_open_requests, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:26
+
+import django.db.models.expressions
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Greatest
+
+
+def count_occupancy(apps, schema_editor):
+    # Уже заселённые сверх мест по умолчанию комнаты не становятся переполненными
+    Room = apps.get_model("studentDormitory", "Room")
+    rooms = Room.objects.annotate(students=Count("student")).filter(students__gt=0).values_list("id", "students")
+    for pk, students in rooms:
+        Room.objects.filter(pk=pk).update(occupancy=students, capacity=Greatest("capacity", students))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studentDormitory', '0016_staff_open_requests'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='capacity',
+            field=models.PositiveSmallIntegerField(default=4, verbose_name='Мест'),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='occupancy',
+            field=models.PositiveIntegerField(default=0, verbose_name='Занято мест'),
+        ),
+        migrations.RunPython(count_occupancy, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='room',
+            name='free_beds',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('capacity'), '-', models.F('occupancy')), output_field=models.IntegerField(), verbose_name='Свободно мест'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['free_beds', 'id'], name='room_free_beds_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['user', 'free_beds', 'id'], name='room_user_free_beds_idx'),
+        ),
+    ]
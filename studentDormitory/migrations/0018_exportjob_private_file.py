@@ -0,0 +1,38 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:43
+
+import os
+import secrets
+
+import studentDormitory.models
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def move_exports(apps, schema_editor):
+    # Готовые выгрузки уходят из публичного MEDIA_ROOT под случайными именами
+    ExportJob = apps.get_model("studentDormitory", "ExportJob")
+    private = studentDormitory.models.PrivateStorage()
+    for job in ExportJob.objects.exclude(file="").exclude(file=None):
+        if not default_storage.exists(job.file.name):
+            continue
+        stem, extension = os.path.splitext(os.path.basename(job.file.name))
+        with default_storage.open(job.file.name, "rb") as source:
+            name = private.save(f"exports/{stem}_{secrets.token_hex(8)}{extension}", source)
+        default_storage.delete(job.file.name)
+        ExportJob.objects.filter(pk=job.pk).update(file=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studentDormitory', '0017_room_capacity'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='file',
+            field=models.FileField(null=True, storage=studentDormitory.models.PrivateStorage(), upload_to='exports', verbose_name='Файл'),
+        ),
+        migrations.RunPython(move_exports, migrations.RunPython.noop),
+    ]
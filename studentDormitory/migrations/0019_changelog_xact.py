@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 21:05
+
+import studentDormitory.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('studentDormitory', '0018_exportjob_private_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='changelog',
+            name='xact',
+            field=models.BigIntegerField(db_default=studentDormitory.models.CurrentTransaction(), null=True, verbose_name='Транзакция'),
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['model', 'xact'], name='changelog_model_xact_idx'),
+        ),
+    ]
@@ -1,6 +1,109 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.db import models
 
-class Student(models.Model):
+
+class PrivateStorage(FileSystemStorage):
+	"""
+	Файлы в PRIVATE_MEDIA_ROOT: nginx их не раздаёт, публичного URL нет.
+	Каталог читается из настроек при каждом обращении.
+	"""
+
+	@property
+	def base_location(self):
+		return settings.PRIVATE_MEDIA_ROOT
+
+	@property
+	def location(self):
+		return os.path.abspath(self.base_location)
+
+	@property
+	def base_url(self):
+		return None
+
+
+class TrackedModel(models.Model):
+	"""
+	Запоминает значения полей на момент загрузки из базы или последнего
+	сохранения, чтобы обработчики сигналов могли посчитать разницу без
+	повторного SELECT. `updated_at` нужен для ETag/Last-Modified.
+	"""
+
+	updated_at = models.DateTimeField("Изменено", auto_now=True, db_index=True)
+
+	# Счётчики, которые меняются только приращениями в UPDATE: сохранение
+	# записи не должно перезаписать их значением, прочитанным раньше
+	counter_fields = ()
+
+	class Meta:
+		abstract = True
+
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		instance._loaded_values = dict(zip(field_names, values))
+		return instance
+
+	def save(self, *args, **kwargs):
+		if not self._state.adding and self.loaded_values() is None:
+			self._loaded_values = type(self).objects.filter(pk=self.pk).values(*self.current_values()).first()
+		if self.counter_fields and not self._state.adding and kwargs.get("update_fields") is None:
+			kwargs["update_fields"] = [
+				field.name for field in self._meta.concrete_fields
+				if not field.primary_key and not field.generated and field.name not in self.counter_fields
+			]
+		super().save(*args, **kwargs)
+		self._loaded_values = self.current_values()
+
+	def current_values(self):
+		deferred = self.get_deferred_fields()
+		return {
+			field.attname: getattr(self, field.attname)
+			for field in self._meta.concrete_fields
+			if field.attname not in deferred
+		}
+
+	def loaded_values(self):
+		return getattr(self, "_loaded_values", None)
+
+
+class PictureModel(TrackedModel):
+	"""
+	Модель с полем `picture`. Загруженный файл только сохраняется на диск,
+	а проверка, поворот по EXIF и уменьшенные копии делаются в фоне
+	(`studentDormitory.pictures`); до их окончания статус - `pending`.
+	По sha256 файла строятся имена копий (см. `studentDormitory.images`).
+	"""
+
+	PICTURE_STATUS_CHOICES = [
+		("", "Нет изображения"),
+		("pending", "Обрабатывается"),
+		("ready", "Готово"),
+		("failed", "Ошибка"),
+	]
+
+	picture_hash = models.CharField("Хэш изображения", max_length=64, blank=True, default="")
+	picture_status = models.CharField("Обработка изображения", max_length=10, choices=PICTURE_STATUS_CHOICES, blank=True, default="")
+	picture_claimed_at = models.DateTimeField("Обработка начата", null=True, blank=True)
+
+	class Meta:
+		abstract = True
+
+	def save(self, *args, **kwargs):
+		previous = self.loaded_values() or {}
+		if not self.picture:
+			self.picture_hash = ""
+			self.picture_status = ""
+		elif not self.picture._committed or self.picture != previous.get("picture"):
+			self.picture_hash = ""
+			self.picture_status = "pending"
+			self.picture_claimed_at = None
+		super().save(*args, **kwargs)
+
+
+class Student(PictureModel):
 	name = models.TextField("ФИО")
 	group = models.TextField("Группа", default="ИСТБ-22-2")
 	room = models.ForeignKey("Room", on_delete=models.CASCADE, null=True)
@@ -10,22 +113,41 @@ class Student(models.Model):
 	class Meta:
 		verbose_name = "Студент"
 		verbose_name_plural = "Студенты"
+		indexes = [
+			models.Index(fields=["user", "group"], name="student_user_group_idx"),
+		]
 
 	def __str__(self) -> str:
 		return self.name
 
-class Room(models.Model):
+class Room(TrackedModel):
 	number = models.TextField("Номер комнаты")
 	user = models.ForeignKey('auth.User', verbose_name="Пользователь", on_delete=models.CASCADE, null=True)
+	capacity = models.PositiveSmallIntegerField("Мест", default=4)
+	# Студенты в комнате, ведётся `studentDormitory.occupancy`
+	occupancy = models.PositiveIntegerField("Занято мест", default=0)
+	# Отрицательно, если в комнату записано больше студентов, чем мест
+	free_beds = models.GeneratedField(
+		verbose_name="Свободно мест",
+		expression=models.F("capacity") - models.F("occupancy"),
+		output_field=models.IntegerField(),
+		db_persist=True,
+	)
+
+	counter_fields = ("occupancy",)
 
 	class Meta:
 			verbose_name = "Комната"
 			verbose_name_plural = "Комнаты"
+			indexes = [
+				models.Index(fields=["free_beds", "id"], name="room_free_beds_idx"),
+				models.Index(fields=["user", "free_beds", "id"], name="room_user_free_beds_idx"),
+			]
 
 	def __str__(self) -> str:
 		return self.number
 
-class DutySchedule(models.Model):
+class DutySchedule(TrackedModel):
 	date = models.DateField("Дата")
 	student = models.ForeignKey("Student", on_delete=models.CASCADE, null=True)
 	user = models.ForeignKey('auth.User', verbose_name="Пользователь", on_delete=models.CASCADE, null=True)
@@ -33,21 +155,33 @@ class DutySchedule(models.Model):
 	class Meta:
 			verbose_name = "График дежурств"
 			verbose_name_plural = "График дежурств"
+			indexes = [
+				models.Index(fields=["date", "id"], name="dutyschedule_date_id_idx"),
+				models.Index(fields=["user", "date"], name="dutyschedule_user_date_idx"),
+			]
 
-class Staff(models.Model):
+class Staff(PictureModel):
 	name = models.TextField("ФИО")
 	post = models.TextField("Должность")
 	picture = models.ImageField("Изображение", null=True, upload_to="staff")
 	user = models.ForeignKey('auth.User', verbose_name="Пользователь", on_delete=models.CASCADE, null=True)
+	# Заявки в статусах new/in_progress, ведётся `studentDormitory.workload`
+	open_requests = models.PositiveIntegerField("Заявок в работе", default=0)
+
+	counter_fields = ("open_requests",)
 
 	class Meta:
 			verbose_name = "Персонал"
 			verbose_name_plural = "Персонал"
+			indexes = [
+				models.Index(fields=["user", "open_requests", "id"], name="staff_user_load_idx"),
+				models.Index(fields=["user", "post", "open_requests", "id"], name="staff_user_post_load_idx"),
+			]
 
 	def __str__(self) -> str:
 		return self.name
 
-class RepairRequests(models.Model):
+class RepairRequests(TrackedModel):
 	STATUS_CHOICES = [
         ("new", "Новая"),
         ("in_progress", "В процессе"),
@@ -65,3 +199,107 @@ class RepairRequests(models.Model):
 	class Meta:
 			verbose_name = "Заявка на ремонт"
 			verbose_name_plural = "Заявки на ремонт"
+			indexes = [
+				models.Index(fields=["date", "id"], name="repairrequests_date_id_idx"),
+				models.Index(fields=["user", "date"], name="repairrequests_user_date_idx"),
+				models.Index(fields=["user", "status"], name="repairrequests_user_status_idx"),
+				models.Index(fields=["status", "date"], name="repairrequests_status_date_idx"),
+			]
+
+
+class StatsCounter(models.Model):
+	"""
+	Счётчик для /stats/: количество записей и сумма их id в разрезе
+	модели, владельца и ключа (`total`, `status:new`, `month:2024-09`).
+	"""
+
+	model = models.CharField("Модель", max_length=50)
+	owner = models.BigIntegerField("Id пользователя", default=0)
+	key = models.CharField("Ключ", max_length=50)
+	count = models.BigIntegerField("Количество", default=0)
+	id_sum = models.BigIntegerField("Сумма id", default=0)
+
+	class Meta:
+			verbose_name = "Счётчик статистики"
+			verbose_name_plural = "Счётчики статистики"
+			constraints = [
+				models.UniqueConstraint(fields=["model", "owner", "key"], name="statscounter_model_owner_key_uniq"),
+			]
+
+class CurrentTransaction(models.Func):
+	"""
+	Номер текущей транзакции PostgreSQL (`pg_current_xact_id()`). На
+	SQLite запись и так идёт по одной транзакции за раз - там NULL.
+	"""
+
+	output_field = models.BigIntegerField()
+
+	def as_sql(self, compiler, connection, **extra_context):
+		return "NULL", []
+
+	def as_postgresql(self, compiler, connection, **extra_context):
+		return "(pg_current_xact_id()::text::bigint)", []
+
+
+class ChangeLog(models.Model):
+	"""
+	Журнал изменений для `/changes/?since=`: одна строка на вставку,
+	изменение или удаление. Растущий `id` служит токеном синхронизации,
+	`xact` - транзакция записи: на PostgreSQL id выдаются до коммита и
+	становятся видны не по порядку (см. `changes.read`).
+	"""
+
+	ACTION_CHOICES = [
+		("created", "Создание"),
+		("updated", "Изменение"),
+		("deleted", "Удаление"),
+	]
+
+	model = models.CharField("Модель", max_length=50)
+	object_id = models.BigIntegerField("Id записи")
+	owner = models.BigIntegerField("Id пользователя", default=0)
+	action = models.CharField("Действие", max_length=10, choices=ACTION_CHOICES)
+	created_at = models.DateTimeField("Время", auto_now_add=True)
+	xact = models.BigIntegerField("Транзакция", null=True, db_default=CurrentTransaction())
+
+	class Meta:
+			verbose_name = "Изменение"
+			verbose_name_plural = "Журнал изменений"
+			indexes = [
+				models.Index(fields=["model", "owner", "id"], name="changelog_model_owner_id_idx"),
+				models.Index(fields=["model", "id"], name="changelog_model_id_idx"),
+				models.Index(fields=["model", "object_id", "owner"], name="changelog_model_object_idx"),
+				models.Index(fields=["model", "xact"], name="changelog_model_xact_idx"),
+			]
+
+class ExportJob(models.Model):
+	STATUS_CHOICES = [
+		("queued", "В очереди"),
+		("running", "Выполняется"),
+		("done", "Готово"),
+		("failed", "Ошибка"),
+	]
+	FORMAT_CHOICES = [
+		("xlsx", "Excel"),
+		("docx", "Word"),
+	]
+
+	target = models.CharField("Раздел", max_length=50)
+	format = models.CharField("Формат", max_length=10, choices=FORMAT_CHOICES, default="xlsx")
+	filters = models.JSONField("Фильтры", default=dict, blank=True)
+	status = models.CharField("Статус", max_length=20, choices=STATUS_CHOICES, default="queued")
+	total = models.BigIntegerField("Всего строк", default=0)
+	processed = models.BigIntegerField("Обработано строк", default=0)
+	file = models.FileField("Файл", null=True, upload_to="exports", storage=PrivateStorage())
+	error = models.TextField("Ошибка", blank=True, default="")
+	created_at = models.DateTimeField("Создано", auto_now_add=True)
+	started_at = models.DateTimeField("Начато", null=True)
+	finished_at = models.DateTimeField("Завершено", null=True)
+	user = models.ForeignKey('auth.User', verbose_name="Пользователь", on_delete=models.CASCADE, null=True)
+
+	class Meta:
+			verbose_name = "Задача выгрузки"
+			verbose_name_plural = "Задачи выгрузки"
+			indexes = [
+				models.Index(fields=["status", "id"], name="exportjob_status_id_idx"),
+			]
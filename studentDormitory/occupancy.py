@@ -0,0 +1,127 @@
+"""
+Заселённость комнат.
+
+`Room.occupancy` - число студентов в комнате, `Room.free_beds` -
+вычисляемая базой разница `capacity - occupancy` с индексом, по которому
+`/api/rooms/available/` находит комнаты со свободными местами. Счётчик
+ведётся приращениями из обработчиков сигналов в той же транзакции, что и
+запись студента (как нагрузка в `workload`); `rebuild` пересчитывает его
+с нуля.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from studentDormitory import changes, response_cache
+from studentDormitory.models import Room
+
+
+def collect(rows, sign, deltas=None):
+	"""
+	Добавляет в `deltas` вклад строк студентов (словарей attname ->
+	значение) со знаком `sign`: +1 для вставки, -1 для удаления.
+	"""
+	if deltas is None:
+		deltas = defaultdict(int)
+	for values in rows:
+		if values.get("room_id"):
+			deltas[values["room_id"]] += sign
+	return deltas
+
+
+_pending = threading.local()
+
+
+@contextmanager
+def batch():
+	"""Как `stats.batch()`: приращения копятся и пишутся на выходе."""
+	if getattr(_pending, "deltas", None) is not None:
+		yield
+		return
+
+	_pending.deltas = defaultdict(int)
+	try:
+		yield
+		deltas, _pending.deltas = _pending.deltas, None
+		apply(deltas)
+	finally:
+		_pending.deltas = None
+
+
+def apply(deltas):
+	pending = getattr(_pending, "deltas", None)
+	if pending is not None:
+		for pk, delta in deltas.items():
+			pending[pk] += delta
+		return
+
+	by_delta = defaultdict(list)
+	for pk, delta in deltas.items():
+		if delta:
+			by_delta[delta].append(pk)
+	if not by_delta:
+		return
+
+	now = timezone.now()
+	for delta, pks in by_delta.items():
+		Room.objects.filter(id__in=pks).update(occupancy=F("occupancy") + delta, updated_at=now)
+	touched(Room.objects.filter(id__in=[pk for pks in by_delta.values() for pk in pks]))
+
+
+def touched(rooms):
+	"""
+	Комнаты изменились в обход save(): запись в журнал для `/changes/`,
+	версия кэша ответов их владельцев. Время изменения для ETag ставит
+	сам UPDATE.
+	"""
+	rows = list(rooms.values_list("id", "user_id"))
+	changes.record(Room, [(pk, owner, "updated") for pk, owner in rows])
+	response_cache.invalidate(Room, {owner for _, owner in rows})
+
+
+def record_saved(instance, created):
+	deltas = collect([instance.current_values()], 1)
+	previous = None if created else instance.loaded_values()
+	if previous:
+		collect([previous], -1, deltas)
+	apply(deltas)
+
+
+def record_deleted(instance):
+	apply(collect([instance.loaded_values() or instance.current_values()], -1))
+
+
+def record_bulk_created(instances):
+	apply(collect((instance.current_values() for instance in instances), 1))
+
+
+def record_bulk_updated(before, after):
+	apply(collect(before, -1, collect(after, 1)))
+
+
+def compute():
+	"""Заселённость по таблице студентов: {id комнаты: студентов}."""
+	return dict(Room.objects.annotate(students=Count("student")).values_list("id", "students"))
+
+
+def stored():
+	return dict(Room.objects.values_list("id", "occupancy"))
+
+
+def rebuild():
+	"""Пересчитывает счётчики с нуля. Возвращает число исправленных."""
+	with transaction.atomic():
+		actual = stored()
+		fixed = {pk: students for pk, students in compute().items() if actual.get(pk) != students}
+		by_count = defaultdict(list)
+		for pk, students in fixed.items():
+			by_count[students].append(pk)
+		for students, pks in by_count.items():
+			Room.objects.filter(id__in=pks).update(occupancy=students, updated_at=timezone.now())
+		if fixed:
+			touched(Room.objects.filter(id__in=fixed))
+	return len(fixed)
@@ -0,0 +1,171 @@
+import base64
+import binascii
+import json
+from datetime import date
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+	"""
+	Курсорная (keyset) пагинация по стабильному индексированному ключу.
+
+	Включается только если в запросе передан `cursor` или `page_size`,
+	иначе список отдаётся целиком, как раньше. Порядок задаётся атрибутом
+	вьюсета `cursor_ordering`, последним полем должен идти уникальный `id`.
+	Страница выбирается условием `WHERE (date, id) > (...)`, а не OFFSET,
+	поэтому её стоимость не зависит от глубины.
+	"""
+
+	cursor_query_param = "cursor"
+	page_size_query_param = "page_size"
+	page_size = 50
+	max_page_size = 1000
+	default_ordering = ("id",)
+	# Для выборок, которые целиком не отдаются никогда
+	paginate_always = False
+
+	def paginate_queryset(self, queryset, request, view=None):
+		queryset = self.page_queryset(queryset, request, view)
+		if queryset is None:
+			return None
+		return self.set_page(list(queryset))
+
+	def page_queryset(self, queryset, request, view=None):
+		"""
+		Запрос страницы с одной лишней строкой, по которой видно, есть ли
+		следующая, или None, если пагинация не запрошена. Асинхронные
+		представления читают его сами и отдают строки в `set_page`.
+		"""
+		params = request.query_params
+		if not self.paginate_always and self.cursor_query_param not in params and self.page_size_query_param not in params:
+			return None
+
+		self.request = request
+		self.page_size = self.get_page_size(request)
+		self.ordering = tuple(getattr(view, "cursor_ordering", self.default_ordering))
+		self.base_url = request.build_absolute_uri()
+
+		self.cursor_position, self.cursor_reverse = self.decode_cursor(request)
+
+		ordering = self.ordering
+		if self.cursor_reverse:
+			ordering = tuple(self._invert(field) for field in ordering)
+
+		queryset = queryset.order_by(*ordering)
+		if self.cursor_position is not None:
+			queryset = queryset.filter(self._seek(ordering, self.cursor_position))
+
+		return queryset[:self.page_size + 1]
+
+	def set_page(self, results):
+		has_more = len(results) > self.page_size
+		results = results[:self.page_size]
+
+		if self.cursor_reverse:
+			results.reverse()
+			self.has_next = True
+			self.has_previous = has_more
+		else:
+			self.has_next = has_more
+			self.has_previous = self.cursor_position is not None
+
+		self.page = results
+		return results
+
+	def get_page_data(self, data):
+		return {
+			"next": self.get_next_link(),
+			"previous": self.get_previous_link(),
+			"results": data,
+		}
+
+	def get_page_size(self, request):
+		try:
+			size = int(request.query_params[self.page_size_query_param])
+		except (KeyError, ValueError):
+			return self.page_size
+		if size <= 0:
+			return self.page_size
+		return min(size, self.max_page_size)
+
+	def get_paginated_response(self, data):
+		return Response(self.get_page_data(data))
+
+	def get_paginated_response_schema(self, schema):
+		return {
+			"type": "object",
+			"required": ["results"],
+			"properties": {
+				"next": {"type": "string", "nullable": True, "format": "uri"},
+				"previous": {"type": "string", "nullable": True, "format": "uri"},
+				"results": schema,
+			},
+		}
+
+	def get_next_link(self):
+		if not self.has_next or not self.page:
+			return None
+		return self.encode_cursor(self._position(self.page[-1]), reverse=False)
+
+	def get_previous_link(self):
+		if not self.has_previous:
+			return None
+		if not self.page:
+			return remove_query_param(self.base_url, self.cursor_query_param)
+		return self.encode_cursor(self._position(self.page[0]), reverse=True)
+
+	def encode_cursor(self, position, reverse):
+		return replace_query_param(self.base_url, self.cursor_query_param, self.make_cursor(position, reverse))
+
+	@staticmethod
+	def make_cursor(position, reverse=False):
+		payload = json.dumps({"p": position, "r": int(reverse)}, separators=(",", ":"))
+		return base64.urlsafe_b64encode(payload.encode()).decode()
+
+	def decode_cursor(self, request):
+		encoded = request.query_params.get(self.cursor_query_param)
+		if not encoded:
+			return None, False
+		try:
+			payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+			position = payload["p"]
+			reverse = bool(payload.get("r"))
+		except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError):
+			raise NotFound("Invalid cursor")
+		if not isinstance(position, list) or len(position) != len(self.ordering):
+			raise NotFound("Invalid cursor")
+		return position, reverse
+
+	def _position(self, instance):
+		return self.position(instance, self.ordering)
+
+	@staticmethod
+	def position(instance, ordering):
+		position = []
+		for field in ordering:
+			value = getattr(instance, field.lstrip("-"))
+			if isinstance(value, date):
+				value = value.isoformat()
+			position.append(value)
+		return position
+
+	@staticmethod
+	def _invert(field):
+		return field[1:] if field.startswith("-") else "-" + field
+
+	@staticmethod
+	def _seek(ordering, position):
+		# (a, b, c) > (x, y, z)  =>  a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+		condition = Q()
+		equal = {}
+		for field, value in zip(ordering, position):
+			name = field.lstrip("-")
+			lookup = "lt" if field.startswith("-") else "gt"
+			condition |= Q(**equal, **{f"{name}__{lookup}": value})
+			equal[name] = value
+		return condition
@@ -0,0 +1,197 @@
+"""
+Фоновая обработка загруженных фото: проверка файла, поворот по EXIF с
+удалением метаданных и уменьшенные копии. Запрос только пишет файл на
+диск и ставит статус `pending`, остальное делает пул процессов
+(PICTURE_JOBS_DISPATCH=local) или `manage.py run_export_worker`.
+"""
+import io
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from studentDormitory import images, jobs, pool
+from studentDormitory.models import Student, Staff
+from studentDormitory.signals import post_bulk_update
+
+MODELS = {"student": Student, "staff": Staff}
+
+# В каком формате пересохранять фото, с которого сняты EXIF
+SAVE_FORMATS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch(instance):
+	if settings.PICTURE_JOBS_DISPATCH != "local":
+		return
+	label = instance._meta.model_name
+	transaction.on_commit(lambda: pool.submit("studentDormitory.pictures.claim_and_run", label, instance.pk))
+	transaction.on_commit(jobs.recover)
+
+
+def _update(model, rows, changes):
+	"""
+	UPDATE с условием `rows`, о котором узнают счётчики, журнал изменений и
+	кэш ответов (через post_bulk_update). Возвращает, нашлась ли строка.
+	"""
+	attnames = [field.attname for field in model._meta.concrete_fields]
+	with transaction.atomic():
+		before = rows.values(*attnames).first()
+		if before is None:
+			return False
+		rows.update(**changes)
+		post_bulk_update.send(sender=model, before=[before], after=[{**before, **changes}])
+	return True
+
+
+def claimable(model, now):
+	# Зависшая обработка (процесс умер) через PICTURE_JOB_TIMEOUT секунд отдаётся заново
+	deadline = now - timedelta(seconds=settings.PICTURE_JOB_TIMEOUT)
+	return model.objects.filter(picture_status="pending").filter(
+		Q(picture_claimed_at=None) | Q(picture_claimed_at__lt=deadline)
+	)
+
+
+def claim(label, pk=None):
+	"""
+	Забирает фото в обработку одним условным UPDATE. Возвращает (id, метка
+	захвата) или None.
+	"""
+	model = MODELS[label]
+	now = timezone.now()
+	pending = claimable(model, now)
+	if pk is None:
+		pk = pending.order_by("id").values_list("id", flat=True).first()
+		if pk is None:
+			return None
+	if not pending.filter(id=pk).update(picture_claimed_at=now):
+		return None
+	return pk, now
+
+
+def orphans(label, older_than):
+	"""Фото, которые ждут обработки с момента раньше `older_than` - для `jobs.recover`."""
+	model = MODELS[label]
+	return claimable(model, timezone.now()).filter(updated_at__lt=older_than).order_by("id").values_list("id", flat=True)
+
+
+def normalize(picture):
+	"""
+	Проверяет, что файл - изображение, и снимает EXIF (геометки, модель
+	телефона), повернув картинку по ориентации. Возвращает новые байты и
+	расширение или None, если файл можно оставить как есть.
+	"""
+	with picture.open("rb"), Image.open(picture) as image:
+		image.verify()
+
+	with picture.open("rb"), Image.open(picture) as image:
+		if not image.getexif():
+			return None
+		image_format = image.format if image.format in SAVE_FORMATS else "PNG"
+		icc_profile = image.info.get("icc_profile")
+		image = ImageOps.exif_transpose(image)
+		if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+			image = image.convert("RGB")
+
+		buffer = io.BytesIO()
+		options = {"quality": 92} if image_format in ("JPEG", "WEBP") else {}
+		if icc_profile:
+			options["icc_profile"] = icc_profile
+		image.save(buffer, image_format, **options)
+	return buffer.getvalue(), SAVE_FORMATS[image_format]
+
+
+def process(label, pk, claimed_at):
+	model = MODELS[label]
+	instance = model.objects.filter(pk=pk).first()
+	if instance is None or not instance.picture:
+		return
+
+	picture = instance.picture
+	original = picture.name
+	storage = picture.storage
+	saved = None
+	changes = {"picture_claimed_at": None, "updated_at": timezone.now()}
+	try:
+		normalized = normalize(picture)
+		if normalized is not None:
+			data, extension = normalized
+			stem = os.path.splitext(os.path.basename(original))[0]
+			saved = storage.save(picture.field.generate_filename(instance, f"{stem}.{extension}"), ContentFile(data))
+			picture.name = saved
+
+		digest = images.content_hash(picture)
+		images.generate(picture, digest, images.missing(storage, digest))
+		changes.update(picture=picture.name, picture_hash=digest, picture_status="ready")
+	except Exception:
+		logger.exception("Cannot process picture of %s %s", label, pk)
+		changes.update(picture_status="failed")
+
+	# Пока шла обработка, фото могли заменить - тогда результат не нужен
+	rows = model.objects.filter(pk=pk, picture=original, picture_claimed_at=claimed_at)
+	applied = _update(model, rows, changes)
+	if saved is not None:
+		storage.delete(original if applied and "picture" in changes else saved)
+
+
+def claim_and_run(label, pk):
+	claimed = claim(label, pk)
+	if claimed is not None:
+		process(label, *claimed)
+
+
+def requeue(instance):
+	"""
+	Ставит готовое или неудавшееся фото на повторную обработку, например
+	если уменьшенные копии пропали с диска. Возвращает, поставилось ли.
+	"""
+	model = type(instance)
+	rows = model.objects.filter(pk=instance.pk, picture_status__in=("ready", "failed"))
+	changes = {"picture_status": "pending", "picture_claimed_at": None, "updated_at": timezone.now()}
+	return _update(model, rows, changes)
+
+
+def restore_variant(digest, size, extension):
+	"""
+	Ленивое восстановление варианта, которого нет на диске (очистили
+	каталог): ссылки сериализатор строит без проверки файлов, и сюда
+	приходит только промах. Варианты перестраиваются из исходного фото
+	с этим хэшем; если это не удалось, фото уходит на повторную обработку.
+	Возвращает имя файла или None.
+	"""
+	for model in MODELS.values():
+		instance = model.objects.filter(picture_hash=digest, picture_status="ready").exclude(picture="").first()
+		if instance is not None:
+			break
+	else:
+		return None
+
+	name = images.variant_name(digest, size, extension)
+	storage = instance.picture.storage
+	try:
+		images.generate(instance.picture, digest, images.missing(storage, digest))
+	except Exception:
+		logger.exception("Cannot restore picture variants of %s %s", instance._meta.model_name, instance.pk)
+		if requeue(instance):
+			dispatch(instance)
+		return None
+	return name if storage.exists(name) else None
+
+
+def on_saved(sender, instance, raw=False, **kwargs):
+	# Новый файл: модель уже выставила `pending`, осталось отдать его пулу
+	if not raw and instance.picture_status == "pending" and instance.picture_claimed_at is None:
+		dispatch(instance)
+
+
+for model in MODELS.values():
+	post_save.connect(on_saved, sender=model, dispatch_uid=f"studentDormitory.pictures.on_saved.{model._meta.model_name}")
+
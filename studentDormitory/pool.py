@@ -0,0 +1,44 @@
+"""
+Локальный пул процессов для фоновой работы.
+
+Модуль не импортирует Django на верхнем уровне: процессы запускаются
+через spawn и сначала должны выполнить `django.setup()`, а уже потом
+импортировать модели. Задачи передаются по пути к функции.
+"""
+import importlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def setup_worker():
+	os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
+	import django
+	django.setup()
+
+
+def run(path, *args):
+	module, name = path.rsplit(".", 1)
+	return getattr(importlib.import_module(module), name)(*args)
+
+
+def get_pool(max_workers=None):
+	global _pool
+	with _pool_lock:
+		if _pool is None:
+			from django.conf import settings
+
+			_pool = ProcessPoolExecutor(
+				max_workers=max_workers or settings.EXPORT_WORKER_PROCESSES,
+				mp_context=multiprocessing.get_context("spawn"),
+				initializer=setup_worker,
+			)
+	return _pool
+
+
+def submit(path, *args):
+	return get_pool().submit(run, path, *args)
@@ -0,0 +1,74 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from studentDormitory.eager import related_models
+
+ALL_OWNERS = "*"
+
+
+def backend():
+	return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _version_key(model, owner):
+	return f"ver:{model._meta.label_lower}:{owner}"
+
+
+def versions(model, serializer_class, user):
+	"""
+	Текущие версии, от которых зависит ответ. Обычный пользователь видит
+	только свои строки - берётся версия его среза, суперпользователь -
+	версия всей таблицы. Связанные строки могут принадлежать кому угодно,
+	поэтому для зависимостей всегда берётся версия всей таблицы.
+	"""
+	owner = ALL_OWNERS if user.is_superuser else (user.pk or 0)
+	keys = [_version_key(model, owner)]
+	keys += [_version_key(related, ALL_OWNERS) for related in related_models(serializer_class)]
+
+	cache = backend()
+	found = cache.get_many(keys)
+	for key in keys:
+		if key not in found:
+			# Версия вытеснена или ещё не заводилась: новое значение не
+			# совпадёт ни с одним из прежних, старые ответы не всплывут
+			cache.add(key, time.time_ns(), timeout=None)
+			found[key] = cache.get(key)
+	return [found[key] for key in keys]
+
+
+def response_key(model, serializer_class, user, url):
+	parts = [str(version) for version in versions(model, serializer_class, user)]
+	digest = hashlib.sha1(url.encode()).hexdigest()
+	return f"resp:{model._meta.label_lower}:{user.pk or 0}:{'.'.join(parts)}:{digest}"
+
+
+def load(key):
+	return backend().get(key)
+
+
+def store(key, data):
+	backend().set(key, data, timeout=settings.RESPONSE_CACHE_TIMEOUT)
+
+
+def bump(model, owners):
+	cache = backend()
+	for owner in {*owners, ALL_OWNERS}:
+		key = _version_key(model, owner)
+		try:
+			cache.incr(key)
+		except ValueError:
+			cache.set(key, time.time_ns(), timeout=None)
+
+
+def invalidate(model, owners):
+	"""
+	Сдвигает версии сразу и ещё раз после коммита: иначе запрос, успевший
+	прочитать старые строки до коммита, положил бы их под новую версию.
+	"""
+	owners = {owner or 0 for owner in owners}
+	bump(model, owners)
+	transaction.on_commit(lambda: bump(model, owners))
@@ -0,0 +1,116 @@
+"""
+Автоматический график дежурств: на каждый день диапазона в каждой
+комнате дежурит один её студент.
+
+Дни, на которые у комнаты уже есть дежурство, пропускаются. Внутри
+комнаты студенты лежат в куче по ключу (дежурств в диапазоне, дата
+последнего дежурства, id): следующим дежурит тот, у кого дежурств меньше
+всего, а при равенстве - тот, кто дежурил давнее. Готовый график пишется
+одним bulk_create.
+"""
+import heapq
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Q
+
+from studentDormitory.models import Student, DutySchedule
+from studentDormitory.signals import post_bulk_create
+
+MAX_DAYS = 366
+# Больше за раз не пишется: вставка, счётчики и журнал держат блокировку
+MAX_DUTIES = 200000
+PREVIEW_LIMIT = 500
+
+
+def days(start, end):
+	return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+def build(students, covered, history, start, end):
+	"""
+	Чистое планирование без базы. `students` - пары (id, id комнаты),
+	`covered` - множество (id комнаты, дата) с готовыми дежурствами,
+	`history` - {id студента: (дежурств в диапазоне, последняя дата)}.
+	Возвращает тройки (дата, id студента, id комнаты).
+	"""
+	heaps = defaultdict(list)
+	for pk, room_id in students:
+		count, last = history.get(pk, (0, None))
+		heaps[room_id].append((count, last.toordinal() if last else 0, pk))
+	for heap in heaps.values():
+		heapq.heapify(heap)
+
+	plan = []
+	rooms = sorted(heaps)
+	for day in days(start, end):
+		for room_id in rooms:
+			if (room_id, day) in covered:
+				continue
+			count, _, pk = heapq.heappop(heaps[room_id])
+			plan.append((day, pk, room_id))
+			heapq.heappush(heaps[room_id], (count + 1, day.toordinal(), pk))
+	return plan
+
+
+def schedule(user, start, end, rooms=None, dry_run=False):
+	"""
+	Строит график для студентов пользователя (суперпользователя - для всех)
+	с комнатой, при необходимости только для комнат `rooms`. Дежурство
+	принадлежит владельцу студента. Возвращает отчёт: сколько дежурств
+	создано (или было бы создано), сколько дней комнат уже занято, разброс
+	числа дежурств на студента и первые PREVIEW_LIMIT строк графика.
+	"""
+	if end < start:
+		raise ValueError("Дата окончания раньше даты начала")
+	if (end - start).days + 1 > MAX_DAYS:
+		raise ValueError(f"Не больше {MAX_DAYS} дней за раз")
+
+	queryset = Student.objects.filter(room__isnull=False)
+	if not user.is_superuser:
+		queryset = queryset.filter(user=user)
+	if rooms:
+		queryset = queryset.filter(room_id__in=rooms)
+
+	# Чтение занятых дней и запись - в одной транзакции: на SQLite она
+	# берёт блокировку записи сразу, и два запуска не задвоят график
+	with transaction.atomic():
+		students = list(queryset.order_by("id").values_list("id", "room_id", "user_id"))
+		owners = {pk: owner for pk, _, owner in students}
+
+		in_range = Q(dutyschedule__date__gte=start, dutyschedule__date__lte=end)
+		history = {
+			row["id"]: (row["taken"], row["last"])
+			for row in queryset.values("id").annotate(taken=Count("dutyschedule", filter=in_range), last=Max("dutyschedule__date"))
+		}
+		covered = set(
+			DutySchedule.objects
+			.filter(student__room_id__in=queryset.values("room_id"), date__gte=start, date__lte=end)
+			.values_list("student__room_id", "date")
+		)
+
+		plan = build([(pk, room_id) for pk, room_id, _ in students], covered, history, start, end)
+
+		if len(plan) > MAX_DUTIES and not dry_run:
+			raise ValueError(f"График на {len(plan)} дежурств, за раз не больше {MAX_DUTIES}: сократите диапазон или выберите комнаты")
+		if plan and not dry_run:
+			duties = [DutySchedule(date=day, student_id=pk, user_id=owners[pk]) for day, pk, _ in plan]
+			DutySchedule.objects.bulk_create(duties, batch_size=1000)
+			post_bulk_create.send(sender=DutySchedule, instances=duties)
+
+	counts = {pk: taken for pk, (taken, _) in history.items()}
+	for _, pk, _ in plan:
+		counts[pk] += 1
+
+	return {
+		"dry_run": dry_run,
+		"created": len(plan),
+		"rooms": len({room_id for _, room_id, _ in students}),
+		"covered": len(covered),
+		"per_student": {"min": min(counts.values(), default=0), "max": max(counts.values(), default=0)},
+		"preview": [
+			{"date": day.isoformat(), "student_id": pk, "room_id": room_id}
+			for day, pk, room_id in plan[:PREVIEW_LIMIT]
+		],
+	}
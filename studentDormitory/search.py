@@ -0,0 +1,170 @@
+"""
+Полнотекстовый поиск по описаниям заявок и ФИО студентов и персонала.
+
+На SQLite это таблицы FTS5 без собственного содержимого (`content=''`):
+rowid в индексе равен id строки, текст хранится только в таблице модели.
+Индекс обновляют триггеры на вставку, изменение и удаление, поэтому его
+не обходят ни bulk_create, ни `update()`, ни каскадные удаления. На
+других базах поиск идёт через `icontains` без ранжирования.
+"""
+import re
+
+from django.db import connection as default_connection
+from django.db.models import Q
+
+from studentDormitory.models import Student, Staff, RepairRequests
+
+# раздел API -> (модель, индексируемые поля)
+INDEXES = {
+	"students": (Student, ("name",)),
+	"staff": (Staff, ("name",)),
+	"repairRequests": (RepairRequests, ("description",)),
+}
+
+# Регистр и латинская диакритика не важны; префиксные индексы ускоряют
+# поиск по началу слова из 2-3 букв
+TOKENIZE = "unicode61 remove_diacritics 2"
+PREFIX = "2 3"
+
+MAX_TERMS = 8
+
+
+def index_table(model):
+	return f"{model._meta.db_table}_fts"
+
+
+def _normalized(expression):
+	# unicode61 снимает диакритику только с латиницы: ё приводится к е явно
+	return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _triggers(model, columns):
+	table, fts = model._meta.db_table, index_table(model)
+	names = ", ".join(columns)
+	new = ", ".join(_normalized(f"new.{column}") for column in columns)
+	old = ", ".join(_normalized(f"old.{column}") for column in columns)
+	insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});"
+	delete = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old});"
+	return {
+		f"{fts}_ai": f"AFTER INSERT ON {table} BEGIN {insert} END",
+		f"{fts}_ad": f"AFTER DELETE ON {table} BEGIN {delete} END",
+		f"{fts}_au": f"AFTER UPDATE OF {names} ON {table} BEGIN {delete} {insert} END",
+	}
+
+
+def install(connection=None, rebuild=False):
+	"""
+	Создаёт недостающие таблицы FTS5 и триггеры. Индекс, у которого чего-то
+	не хватало, перестраивается: SQLite-миграции пересоздают таблицу модели
+	при изменении схемы, и её триггеры пропадают. Вызывается после каждого
+	migrate. Возвращает разделы, индекс которых перестроен.
+	"""
+	connection = connection or default_connection
+	if connection.vendor != "sqlite":
+		return []
+
+	rebuilt = []
+	with connection.cursor() as cursor:
+		cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+		existing = {name for (name,) in cursor.fetchall()}
+		for section, (model, columns) in INDEXES.items():
+			fts, triggers = index_table(model), _triggers(model, columns)
+			if not rebuild and {fts, *triggers} <= existing:
+				continue
+
+			cursor.execute(
+				f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({', '.join(columns)}, "
+				f"content='', tokenize='{TOKENIZE}', prefix='{PREFIX}')"
+			)
+			for name, body in triggers.items():
+				cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+			cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('delete-all')")
+			cursor.execute(
+				f"INSERT INTO {fts}(rowid, {', '.join(columns)}) "
+				f"SELECT id, {', '.join(_normalized(column) for column in columns)} FROM {model._meta.db_table}"
+			)
+			rebuilt.append(section)
+	return rebuilt
+
+
+def optimize(connection=None):
+	"""Сливает сегменты индексов в один - после большой загрузки данных."""
+	connection = connection or default_connection
+	if connection.vendor != "sqlite":
+		return
+	with connection.cursor() as cursor:
+		for model, _ in INDEXES.values():
+			fts = index_table(model)
+			cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('optimize')")
+
+
+def on_post_migrate(sender, using, **kwargs):
+	from django.db import connections
+
+	install(connections[using])
+
+
+def terms(query):
+	words = re.findall(r"\w+", query)[:MAX_TERMS]
+	return [word.replace("ё", "е").replace("Ё", "Е") for word in words]
+
+
+def match_expression(words):
+	# Каждое слово в кавычках и по префиксу: операторы FTS5 из ввода не проходят
+	return " ".join(f'"{word}"*' for word in words)
+
+
+def _ranked(model, user, words, limit):
+	fts = index_table(model)
+	sql = (
+		f"SELECT {fts}.rowid, bm25({fts}) FROM {fts} "
+		f"JOIN {model._meta.db_table} AS item ON item.id = {fts}.rowid "
+		f"WHERE {fts} MATCH %s"
+	)
+	params = [match_expression(words)]
+	if not user.is_superuser:
+		sql += " AND item.user_id = %s"
+		params.append(user.pk)
+	sql += f" ORDER BY bm25({fts}), {fts}.rowid LIMIT %s"
+	params.append(limit)
+
+	with default_connection.cursor() as cursor:
+		cursor.execute(sql, params)
+		return cursor.fetchall()
+
+
+def _unranked(model, columns, user, words, limit):
+	rows = model.objects.all()
+	if not user.is_superuser:
+		rows = rows.filter(user=user)
+	for word in words:
+		condition = Q()
+		for column in columns:
+			condition |= Q(**{f"{column}__icontains": word})
+		rows = rows.filter(condition)
+	return [(pk, 0.0) for pk in rows.order_by("-id").values_list("id", flat=True)[:limit]]
+
+
+def search(query, user, sections, limit, offset=0):
+	"""
+	Находит строки разделов `sections`, где есть все слова запроса (по
+	началу слова). Возвращает страницу троек (раздел, id, ранг) - чем
+	больше ранг, тем выше в выдаче - и признак, есть ли следующая.
+	"""
+	words = terms(query)
+	if not words:
+		return [], False
+
+	hits = []
+	for section in sections:
+		model, columns = INDEXES[section]
+		if default_connection.vendor == "sqlite":
+			found = _ranked(model, user, words, offset + limit + 1)
+		else:
+			found = _unranked(model, columns, user, words, offset + limit + 1)
+		# bm25 тем меньше, чем лучше совпадение
+		hits += [(score, section, pk) for pk, score in found]
+
+	hits.sort()
+	page = hits[offset:offset + limit + 1]
+	return [(section, pk, -score) for score, section, pk in page[:limit]], len(page) > limit
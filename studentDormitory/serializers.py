@@ -1,19 +1,62 @@
+from django.urls import reverse
 from rest_framework import serializers
-from studentDormitory.models import Student, Room, DutySchedule, Staff, RepairRequests
+from studentDormitory.models import Student, Room, DutySchedule, Staff, RepairRequests, ExportJob
+from django.core.validators import validate_image_file_extension
+from studentDormitory import images, workload
 from datetime import datetime
 
+
+class BatchPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+	"""
+	При импорте связанные объекты подгружаются одним запросом на пачку и
+	кладутся в `context["related"][Model]`; тогда строка не делает свой
+	SELECT. Без контекста поле ведёт себя как обычный PrimaryKeyRelatedField.
+	"""
+
+	def to_internal_value(self, data):
+		related = self.context.get("related", {}).get(self.get_queryset().model)
+		if related is None:
+			return super().to_internal_value(data)
+		if isinstance(data, bool):
+			self.fail("incorrect_type", data_type=type(data).__name__)
+		try:
+			return related[int(data)]
+		except KeyError:
+			self.fail("does_not_exist", pk_value=data)
+		except (TypeError, ValueError):
+			self.fail("incorrect_type", data_type=type(data).__name__)
+
+class PictureVariantsMixin:
+	"""
+	Фото принимается как обычный файл: Pillow его не открывает, проверка
+	и уменьшенные копии делаются в фоне, ход виден в `picture_status`.
+	Ссылки на копии в WebP и JPEG для srcset - в `picture_variants`.
+	"""
+
+	def get_picture_variants(self, obj):
+		if obj.picture_status != "ready":
+			return None
+		return images.variants(obj.picture, obj.picture_hash, self.context.get("request"))
+
 class RoomSerializer(serializers.ModelSerializer):
 	def create(self, validated_data):
 		if 'request' in self.context:
 			validated_data['user'] = self.context['request'].user
 			
 		return super().create(validated_data)
+
+	def update(self, instance, validated_data):
+		instance = super().update(instance, validated_data)
+		# free_beds считает база, а счётчик occupancy мог измениться после чтения
+		instance.refresh_from_db(fields=["occupancy", "free_beds"])
+		return instance
 	
 	class Meta:
 		model = Room
-		fields = ["id", "number", "user"]
+		fields = ["id", "number", "capacity", "occupancy", "free_beds", "user"]
+		read_only_fields = ["occupancy", "free_beds"]
 
-class StudentSerializer(serializers.ModelSerializer):
+class StudentSerializer(PictureVariantsMixin, serializers.ModelSerializer):
 	def create(self, validated_data):
 		if 'request' in self.context:
 			validated_data['user'] = self.context['request'].user
@@ -21,11 +64,14 @@ class StudentSerializer(serializers.ModelSerializer):
 		return super().create(validated_data)
 	
 	room = RoomSerializer(read_only=True)
-	room_id = serializers.PrimaryKeyRelatedField(queryset=Room.objects.all(), write_only=True, source="room")
+	room_id = BatchPrimaryKeyRelatedField(queryset=Room.objects.all(), write_only=True, source="room")
+	picture = serializers.FileField(required=False, allow_null=True, validators=[validate_image_file_extension])
+	picture_variants = serializers.SerializerMethodField()
 
 	class Meta:
 			model = Student
-			fields = ["id", "name", "group", "room", "room_id", "picture", "user"]
+			fields = ["id", "name", "group", "room", "room_id", "picture", "picture_status", "picture_variants", "user"]
+			read_only_fields = ["picture_status"]
 
 
 class DutyScheduleSerializer(serializers.ModelSerializer):
@@ -36,36 +82,101 @@ class DutyScheduleSerializer(serializers.ModelSerializer):
 		return super().create(validated_data)
 	
 	student = StudentSerializer(read_only=True)
-	student_id = serializers.PrimaryKeyRelatedField(queryset=Student.objects.all(), write_only=True, source="student")
+	student_id = BatchPrimaryKeyRelatedField(queryset=Student.objects.all(), write_only=True, source="student")
 
 	class Meta:
 		model = DutySchedule
 		fields = ["id", "date", "student", "student_id", "user"]
 
-class StaffSerializer(serializers.ModelSerializer):
+class StaffSerializer(PictureVariantsMixin, serializers.ModelSerializer):
 	def create(self, validated_data):
 		if 'request' in self.context:
 			validated_data['user'] = self.context['request'].user
 			
 		return super().create(validated_data)
 	
+	picture = serializers.FileField(required=False, allow_null=True, validators=[validate_image_file_extension])
+	picture_variants = serializers.SerializerMethodField()
+
 	class Meta:
 		model = Staff
-		fields = ["id", "name", "post", "picture", "user"]
+		fields = ["id", "name", "post", "picture", "picture_status", "picture_variants", "user"]
+		read_only_fields = ["picture_status"]
 
 class RepairRequestsSerializer(serializers.ModelSerializer):
+	"""
+	Без `staff_id` новая заявка достаётся наименее загруженному сотруднику
+	(см. `workload`), с `staff_post` - среди сотрудников этой должности.
+	"""
+
 	def create(self, validated_data):
 		if 'request' in self.context:
 			validated_data['user'] = self.context['request'].user
+
+		post = validated_data.pop("staff_post", "")
+		if validated_data.get("staff") is None:
+			validated_data["staff"] = workload.pick(validated_data["user"].pk, post)
+			if validated_data["staff"] is None:
+				raise serializers.ValidationError({"staff_id": [no_staff_message(post)]})
 			
 		return super().create(validated_data)
+
+	def validate(self, attrs):
+		# Должность нужна только для выбора исполнителя новой заявки
+		if self.instance is not None or self.partial:
+			attrs.pop("staff_post", None)
+		return attrs
 	
 	room = RoomSerializer(read_only=True)
-	room_id = serializers.PrimaryKeyRelatedField(queryset=Room.objects.all(), write_only=True, source="room")
+	room_id = BatchPrimaryKeyRelatedField(queryset=Room.objects.all(), write_only=True, source="room")
 	staff = StaffSerializer(read_only=True)
-	staff_id = serializers.PrimaryKeyRelatedField(queryset=Staff.objects.all(), write_only=True, source="staff")
+	staff_id = BatchPrimaryKeyRelatedField(queryset=Staff.objects.all(), write_only=True, source="staff", required=False)
+	staff_post = serializers.CharField(write_only=True, required=False, allow_blank=True)
 	status_display = serializers.CharField(source='get_status_display', read_only=True)
 
 	class Meta:
 		model = RepairRequests
-		fields = ["id", "date", "description", "status", 'status_display', "room", "room_id", "staff", "staff_id", "user"]
\ No newline at end of file
+		fields = ["id", "date", "description", "status", 'status_display', "room", "room_id", "staff", "staff_id", "staff_post", "user"]
+
+def no_staff_message(post):
+	if post:
+		return f"Нет сотрудника с должностью «{post}», которому можно назначить заявку"
+	return "Нет сотрудника, которому можно назначить заявку"
+
+class ExportJobSerializer(serializers.ModelSerializer):
+	def create(self, validated_data):
+		if 'request' in self.context:
+			validated_data['user'] = self.context['request'].user
+			
+		return super().create(validated_data)
+
+	def validate_target(self, value):
+		from studentDormitory.jobs import export_targets
+
+		if value not in export_targets():
+			raise serializers.ValidationError("Неизвестный раздел")
+		return value
+
+	filters = serializers.DictField(child=serializers.CharField(allow_blank=True), required=False)
+	progress = serializers.SerializerMethodField()
+	# Файл лежит вне MEDIA_ROOT, отдаётся через `exportJobs/<id>/download/`
+	file = serializers.SerializerMethodField()
+
+	def get_file(self, job):
+		if job.status != "done" or not job.file:
+			return None
+		url = reverse("exportJobs-download", args=[job.pk])
+		request = self.context.get("request")
+		return request.build_absolute_uri(url) if request else url
+
+	def get_progress(self, job):
+		if job.status == "done":
+			return 100
+		if not job.total:
+			return 0
+		return min(99, job.processed * 100 // job.total)
+
+	class Meta:
+		model = ExportJob
+		fields = ["id", "target", "format", "filters", "status", "progress", "total", "processed", "file", "error", "created_at", "started_at", "finished_at", "user"]
+		read_only_fields = ["status", "total", "processed", "file", "error", "created_at", "started_at", "finished_at", "user"]
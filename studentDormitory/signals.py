@@ -0,0 +1,72 @@
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal
+
+from app import metrics
+from app.middlewares import forget_user
+from studentDormitory import stats, changes, response_cache, workload, occupancy
+from studentDormitory.models import Student, Room, DutySchedule, Staff, RepairRequests
+
+TRACKED_MODELS = (Student, Room, DutySchedule, Staff, RepairRequests)
+
+# bulk_create не шлёт post_save, поэтому массовые операции сообщают о себе сами
+post_bulk_create = Signal()  # sender=модель, instances=созданные объекты
+post_bulk_update = Signal()  # sender=модель, before/after=значения полей строк до и после UPDATE
+
+
+def on_saved(sender, instance, created, raw=False, **kwargs):
+	if raw:
+		return
+	stats.record_saved(instance, created)
+	changes.record_saved(instance, created)
+	if sender is RepairRequests:
+		workload.record_saved(instance, created)
+	elif sender is Student:
+		occupancy.record_saved(instance, created)
+	# Строка могла сменить владельца - устаревают оба среза
+	previous = instance.loaded_values() or {}
+	response_cache.invalidate(sender, {instance.user_id, previous.get("user_id", instance.user_id)})
+
+
+def on_deleted(sender, instance, **kwargs):
+	stats.record_deleted(instance)
+	changes.record_deleted(instance)
+	if sender is RepairRequests:
+		workload.record_deleted(instance)
+	elif sender is Student:
+		occupancy.record_deleted(instance)
+	response_cache.invalidate(sender, {instance.user_id})
+
+
+def on_bulk_created(sender, instances, **kwargs):
+	stats.record_bulk_created(sender, instances)
+	changes.record_bulk_created(sender, instances)
+	if sender is RepairRequests:
+		workload.record_bulk_created(instances)
+	elif sender is Student:
+		occupancy.record_bulk_created(instances)
+	response_cache.invalidate(sender, {instance.user_id for instance in instances})
+
+
+def on_bulk_updated(sender, before, after, **kwargs):
+	stats.record_bulk_updated(sender, before, after)
+	changes.record_bulk_updated(sender, before, after)
+	if sender is RepairRequests:
+		workload.record_bulk_updated(before, after)
+	elif sender is Student:
+		occupancy.record_bulk_updated(before, after)
+	response_cache.invalidate(sender, {values["user_id"] for values in before + after})
+
+
+for model in TRACKED_MODELS:
+	post_save.connect(on_saved, sender=model, dispatch_uid=f"studentDormitory.on_saved.{model._meta.model_name}")
+	post_delete.connect(on_deleted, sender=model, dispatch_uid=f"studentDormitory.on_deleted.{model._meta.model_name}")
+	post_bulk_create.connect(on_bulk_created, sender=model, dispatch_uid=f"studentDormitory.on_bulk_created.{model._meta.model_name}")
+	post_bulk_update.connect(on_bulk_updated, sender=model, dispatch_uid=f"studentDormitory.on_bulk_updated.{model._meta.model_name}")
+
+post_save.connect(forget_user, sender=get_user_model(), dispatch_uid="studentDormitory.forget_user.save")
+post_delete.connect(forget_user, sender=get_user_model(), dispatch_uid="studentDormitory.forget_user.delete")
+
+# Счётчик SQL для /api/metrics на соединениях всех потоков, включая sync_to_async
+connection_created.connect(metrics.watch, dispatch_uid="studentDormitory.metrics.watch")
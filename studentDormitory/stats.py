@@ -0,0 +1,199 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from studentDormitory.models import Student, Room, DutySchedule, Staff, RepairRequests, StatsCounter
+
+# Какие разрезы, кроме общего `total`, ведутся для модели
+DIMENSIONS = {
+	Student: (),
+	Room: (),
+	Staff: (),
+	DutySchedule: ("month",),
+	RepairRequests: ("status", "month"),
+}
+
+
+def counter_keys(model, values):
+	keys = ["total"]
+	for dimension in DIMENSIONS[model]:
+		if dimension == "status":
+			keys.append(f"status:{values['status']}")
+		elif dimension == "month" and values.get("date"):
+			keys.append(f"month:{str(values['date'])[:7]}")
+	return keys
+
+
+def collect(model, rows, sign, deltas=None):
+	"""
+	Добавляет в `deltas` вклад строк (словарей attname -> значение) со
+	знаком `sign`: +1 для вставки, -1 для удаления.
+	"""
+	if deltas is None:
+		deltas = defaultdict(lambda: [0, 0])
+	for values in rows:
+		owner = values.get("user_id") or 0
+		for key in counter_keys(model, values):
+			delta = deltas[(owner, key)]
+			delta[0] += sign
+			delta[1] += sign * values["id"]
+	return deltas
+
+
+_pending = threading.local()
+
+
+@contextmanager
+def batch():
+	"""
+	Внутри блока изменения счётчиков только копятся и пишутся одним
+	проходом на выходе. Нужно для массовых операций, где Django шлёт
+	post_delete на каждую удалённую (в том числе каскадом) строку.
+	"""
+	if getattr(_pending, "deltas", None) is not None:
+		yield
+		return
+
+	_pending.deltas = {}
+	try:
+		yield
+		deltas, _pending.deltas = _pending.deltas, None
+		for model, model_deltas in deltas.items():
+			apply(model, model_deltas)
+	finally:
+		_pending.deltas = None
+
+
+def apply(model, deltas):
+	pending = getattr(_pending, "deltas", None)
+	if pending is not None:
+		merged = pending.setdefault(model, defaultdict(lambda: [0, 0]))
+		for key, (count, id_sum) in deltas.items():
+			merged[key][0] += count
+			merged[key][1] += id_sum
+		return
+
+	label = model._meta.model_name
+	with transaction.atomic():
+		for (owner, key), (count, id_sum) in deltas.items():
+			if not count and not id_sum:
+				continue
+			counter = StatsCounter.objects.filter(model=label, owner=owner, key=key)
+			if counter.update(count=F("count") + count, id_sum=F("id_sum") + id_sum):
+				continue
+			try:
+				with transaction.atomic():
+					StatsCounter.objects.create(model=label, owner=owner, key=key, count=count, id_sum=id_sum)
+			except IntegrityError:
+				counter.update(count=F("count") + count, id_sum=F("id_sum") + id_sum)
+
+
+def record_saved(instance, created):
+	model = type(instance)
+	deltas = collect(model, [instance.current_values()], 1)
+	previous = None if created else instance.loaded_values()
+	if previous:
+		collect(model, [previous], -1, deltas)
+	apply(model, deltas)
+
+
+def record_deleted(instance):
+	model = type(instance)
+	values = instance.loaded_values() or instance.current_values()
+	apply(model, collect(model, [values], -1))
+
+
+def record_bulk_created(model, instances):
+	apply(model, collect(model, (instance.current_values() for instance in instances), 1))
+
+
+def record_bulk_updated(model, before, after):
+	deltas = collect(model, after, 1)
+	apply(model, collect(model, before, -1, deltas))
+
+
+def read(model, user):
+	"""
+	Собирает статистику из счётчиков. Для суперпользователя суммирует
+	строки всех владельцев, для остальных читает только свои.
+	"""
+	counters = StatsCounter.objects.filter(model=model._meta.model_name)
+	if not user.is_superuser:
+		counters = counters.filter(owner=user.id)
+
+	totals = defaultdict(lambda: [0, 0])
+	for key, count, id_sum in counters.values_list("key", "count", "id_sum"):
+		totals[key][0] += count
+		totals[key][1] += id_sum
+
+	count, id_sum = totals.pop("total", (0, 0))
+	stats = {
+		"count": count,
+		"avg": id_sum / count if count else None,
+	}
+
+	scoped = model.objects.all()
+	if not user.is_superuser:
+		scoped = scoped.filter(user=user)
+	ids = scoped.order_by("id").values_list("id", flat=True)
+	stats["min"] = ids.first() if count else None
+	stats["max"] = ids.last() if count else None
+
+	for dimension in DIMENSIONS[model]:
+		prefix = dimension + ":"
+		stats[f"by_{dimension}"] = {
+			key[len(prefix):]: value[0]
+			for key, value in sorted(totals.items())
+			if key.startswith(prefix) and value[0]
+		}
+	return stats
+
+
+def compute(model):
+	"""Считает счётчики заново группировкой в SQL."""
+	groupings = {"total": {}}
+	for dimension in DIMENSIONS[model]:
+		if dimension == "status":
+			groupings["status"] = {"part": F("status")}
+		elif dimension == "month":
+			groupings["month"] = {"part": TruncMonth("date")}
+
+	expected = {}
+	for prefix, part in groupings.items():
+		rows = (
+			model.objects
+			.values("user_id", **part)
+			.order_by()
+			.annotate(count=Count("id"), id_sum=Sum("id"))
+		)
+		for row in rows:
+			if prefix == "total":
+				key = "total"
+			elif row["part"] is None:
+				continue
+			else:
+				key = f"{prefix}:{str(row['part'])[:7] if prefix == 'month' else row['part']}"
+			expected[(row["user_id"] or 0, key)] = (row["count"], row["id_sum"])
+	return expected
+
+
+def stored(model):
+	counters = StatsCounter.objects.filter(model=model._meta.model_name).exclude(count=0)
+	return {(owner, key): (count, id_sum) for owner, key, count, id_sum in counters.values_list("owner", "key", "count", "id_sum")}
+
+
+def rebuild(model):
+	label = model._meta.model_name
+	expected = compute(model)
+	with transaction.atomic():
+		StatsCounter.objects.filter(model=label).delete()
+		StatsCounter.objects.bulk_create([
+			StatsCounter(model=label, owner=owner, key=key, count=count, id_sum=id_sum)
+			for (owner, key), (count, id_sum) in expected.items()
+		], batch_size=1000)
+	return expected
+
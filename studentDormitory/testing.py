@@ -0,0 +1,28 @@
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+@contextmanager
+def query_budget(limit, using="default"):
+	"""
+	Падает, если блок выполнил больше `limit` SQL-запросов.
+
+	В отличие от `assertNumQueries` проверяется верхняя граница, поэтому
+	бюджет можно задать один раз и проверять его на разном числе строк.
+	"""
+	with CaptureQueriesContext(connections[using]) as context:
+		yield context
+
+	executed = len(context.captured_queries)
+	if executed > limit:
+		queries = "\n".join(
+			f"{number}. {query['sql']}" for number, query in enumerate(context.captured_queries, start=1)
+		)
+		raise AssertionError(f"{executed} queries executed, budget is {limit}\n{queries}")
+
+
+class QueryBudgetMixin:
+	def assertQueryBudget(self, limit, using="default"):
+		return query_budget(limit, using)
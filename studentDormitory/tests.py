@@ -1,9 +1,36 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import tempfile
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.core.management.base import CommandError, SystemCheckError
 from rest_framework.test import APIClient
 from model_bakery import baker
+from openpyxl import Workbook, load_workbook
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth.models import User
-from datetime import datetime
-from studentDormitory.models import Student, Room, DutySchedule, Staff, RepairRequests
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.db import connection
+from collections import Counter
+from datetime import date, datetime, timezone
+from studentDormitory.models import Student, Room, DutySchedule, Staff, RepairRequests, StatsCounter, ExportJob, ChangeLog
+from studentDormitory import changes, checks, importers, jobs, benchmarks, response_cache, images, pictures, rotation, workload, occupancy
+from studentDormitory.serializers import StudentSerializer, DutyScheduleSerializer, RepairRequestsSerializer
+from studentDormitory.eager import plan_eager_loading
+from studentDormitory.testing import QueryBudgetMixin
+from django.conf import settings
+from app import metrics
+from app.middlewares import SignedTokenAuthentication
+from app.settings import database
+
+
+NO_RESPONSE_CACHE = {**settings.CACHES, "responses": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
 
 
 class StudentsViewsetTestCase(TestCase):
@@ -351,4 +378,1200 @@ class RepairRequestsViewsetTestCase(TestCase):
         assert data['status'] == "cancelled"
 
         req.refresh_from_db()
-        assert req.status == "cancelled"
\ No newline at end of file
+        assert req.status == "cancelled"
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+    def test_list_without_params_is_not_paginated(self):
+        baker.make("Room", 3, user=self.user)
+        r = self.client.get('/api/rooms/')
+        assert isinstance(r.json(), list)
+
+    def test_walk_forward_and_back(self):
+        rooms = baker.make("Room", 7, user=self.user)
+        ids = sorted(room.id for room in rooms)
+
+        r = self.client.get('/api/rooms/', {"page_size": 3})
+        page = r.json()
+        assert [i['id'] for i in page['results']] == ids[:3]
+        assert page['previous'] is None
+
+        page = self.client.get(page['next']).json()
+        assert [i['id'] for i in page['results']] == ids[3:6]
+
+        last = self.client.get(page['next']).json()
+        assert [i['id'] for i in last['results']] == ids[6:]
+        assert last['next'] is None
+
+        back = self.client.get(page['previous']).json()
+        assert [i['id'] for i in back['results']] == ids[:3]
+
+    def test_composite_ordering_by_date(self):
+        baker.make("DutySchedule", user=self.user, date="2024-09-02")
+        baker.make("DutySchedule", user=self.user, date="2024-09-01")
+        baker.make("DutySchedule", user=self.user, date="2024-09-02")
+
+        page = self.client.get('/api/dutySchedule/', {"page_size": 2}).json()
+        dates = [i['date'] for i in page['results']]
+        page = self.client.get(page['next']).json()
+        dates += [i['date'] for i in page['results']]
+
+        assert dates == ["2024-09-01", "2024-09-02", "2024-09-02"]
+        assert page['next'] is None
+
+    def test_invalid_cursor(self):
+        r = self.client.get('/api/rooms/', {"cursor": "garbage"})
+        assert r.status_code == 404
+
+
+class QueryFiltersTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+    def test_student_filters(self):
+        room = baker.make("Room", number="305", user=self.user)
+        match = baker.make("Student", name="Иван Petrov", group="ИСТб-22-2", room=room, user=self.user)
+        baker.make("Student", name="Иван Petrov", group="ИСТб-21-1", room=room, user=self.user)
+        baker.make("Student", name="Sidorov", group="ИСТб-22-2", room=room, user=self.user)
+
+        r = self.client.get('/api/students/', {"name": "petr", "group": "ИСТб-22-2", "room": "30"})
+        assert [i['id'] for i in r.json()] == [match.id]
+
+    def test_repair_requests_date_and_status(self):
+        baker.make("RepairRequests", date="2024-02-29", status="new", user=self.user)
+        baker.make("RepairRequests", date="2024-03-01", status="new", user=self.user)
+        baker.make("RepairRequests", date="2024-02-10", status="completed", user=self.user)
+
+        r = self.client.get('/api/repairRequests/', {"year": 2024, "month": 2})
+        assert len(r.json()) == 2
+
+        r = self.client.get('/api/repairRequests/', {"year": 2024, "month": 2, "status": "new"})
+        assert [i['date'] for i in r.json()] == ["2024-02-29"]
+
+        r = self.client.get('/api/repairRequests/', {"day": 1})
+        assert [i['date'] for i in r.json()] == ["2024-03-01"]
+
+    def test_duty_schedule_student_name(self):
+        student = baker.make("Student", name="Анна", user=self.user)
+        baker.make("DutySchedule", student=student, user=self.user)
+        baker.make("DutySchedule", user=self.user)
+
+        r = self.client.get('/api/dutySchedule/', {"student_name": "анн", "year": "2024x"})
+        assert r.status_code == 400
+
+
+# Бюджет проверяется на пути через ORM, а не на попадании в кэш ответов
+@override_settings(CACHES=NO_RESPONSE_CACHE)
+class QueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    # сессия + сама выборка, пользователь берётся из кэша
+    LIST_BUDGET = 2
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+    def assert_list_budget(self, url, make, related):
+        # отпечаток для ETag: агрегат по выборке + по запросу на вложенную модель
+        budget = self.LIST_BUDGET + 1 + related
+        for rows in (1, 20):
+            while len(self.client.get(url).json()) < rows:
+                make()
+            with self.assertQueryBudget(budget):
+                r = self.client.get(url)
+            assert len(r.json()) == rows
+
+    def make_student(self):
+        return baker.make("Student", room=baker.make("Room", user=self.user), user=self.user)
+
+    def test_students(self):
+        self.assert_list_budget('/api/students/', self.make_student, related=1)
+
+    def test_duty_schedule(self):
+        self.assert_list_budget(
+            '/api/dutySchedule/',
+            lambda: baker.make("DutySchedule", student=self.make_student(), user=self.user),
+            related=2,
+        )
+
+    def test_repair_requests(self):
+        self.assert_list_budget(
+            '/api/repairRequests/',
+            lambda: baker.make(
+                "RepairRequests",
+                room=baker.make("Room", user=self.user),
+                staff=baker.make("Staff", user=self.user),
+                user=self.user,
+            ),
+            related=2,
+        )
+
+    def test_plan(self):
+        assert plan_eager_loading(DutyScheduleSerializer) == (("student", "student__room"), ())
+        assert plan_eager_loading(RepairRequestsSerializer) == (("room", "staff"), ())
+
+
+class StatsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+    def test_counters_follow_writes(self):
+        other = User.objects.create_user(username='other', password='testpass')
+        baker.make("RepairRequests", user=other)
+        room = baker.make("Room", user=self.user)
+        staff = baker.make("Staff", user=self.user)
+
+        ids = []
+        for date in ("2024-09-01", "2024-09-20", "2024-10-05"):
+            r = self.client.post('/api/repairRequests/', {
+                "date": date, "description": "кран", "room_id": room.id, "staff_id": staff.id,
+            })
+            ids.append(r.json()['id'])
+        self.client.patch(f'/api/repairRequests/{ids[0]}/', {"status": "completed"})
+        self.client.delete(f'/api/repairRequests/{ids[1]}/')
+
+        data = self.client.get('/api/repairRequests/stats/').json()
+        assert data['count'] == 2
+        assert data['avg'] == (ids[0] + ids[2]) / 2
+        assert data['min'] == ids[0]
+        assert data['max'] == ids[2]
+        assert data['by_status'] == {"completed": 1, "new": 1}
+        assert data['by_month'] == {"2024-09": 1, "2024-10": 1}
+
+    def test_rebuild_and_verify(self):
+        baker.make("DutySchedule", 5, user=self.user)
+        StatsCounter.objects.all().delete()
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_stats", "--verify", stderr=io.StringIO())
+
+        call_command("rebuild_stats", stdout=io.StringIO())
+        call_command("rebuild_stats", "--verify", stdout=io.StringIO())
+        assert self.client.get('/api/dutySchedule/stats/').json()['count'] == 5
+
+    def test_anonymous_is_rejected(self):
+        for url in ('/api/students/stats/', '/api/students/', '/api/students/changes/'):
+            assert APIClient().get(url).status_code == 403
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+    def test_excel_is_scoped_to_user(self):
+        room = baker.make("Room", number="12", user=self.user)
+        student = baker.make("Student", name="Иванов", room=room, user=self.user)
+        baker.make("Student", user=User.objects.create_user(username='other', password='testpass'))
+
+        r = self.client.get('/api/students/export-excel/')
+        assert r.status_code == 200
+        rows = list(load_workbook(io.BytesIO(b"".join(r.streaming_content))).active.values)
+        assert rows == [("ID", "ФИО", "Группа", "Номер комнаты"), (student.id, "Иванов", student.group, "12")]
+
+    def test_every_model_exports(self):
+        baker.make("RepairRequests", user=self.user)
+        for url in ('/api/rooms/', '/api/dutySchedule/', '/api/staff/', '/api/repairRequests/'):
+            assert self.client.get(url + 'export-excel/').status_code == 200
+            assert self.client.get(url + 'export-word/').status_code == 200
+
+
+class ExportJobTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, PRIVATE_MEDIA_ROOT=media.name + "/private"))
+
+    def test_job_lifecycle(self):
+        baker.make("Staff", 3, post="Электрик", user=self.user)
+        baker.make("Staff", post="Сантехник", user=self.user)
+
+        r = self.client.post('/api/exportJobs/', {"target": "staff", "format": "xlsx", "filters": {"post": "Электрик"}}, format="json")
+        assert r.status_code == 201
+        job_id = r.json()['id']
+        assert r.json()['status'] == "queued"
+
+        assert jobs.claim() == job_id
+        assert jobs.claim(job_id) is None
+        jobs.run_job(job_id)
+
+        data = self.client.get(f'/api/exportJobs/{job_id}/').json()
+        assert data['status'] == "done"
+        assert data['progress'] == 100
+        assert data['total'] == 3
+        job = ExportJob.objects.get(id=job_id)
+        assert len(list(load_workbook(job.file.path).active.values)) == 4
+        assert not job.file.path.startswith(str(settings.MEDIA_ROOT) + "/exports")
+
+        download = self.client.get(data['file'])
+        assert download.status_code == 200
+        assert download['Content-Disposition'] == 'attachment; filename="staff.xlsx"'
+        assert len(list(load_workbook(io.BytesIO(b"".join(download.streaming_content))).active.values)) == 4
+
+        other = APIClient()
+        other.force_login(baker.make(User))
+        assert other.get(data['file']).status_code == 404
+
+    def test_recover_lost_tasks(self):
+        long_ago = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        lost = baker.make(ExportJob, target="staff", user=self.user)
+        stuck = baker.make(ExportJob, target="staff", status="running", started_at=long_ago, user=self.user)
+        fresh = baker.make(ExportJob, target="staff", user=self.user)
+        ExportJob.objects.filter(id__in=[lost.id, stuck.id]).update(created_at=long_ago)
+        staff = baker.make(Staff, user=self.user)
+        Staff.objects.filter(id=staff.id).update(picture="staff/lost.png", picture_status="pending", updated_at=long_ago)
+
+        with mock.patch("studentDormitory.pool.submit") as submit:
+            assert jobs.recover(force=True) == 3
+            # Повторный вызов в пределах интервала ничего не делает
+            assert jobs.recover() == 0
+        submitted = {call.args[1:] for call in submit.call_args_list}
+        assert submitted == {(lost.id,), (stuck.id,), ("staff", staff.id)}
+        assert fresh.id not in {args[0] for args in submitted}
+        assert ExportJob.objects.get(id=stuck.id).status == "queued"
+
+    def test_unknown_target(self):
+        r = self.client.post('/api/exportJobs/', {"target": "users", "format": "xlsx"}, format="json")
+        assert r.status_code == 400
+
+
+class ImportTestCase(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+    def upload(self, url, name, content, **extra):
+        upload = SimpleUploadedFile(name, content)
+        return self.client.post(url, {"file": upload, **extra}, format="multipart")
+
+    def test_csv_students(self):
+        rooms = baker.make("Room", 2, user=self.user)
+        lines = ["ФИО;Группа;ID комнаты"]
+        lines += [f"Студент {i};ИСТб-22-2;{rooms[i % 2].id}" for i in range(30)]
+        lines += ["Без комнаты;ИСТб-22-2;999999", ";ИСТб-22-2;"]
+        content = "\n".join(lines).encode()
+
+        # пачка: проверка комнат одним запросом и один INSERT, плюс сессия, счётчики,
+        # журнал изменений и заселённость комнат (с записью комнат в журнал)
+        with self.assertQueryBudget(16):
+            r = self.upload('/api/students/import/', "students.csv", content)
+        report = r.json()
+
+        assert report['created'] == 30
+        assert [e['row'] for e in report['errors']] == [32, 33]
+        assert 'room_id' in report['errors'][0]['errors']
+        assert Student.objects.filter(user=self.user, room=rooms[1]).count() == 15
+        assert self.client.get('/api/students/stats/').json()['count'] == 30
+
+    def test_xlsx_staff_dry_run(self):
+        workbook = Workbook()
+        workbook.active.append(["name", "post", "user"])
+        workbook.active.append(["Вася Пупкин", "Каменщик", 999])
+        stream = io.BytesIO()
+        workbook.save(stream)
+
+        r = self.upload('/api/staff/import/', "staff.xlsx", stream.getvalue(), dry_run="1")
+        assert r.json() == {"created": 1, "errors": [], "dry_run": True}
+        assert Staff.objects.count() == 0
+
+        r = self.upload('/api/staff/import/', "staff.xlsx", stream.getvalue())
+        assert Staff.objects.get().user == self.user
+
+        # Книга read-only держит файл, пока её не закроют
+        upload = SimpleUploadedFile("staff.xlsx", stream.getvalue())
+        with mock.patch.object(Workbook, "close", autospec=True, side_effect=Workbook.close) as close:
+            assert len(list(importers.read_rows(upload))) == 2
+        close.assert_called_once()
+
+    def test_unsupported_file(self):
+        r = self.upload('/api/rooms/import/', "rooms.txt", b"number\n101")
+        assert r.status_code == 400
+
+
+class BulkTestCase(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+    def test_bulk_create(self):
+        room = baker.make("Room", user=self.user)
+        items = [{"name": f"Студент {i}", "group": "ИСТб-22-2", "room_id": room.id} for i in range(50)]
+
+        # один INSERT в журнал изменений, один UPDATE заселённости и запись
+        # комнат в журнал на всю пачку
+        with self.assertQueryBudget(16):
+            r = self.client.post('/api/students/bulk/', items, format="json")
+        assert r.status_code == 201
+        assert len(r.json()) == 50
+        assert r.json()[0]['room']['id'] == room.id
+        assert Student.objects.filter(user=self.user).count() == 50
+
+        r = self.client.post('/api/students/bulk/', [{"name": "x", "room_id": 999999}], format="json")
+        assert r.status_code == 400
+
+    def test_bulk_update_groups_changes(self):
+        requests = baker.make("RepairRequests", 6, status="new", user=self.user)
+        items = [{"id": req.id, "status": "completed"} for req in requests[:4]]
+        items += [{"id": req.id, "status": "cancelled"} for req in requests[4:]]
+
+        r = self.client.patch('/api/repairRequests/bulk/', items, format="json")
+        assert r.json() == {"updated": 6}
+        assert RepairRequests.objects.filter(status="completed").count() == 4
+        stats = self.client.get('/api/repairRequests/stats/').json()
+        assert stats['by_status'] == {"cancelled": 2, "completed": 4}
+
+        r = self.client.patch('/api/repairRequests/bulk/', [{"id": requests[0].id, "status": "bogus"}], format="json")
+        assert r.status_code == 400
+
+    def test_bulk_update_rejects_duplicate_ids(self):
+        staff = baker.make("Staff", user=self.user)
+        req = baker.make("RepairRequests", status="new", staff=staff, user=self.user)
+        items = [{"id": req.id, "status": "completed"}, {"id": req.id, "status": "completed"}]
+
+        r = self.client.patch('/api/repairRequests/bulk/', items, format="json")
+        assert r.status_code == 400
+        assert r.json()["duplicates"] == [req.id]
+        req.refresh_from_db()
+        staff.refresh_from_db()
+        assert (req.status, staff.open_requests) == ("new", 1)
+
+    def test_bulk_respects_ownership(self):
+        other = User.objects.create_user(username='other', password='testpass')
+        foreign = baker.make("Room", user=other)
+        own = baker.make("Room", 3, user=self.user)
+
+        r = self.client.patch('/api/rooms/bulk/', [{"id": foreign.id, "number": "1"}], format="json")
+        assert r.status_code == 404
+
+        r = self.client.delete('/api/rooms/bulk/', {"ids": [foreign.id, own[0].id, 999999]}, format="json")
+        assert r.status_code == 404
+        assert r.json()["missing"] == sorted([foreign.id, 999999])
+        assert Room.objects.filter(id__in=[foreign.id, own[0].id]).count() == 2
+
+        r = self.client.delete('/api/rooms/bulk/', {"ids": [own[0].id, own[1].id]}, format="json")
+        assert r.json() == {"deleted": 2}
+        assert self.client.get('/api/rooms/stats/').json()['count'] == 1
+
+    def test_bulk_delete_cascades(self):
+        room = baker.make("Room", user=self.user)
+        baker.make("Student", 5, room=room, user=self.user)
+        self.client.delete('/api/rooms/bulk/', {"ids": [room.id]}, format="json")
+        assert self.client.get('/api/students/stats/').json()['count'] == 0
+        call_command("rebuild_stats", "--verify", stdout=io.StringIO())
+
+
+class GenerateDataTestCase(TestCase):
+    def generate(self, seed, **counts):
+        args = [f"--{kind}={count}" for kind, count in counts.items()]
+        call_command("generate_data", f"--seed={seed}", "--workers=1", "--batch-size=7", "--end-date=2024-12-31", *args, stdout=io.StringIO())
+
+    def snapshot(self):
+        return (
+            list(Student.objects.order_by("id").values_list("name", "group")),
+            list(RepairRequests.objects.order_by("id").values_list("date", "status", "description")),
+        )
+
+    def test_same_seed_same_data(self):
+        counts = dict(users=2, rooms=5, students=20, staff=3, duties=10, requests=15)
+        self.generate(42, **counts)
+        first = self.snapshot()
+        assert len(first[0]) == 20 and len(first[1]) == 15
+        assert not Student.objects.filter(room__isnull=True).exists()
+
+        Student.objects.all().delete()
+        RepairRequests.objects.all().delete()
+        self.generate(42, **counts)
+        assert self.snapshot() == first
+
+        call_command("rebuild_stats", "--verify", stdout=io.StringIO())
+
+
+class BenchmarkCompareTestCase(TestCase):
+    def test_percentile(self):
+        assert benchmarks.percentile([5, 1, 3, 2, 4], 0.5) == 3
+        assert benchmarks.percentile(list(range(1, 101)), 0.95) == 95
+
+    def test_compare(self):
+        baseline = {"1000": {"students.list": {"p50_ms": 10.0, "p95_ms": 12.0, "queries": 3, "peak_kb": 100.0}}}
+        current = {"1000": {"students.list": {"p50_ms": 11.0, "p95_ms": 30.0, "queries": 4, "peak_kb": 110.0}}}
+
+        regressions = benchmarks.compare(current, baseline, tolerance=0.25)
+        assert regressions == [
+            "1000 students.list p95_ms: 12.0 -> 30.0",
+            "1000 students.list queries: 3 -> 4",
+        ]
+        assert benchmarks.compare(current, {}, tolerance=0.25) == []
+
+    def test_compare_concurrent(self):
+        baseline = {"1000": {"concurrent.mixed": {"threads": 8, "rps": 100.0, "p50_ms": 50.0, "p95_ms": 90.0, "errors": 0}}}
+        current = {"1000": {"concurrent.mixed": {"threads": 8, "rps": 60.0, "p50_ms": 50.0, "p95_ms": 90.0, "errors": 2}}}
+
+        assert benchmarks.compare(current, baseline, tolerance=0.25) == [
+            "1000 concurrent.mixed rps: 100.0 -> 60.0",
+            "1000 concurrent.mixed errors: 0 -> 2",
+        ]
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        # Приращения от прошлых тестов уходят в прежнюю базу метрик
+        metrics.flush()
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(METRICS_DB=f"{directory}/metrics.sqlite3", METRICS_FLUSH_INTERVAL=0))
+        self.client = APIClient()
+        self.user = baker.make(User)
+
+    def test_metrics_per_route(self):
+        self.client.force_login(self.user)
+        room = baker.make(Room, user=self.user)
+        self.client.get("/api/rooms/")
+        self.client.get(f"/api/rooms/{room.pk}/")
+        self.client.get(f"/api/rooms/{room.pk}/")
+
+        response = self.client.get("/api/metrics/")
+        assert response.status_code == 403
+
+        self.user.is_superuser = True
+        self.user.save()
+        body = self.client.get("/api/metrics/").content.decode()
+        assert "# TYPE http_request_duration_seconds histogram" in body
+        assert 'http_requests_total{method="GET",route="rooms-detail",status="200"} 2' in body
+        assert 'http_request_duration_seconds_count{method="GET",route="rooms-list"} 1' in body
+        assert 'http_response_size_bytes_bucket{method="GET",route="rooms-detail",le="+Inf"} 2' in body
+        assert 'http_request_sql_queries_total{method="GET",route="rooms-list"}' in body
+
+        for verb in ("FOO", "BAR"):
+            assert self.client.generic(verb, "/api/rooms/").status_code == 405
+        body = self.client.get("/api/metrics/").content.decode()
+        assert 'http_requests_total{method="other",route="rooms-list",status="405"} 2' in body
+        assert "FOO" not in body
+
+    async def test_async_queries_are_counted(self):
+        # Под ASGI запросы к базе идут из потоков sync_to_async
+        await self.async_client.aforce_login(self.user)
+        await sync_to_async(baker.make)(Room, user=self.user)
+        assert (await self.async_client.get("/api/async/rooms/?page_size=10")).status_code == 200
+
+        body = await sync_to_async(metrics.render)()
+        queries = [line for line in body.splitlines() if line.startswith('http_request_sql_queries_total{method="GET",route="async-rooms-list"}')]
+        assert int(queries[0].split()[-1]) > 0
+
+
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        response_cache.backend().clear()
+        self.client = APIClient()
+        self.user = baker.make(User)
+        self.other = baker.make(User)
+        self.client.force_login(self.user)
+        self.room = baker.make(Room, number=101, user=self.user)
+        self.student = baker.make(Student, name="Иванов", room=self.room, user=self.user)
+
+    def test_hit_skips_queries(self):
+        first = self.client.get("/api/students/").json()
+        # остаётся только сессия, пользователь берётся из кэша
+        with self.assertNumQueries(1):
+            assert self.client.get("/api/students/").json() == first
+
+    def test_invalidated_by_writes(self):
+        self.client.get("/api/students/")
+        self.client.get(f"/api/students/{self.student.pk}/")
+
+        self.student.name = "Петров"
+        self.student.save()
+        assert self.client.get("/api/students/").json()[0]["name"] == "Петров"
+        assert self.client.get(f"/api/students/{self.student.pk}/").json()["name"] == "Петров"
+
+        # Комната вложена в ответ студента
+        self.room.number = 202
+        self.room.save()
+        assert self.client.get("/api/students/").json()[0]["room"]["number"] == "202"
+
+        self.client.post("/api/students/bulk/", [{"name": "Сидоров", "room_id": self.room.pk}], format="json")
+        assert len(self.client.get("/api/students/").json()) == 2
+
+    def test_other_user_writes_keep_cache(self):
+        self.client.get("/api/students/")
+        before = response_cache.versions(Student, StudentSerializer, self.user)
+        baker.make(Student, user=self.other)
+        assert response_cache.versions(Student, StudentSerializer, self.user) == before
+        assert response_cache.versions(Student, StudentSerializer, baker.make(User, is_superuser=True)) != before
+
+    def test_process_local_cache_rejected(self):
+        # Фоновая обработка в других процессах не сбросила бы версии locmem
+        with override_settings(DEBUG=False):
+            assert [e.id for e in checks.response_cache_shared(None)] == ["studentDormitory.E001"]
+            with self.assertRaises(SystemCheckError):
+                call_command("check")
+        with override_settings(DEBUG=False, CACHES=NO_RESPONSE_CACHE):
+            assert checks.response_cache_shared(None) == []
+
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        response_cache.backend().clear()
+        self.client = APIClient()
+        self.user = baker.make(User)
+        self.client.force_login(self.user)
+        self.room = baker.make(Room, number="101", user=self.user)
+        self.student = baker.make(Student, room=self.room, user=self.user)
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_list_not_modified(self):
+        response = self.client.get("/api/students/")
+        etag = response["ETag"]
+        assert response["Last-Modified"]
+
+        response = self.revalidate("/api/students/", etag)
+        assert response.status_code == 304
+        assert response.content == b""
+
+        # Изменение вложенной комнаты тоже меняет отпечаток
+        self.room.number = "102"
+        self.room.save()
+        response = self.revalidate("/api/students/", etag)
+        assert response.status_code == 200
+        etag = response["ETag"]
+
+        self.client.patch("/api/students/bulk/", [{"id": self.student.pk, "group": "ИСТБ-23-1"}], format="json")
+        assert self.revalidate("/api/students/", etag).status_code == 200
+
+    @override_settings(CACHES=NO_RESPONSE_CACHE)
+    def test_detail_without_response_cache(self):
+        url = f"/api/students/{self.student.pk}/"
+        etag = self.client.get(url)["ETag"]
+        # сессия и отпечаток (строка + вложенная комната)
+        with self.assertNumQueries(3):
+            assert self.revalidate(url, etag).status_code == 304
+
+        self.client.delete(url)
+        assert self.revalidate(url, etag).status_code == 404
+        assert self.client.get("/api/students/abc/").status_code == 404
+
+
+class ChangesTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = baker.make(User)
+        self.other = baker.make(User)
+        self.client.force_login(self.user)
+        self.room = baker.make(Room, number="101", user=self.user)
+        self.students = baker.make(Student, 3, room=self.room, user=self.user)
+
+    def sync(self, token=None):
+        url = "/api/students/changes/" + (f"?since={token}" if token is not None else "")
+        response = self.client.get(url)
+        assert response.status_code == 200
+        return response.json()
+
+    def test_delta_sync(self):
+        full = self.sync()
+        assert len(full["changed"]) == 3
+
+        delta = self.sync(full["token"])
+        assert delta["changed"] == [] and delta["deleted"] == []
+
+        first, second, third = self.students
+        first.name = "Петров"
+        first.save()
+        self.client.delete(f"/api/students/{second.pk}/")
+        # Владелец сменился - для прежнего это удаление
+        third.user = self.other
+        third.save()
+        created = self.client.post("/api/students/bulk/", [{"name": "Новый", "room_id": self.room.pk}], format="json").json()
+
+        delta = self.sync(full["token"])
+        assert [row["id"] for row in delta["changed"]] == [first.pk, created[0]["id"]]
+        assert delta["changed"][0]["name"] == "Петров"
+        assert delta["deleted"] == [second.pk, third.pk]
+
+        # Изменение вложенной комнаты отдаёт заново её студентов
+        self.room.number = "202"
+        self.room.save()
+        delta = self.sync(delta["token"])
+        assert {row["id"] for row in delta["changed"]} == {first.pk, created[0]["id"]}
+        assert delta["changed"][0]["room"]["number"] == "202"
+
+        assert self.client.get("/api/students/changes/?since=abc").status_code == 400
+        assert self.client.get("/api/students/changes/?since=1.").status_code == 400
+
+    def test_first_sync_is_paged(self):
+        first = self.client.get("/api/students/changes/?page_size=2").json()
+        assert [row["id"] for row in first["changed"]] == [student.pk for student in self.students[:2]]
+        assert first["more"] and first["token"] is None
+
+        # Изменение между страницами придёт по токену снимка
+        self.students[0].name = "Петров"
+        self.students[0].save()
+        last = self.client.get(first["next"]).json()
+        assert [row["id"] for row in last["changed"]] == [self.students[2].pk]
+        assert not last["more"] and last["next"] is None
+        delta = self.sync(last["token"])
+        assert [row["name"] for row in delta["changed"]] == ["Петров"]
+
+        assert self.client.get("/api/students/changes/?snapshot=abc").status_code == 400
+
+    def test_late_commit_is_not_skipped(self):
+        # PostgreSQL: транзакция взяла меньший id и закоммитила его после
+        # чтения с токеном `id.xmin`; записи старых транзакций не повторяются
+        first, second, _ = self.students
+        log = ChangeLog.objects.filter(model="student")
+        log.delete()
+        old = ChangeLog.objects.create(model="student", object_id=first.pk, owner=self.user.pk, action="updated")
+        late = ChangeLog.objects.create(model="student", object_id=second.pk, owner=self.user.pk, action="updated")
+        log.filter(pk=old.pk).update(xact=30)
+        log.filter(pk=late.pk).update(xact=50)
+
+        token = changes.parse_token(f"{late.pk}.40")
+        assert changes.format_token(token) == f"{late.pk}.40"
+        delta = changes.read(Student, StudentSerializer, self.user, token)
+        assert delta["ids"] == {second.pk}
+        assert changes.read(Student, StudentSerializer, self.user, (late.pk, None))["ids"] == set()
+
+    def test_compact_keeps_answers(self):
+        token = self.sync()["token"]
+        for name in ("А", "Б", "В"):
+            self.students[0].name = name
+            self.students[0].save()
+        self.students[1].delete()
+        before = self.sync(token)
+
+        call_command("compact_changes", stdout=io.StringIO())
+        assert self.sync(token) == before
+        assert ChangeLog.objects.filter(object_id=self.students[0].pk, model="student").count() == 1
+
+
+
+class PictureVariantsTestCase(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, PRIVATE_MEDIA_ROOT=media.name + "/private"))
+        response_cache.backend().clear()
+        self.client = APIClient()
+        self.user = baker.make(User)
+        self.client.force_login(self.user)
+
+    def upload(self, size=(2000, 1000), color="red", image_format="PNG", exif=None, name="photo.png"):
+        buffer = io.BytesIO()
+        options = {"exif": exif} if exif is not None else {}
+        Image.new("RGB", size, color).save(buffer, image_format, **options)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def test_upload_is_processed_in_background(self):
+        r = self.client.post("/api/students/", {"name": "Иванов", "room_id": baker.make(Room, user=self.user).pk, "picture": self.upload()})
+        assert r.status_code == 201
+        assert r.json()["picture_status"] == "pending"
+        assert r.json()["picture_variants"] is None
+        student = Student.objects.get(pk=r.json()["id"])
+        same = Staff.objects.create(name="Петров", post="Сантехник", picture=self.upload(), user=self.user)
+
+        pictures.claim_and_run("student", student.pk)
+        pictures.claim_and_run("staff", same.pk)
+        student.refresh_from_db()
+        same.refresh_from_db()
+        assert student.picture_status == "ready"
+        assert same.picture_hash == student.picture_hash
+
+        variants = self.client.get(f"/api/students/{student.pk}/").json()["picture_variants"]
+        assert set(variants) == {"thumb", "card", "full", "srcset"}
+        assert variants["card"]["webp"].endswith(f"{student.picture_hash}_card.webp")
+        assert variants["srcset"]["jpeg"].count("w, ") == 2
+
+        name = images.variant_name(student.picture_hash, "card", "webp")
+        with student.picture.storage.open(name) as file, Image.open(file) as card:
+            assert card.size == (320, 160)
+
+        # Чтение не трогает хранилище; пропавшую копию перестраивает запрос к ней
+        student.picture.storage.delete(name)
+        with mock.patch("django.core.files.storage.FileSystemStorage.exists") as exists:
+            assert self.client.get(f"/api/staff/{same.pk}/").json()["picture_status"] == "ready"
+        exists.assert_not_called()
+        response = self.client.get(variants["card"]["webp"])
+        assert response.status_code == 200 and "immutable" in response["Cache-Control"]
+        assert student.picture.storage.exists(name)
+        assert self.client.get(variants["card"]["webp"].replace(f"{student.picture_hash[:2]}/{student.picture_hash}", f"00/{'0' * 64}")).status_code == 404
+
+        student.picture.storage.delete(name)
+        call_command("build_picture_variants", stdout=io.StringIO())
+        assert student.picture.storage.exists(name)
+
+    def test_exif_is_stripped_and_applied(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # повёрнуто на 90 градусов
+        exif[0x010F] = "Phone"
+        student = Student.objects.create(name="Иванов", picture=self.upload(image_format="JPEG", exif=exif, name="p.jpg"), user=self.user)
+        original = student.picture.name
+
+        pictures.claim_and_run("student", student.pk)
+        student.refresh_from_db()
+        assert student.picture_status == "ready"
+        assert not student.picture.storage.exists(original)
+        with student.picture.open("rb"), Image.open(student.picture) as image:
+            assert image.size == (1000, 2000)
+            assert not image.getexif()
+
+    def test_broken_and_replaced(self):
+        broken = Student.objects.create(name="Иванов", picture=SimpleUploadedFile("p.png", b"not an image"), user=self.user)
+        pictures.claim_and_run("student", broken.pk)
+        broken.refresh_from_db()
+        assert broken.picture_status == "failed"
+
+        student = Student.objects.create(name="Петров", picture=self.upload(), user=self.user)
+        pk, claimed_at = pictures.claim("student", student.pk)
+        assert pictures.claim("student", student.pk) is None
+        # Фото заменили, пока шла обработка - её результат отбрасывается
+        student.picture = self.upload(color="blue")
+        student.save()
+        pictures.process("student", pk, claimed_at)
+        student.refresh_from_db()
+        assert student.picture_status == "pending"
+        assert student.picture_hash == ""
+
+    def test_no_picture(self):
+        student = baker.make(Student, user=self.user)
+        assert student.picture_status == ""
+        assert self.client.get(f"/api/students/{student.pk}/").json()["picture_variants"] is None
+
+
+class AsyncReadTestCase(TestCase):
+    def setUp(self):
+        response_cache.backend().clear()
+        self.user = baker.make(User)
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        room = baker.make(Room, user=self.user)
+        self.students = baker.make(Student, room=room, user=self.user, _quantity=5)
+        self.foreign = baker.make(Student, user=baker.make(User))
+
+    async def read(self, response):
+        assert response.status_code == 200
+        if response.streaming:
+            return json.loads(b"".join([chunk async for chunk in response.streaming_content]))
+        return json.loads(response.content)
+
+    async def test_list_streams_the_same_rows(self):
+        await self.async_client.aforce_login(self.user)
+        with mock.patch("studentDormitory.async_views.CHUNK_SIZE", 2):
+            data = await self.read(await self.async_client.get("/api/async/students/"))
+        expected = await sync_to_async(lambda: self.client.get("/api/students/").json())()
+        assert sorted(data, key=lambda row: row["id"]) == sorted(expected, key=lambda row: row["id"])
+        assert self.foreign.pk not in {row["id"] for row in data}
+
+    async def test_pagination_and_detail(self):
+        await self.async_client.aforce_login(self.user)
+        page = await self.read(await self.async_client.get("/api/async/students/?page_size=3"))
+        assert [row["id"] for row in page["results"]] == [student.pk for student in self.students[:3]]
+        rest = await self.read(await self.async_client.get(page["next"]))
+        assert [row["id"] for row in rest["results"]] == [student.pk for student in self.students[3:]]
+        assert rest["next"] is None
+
+        detail = await self.read(await self.async_client.get(f"/api/async/students/{self.students[0].pk}/"))
+        assert detail["room"]["id"] == self.students[0].room_id
+        assert (await self.async_client.get(f"/api/async/students/{self.foreign.pk}/")).status_code == 404
+
+    async def test_authentication(self):
+        assert (await self.async_client.get("/api/async/rooms/")).status_code == 403
+
+        token = SignedTokenAuthentication.issue_token(self.user)
+        response = await self.async_client.get("/api/async/rooms/?page_size=10", headers={"Authorization": f"Token {token}"})
+        assert len((await self.read(response))["results"]) == 1
+
+
+class ApiAuthenticationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="script", password="secret")
+        baker.make(Room, user=self.user)
+
+    def basic(self, password="secret"):
+        return "Basic " + base64.b64encode(f"script:{password}".encode()).decode()
+
+    def test_basic_verification_is_cached(self):
+        with mock.patch.object(User, "check_password", autospec=True, side_effect=User.check_password) as check:
+            for _ in range(3):
+                assert self.client.get("/api/rooms/", HTTP_AUTHORIZATION=self.basic()).status_code == 200
+            assert check.call_count == 1
+            assert self.client.get("/api/rooms/", HTTP_AUTHORIZATION=self.basic("wrong")).status_code in (401, 403)
+
+            # После смены пароля запомненная проверка не действует
+            self.user.set_password("changed")
+            self.user.save()
+            assert self.client.get("/api/rooms/", HTTP_AUTHORIZATION=self.basic()).status_code in (401, 403)
+            assert self.client.get("/api/rooms/", HTTP_AUTHORIZATION=self.basic("changed")).status_code == 200
+
+    def test_signed_token(self):
+        r = self.client.post("/api/user/token/", {"user": "script", "password": "secret"}, format="json")
+        token = r.json()["token"]
+
+        self.client.get("/api/rooms/", HTTP_AUTHORIZATION=f"Token {token}")
+        response_cache.backend().clear()
+        # без запросов за сессией и пользователем (он в кэше): только отпечаток и сама выборка
+        with self.assertNumQueries(2):
+            r = self.client.get("/api/rooms/", HTTP_AUTHORIZATION=f"Token {token}")
+        assert r.status_code == 200 and len(r.json()) == 1
+
+        r = self.client.post("/api/rooms/", {"number": "305"}, HTTP_AUTHORIZATION=f"Token {token}", format="json")
+        assert Room.objects.get(pk=r.json()["id"]).user == self.user
+
+        assert self.client.get("/api/rooms/", HTTP_AUTHORIZATION=f"Token {token}x").status_code in (401, 403)
+        with override_settings(API_TOKEN_MAX_AGE=-1):
+            assert self.client.get("/api/rooms/", HTTP_AUTHORIZATION=f"Token {token}").status_code in (401, 403)
+
+    def test_signed_token_follows_the_user(self):
+        self.user.is_superuser = True
+        self.user.save()
+        token = SignedTokenAuthentication.issue_token(self.user)
+        baker.make(Room, user=baker.make(User))
+        assert len(self.client.get("/api/rooms/", HTTP_AUTHORIZATION=f"Token {token}").json()) == 2
+
+        # Снятые права действуют сразу, а не по истечении токена
+        self.user.is_superuser = False
+        self.user.save()
+        assert len(self.client.get("/api/rooms/", HTTP_AUTHORIZATION=f"Token {token}").json()) == 1
+
+        self.user.is_active = False
+        self.user.save()
+        assert self.client.get("/api/rooms/", HTTP_AUTHORIZATION=f"Token {token}").status_code in (401, 403)
+
+        self.user.is_active = True
+        self.user.set_password("changed")
+        self.user.save()
+        assert self.client.get("/api/rooms/", HTTP_AUTHORIZATION=f"Token {token}").status_code in (401, 403)
+
+    def test_session_of_plain_model_backend(self):
+        # Сессия, открытая до CachedModelBackend, остаётся действительной
+        self.client.force_login(self.user, backend="django.contrib.auth.backends.ModelBackend")
+        assert self.client.get("/api/rooms/").status_code == 200
+
+
+class SessionStrategyTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        baker.make(Room, user=self.user)
+
+    @override_settings(SESSION_ENGINE="django.contrib.sessions.backends.cached_db", CACHES=NO_RESPONSE_CACHE)
+    def test_cached_db_without_auth_queries(self):
+        self.client.login(username="testuser", password="testpass")
+        self.client.get("/api/rooms/")
+        # только отпечаток для ETag и сама выборка
+        with self.assertNumQueries(2):
+            assert len(self.client.get("/api/rooms/").json()) == 1
+
+        # Деактивация пользователя сбрасывает его запись в кэше
+        self.user.is_active = False
+        self.user.save()
+        assert self.client.get("/api/user/info/").json()["is_authenticated"] is False
+
+    @override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+    def test_signed_cookies(self):
+        self.client.login(username="testuser", password="testpass")
+        assert self.client.get("/api/user/info/").json()["username"] == "testuser"
+
+    def test_purge_sessions(self):
+        for expiry in (-60, -60, -60, 3600):
+            store = SessionStore()
+            store.set_expiry(expiry)
+            store.save()
+        call_command("purge_sessions", "--batch-size=2", "--pause=0", stdout=io.StringIO())
+        assert Session.objects.count() == 1
+
+
+class DatabaseProfileTestCase(TestCase):
+    def test_sqlite_pragmas(self):
+        if settings.DB_PROFILE != "sqlite":
+            self.skipTest("тесты запущены не на профиле sqlite")
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            assert cursor.fetchone()[0] == 1  # NORMAL
+            cursor.execute("PRAGMA busy_timeout")
+            assert cursor.fetchone()[0] == int(settings.DATABASES["default"]["OPTIONS"]["timeout"] * 1000)
+        assert connection.transaction_mode == "IMMEDIATE"
+
+    def test_postgres_profile(self):
+        with mock.patch.dict("os.environ", {"POSTGRES_POOL": "True"}):
+            pooled = database("postgres")
+        assert pooled["CONN_MAX_AGE"] == 0
+        assert pooled["CONN_HEALTH_CHECKS"] is True
+        assert pooled["OPTIONS"]["pool"]["max_size"] == 10
+
+        with mock.patch.dict("os.environ", {"POSTGRES_POOL": "false"}):
+            persistent = database("postgres")
+        assert persistent["CONN_MAX_AGE"] > 0
+        assert persistent["OPTIONS"] == {}
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = baker.make(User)
+        self.client.force_login(self.user)
+        self.socket = baker.make(RepairRequests, description="Не работает розетка в 305", user=self.user)
+        self.sparks = baker.make(RepairRequests, description="Розетка искрит, розетка горячая", user=self.user)
+        self.tap = baker.make(RepairRequests, description="Сломан кран", user=self.user)
+        baker.make(RepairRequests, description="Чужая розетка", user=baker.make(User))
+        self.student = baker.make(Student, name="Пётр Иванов", user=self.user)
+
+    def find(self, query, **params):
+        response = self.client.get("/api/search/", {"q": query, **params})
+        assert response.status_code == 200
+        return response.json()
+
+    def test_ranked_and_scoped(self):
+        results = self.find("розет")["results"]
+        assert [(item["type"], item["id"]) for item in results] == [
+            ("repairRequests", self.sparks.pk),
+            ("repairRequests", self.socket.pk),
+        ]
+        assert results[0]["object"]["description"] == self.sparks.description
+
+        # Регистр, ё и начало слова не важны
+        assert [item["id"] for item in self.find("петр ИВ", types="students")["results"]] == [self.student.pk]
+
+    def test_triggers_follow_changes(self):
+        RepairRequests.objects.filter(pk=self.tap.pk).update(description="Течёт кран и розетка")
+        assert len(self.find("розетка")["results"]) == 3
+        assert self.find("сломан")["results"] == []
+
+        self.socket.delete()
+        assert {item["id"] for item in self.find("розетка")["results"]} == {self.sparks.pk, self.tap.pk}
+
+    def test_pagination(self):
+        page = self.find("розетка", page_size=1)
+        assert page["results"][0]["id"] == self.sparks.pk
+        rest = self.client.get(page["next"]).json()
+        assert [item["id"] for item in rest["results"]] == [self.socket.pk]
+        assert rest["next"] is None
+
+        assert self.client.get("/api/search/", {"q": "x", "types": "rooms"}).status_code == 400
+        assert APIClient().get("/api/search/", {"q": "x"}).status_code == 403
+
+    def test_rebuild_restores_missing_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER studentDormitory_repairrequests_fts_ai")
+        baker.make(RepairRequests, description="Перегорела лампа", user=self.user)
+        assert self.find("лампа")["results"] == []
+
+        call_command("rebuild_search", stdout=io.StringIO())
+        assert len(self.find("лампа")["results"]) == 1
+
+
+class RotationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = baker.make(User)
+        self.client.force_login(self.user)
+        self.room = baker.make(Room, user=self.user)
+        self.students = baker.make(Student, room=self.room, user=self.user, _quantity=3)
+        self.single = baker.make(Student, room=baker.make(Room, user=self.user), user=self.user)
+        baker.make(Student, room=baker.make(Room), user=baker.make(User))
+
+    def test_build_balances_and_skips_covered(self):
+        start, end = date(2024, 9, 1), date(2024, 9, 6)
+        plan = rotation.build([(1, 10), (2, 10), (3, 10), (4, 20)], {(10, date(2024, 9, 2))}, {3: (0, date(2024, 8, 31))}, start, end)
+
+        per_student = Counter(pk for _, pk, _ in plan)
+        assert per_student == {1: 2, 2: 2, 3: 1, 4: 6}
+        assert (date(2024, 9, 2), 1) not in {(day, pk) for day, pk, room in plan if room == 10}
+        # Дежуривший последним (3) идёт в очереди последним
+        assert [pk for day, pk, room in plan if room == 10][:3] == [1, 2, 3]
+
+    def test_rotate_action(self):
+        payload = {"start": "2024-09-01", "end": "2024-09-30"}
+        preview = self.client.post("/api/dutySchedule/rotate/", {**payload, "dry_run": True}, format="json")
+        assert preview.status_code == 200
+        assert preview.json()["created"] == 60 and len(preview.json()["preview"]) == 60
+        assert DutySchedule.objects.count() == 0
+
+        # Сессия, три чтения, одна вставка графика, счётчики /stats/ и журнал
+        # изменений - от числа дежурств не зависит
+        with self.assertNumQueries(18):
+            report = self.client.post("/api/dutySchedule/rotate/", payload, format="json").json()
+        assert report["created"] == 60
+        assert report["per_student"] == {"min": 10, "max": 30}
+        assert DutySchedule.objects.filter(user=self.user).count() == 60
+        assert StatsCounter.objects.filter(model="dutyschedule", key="total").get().count == 60
+
+        # Повторный запуск: все дни уже заняты
+        assert self.client.post("/api/dutySchedule/rotate/", payload, format="json").json()["created"] == 0
+        response = self.client.post("/api/dutySchedule/rotate/", {"start": "2024-09-02", "end": "2024-09-01"}, format="json")
+        assert response.status_code == 400
+
+    def test_command_dry_run(self):
+        output = io.StringIO()
+        call_command("schedule_duties", "--start=2024-09-01", "--end=2024-09-02", f"--rooms={self.room.pk}", "--dry-run", stdout=output)
+        assert "Будет создано дежурств: 2" in output.getvalue()
+        assert DutySchedule.objects.count() == 0
+
+
+class WorkloadTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = baker.make(User)
+        self.client.force_login(self.user)
+        self.room = baker.make(Room, user=self.user)
+        self.plumbers = baker.make(Staff, post="Сантехник", user=self.user, _quantity=2)
+        self.electrician = baker.make(Staff, post="Электрик", user=self.user)
+        baker.make(Staff, user=baker.make(User))
+
+    def loads(self):
+        return dict(Staff.objects.filter(user=self.user).values_list("id", "open_requests"))
+
+    def create(self, **extra):
+        payload = {"date": "2024-09-18", "description": "Течёт кран", "room_id": self.room.pk, **extra}
+        return self.client.post("/api/repairRequests/", payload, format="json")
+
+    def test_create_assigns_least_loaded(self):
+        first, second = self.plumbers
+        baker.make(RepairRequests, staff=first, status="in_progress", user=self.user)
+        baker.make(RepairRequests, staff=second, status="completed", user=self.user)
+
+        response = self.create(staff_post="Сантехник")
+        assert response.status_code == 201
+        assert response.json()["staff"]["id"] == second.pk
+        # Без должности - любой наименее загруженный
+        assert self.create().json()["staff"]["id"] == self.electrician.pk
+        assert self.loads() == {first.pk: 1, second.pk: 1, self.electrician.pk: 1}
+
+        # Завершение, смена исполнителя и удаление уменьшают нагрузку
+        request = RepairRequests.objects.get(pk=response.json()["id"])
+        self.client.patch(f"/api/repairRequests/{request.pk}/", {"staff_id": first.pk}, format="json")
+        assert self.loads()[first.pk] == 2 and self.loads()[second.pk] == 0
+        self.client.patch(f"/api/repairRequests/{request.pk}/", {"status": "completed"}, format="json")
+        assert self.loads()[first.pk] == 1
+        RepairRequests.objects.filter(staff=first).delete()
+        assert self.loads()[first.pk] == 0
+
+        # Карточка сотрудника не перезаписывает счётчик устаревшим значением
+        stale = Staff.objects.get(pk=self.electrician.pk)
+        self.create(staff_post="Электрик")
+        stale.name = "Другое имя"
+        stale.save()
+        assert self.loads()[self.electrician.pk] == 2
+
+        assert self.create(staff_post="Плотник").status_code == 400
+        assert workload.compute() == workload.stored()
+
+    def test_bulk_create_spreads_batch(self):
+        items = [{"date": "2024-09-18", "description": str(index), "room_id": self.room.pk, "staff_post": "Сантехник"} for index in range(5)]
+        response = self.client.post("/api/repairRequests/bulk/", items, format="json")
+        assert response.status_code == 201
+        assert sorted(self.loads().values()) == [0, 2, 3]
+        assert workload.compute() == workload.stored()
+
+        response = self.client.post("/api/repairRequests/bulk/", [{**items[0], "staff_post": "Плотник"}], format="json")
+        assert response.status_code == 400
+        assert RepairRequests.objects.count() == 5
+
+    def test_rebalance(self):
+        first, second = self.plumbers
+        baker.make(RepairRequests, staff=first, status="new", user=self.user, _quantity=6)
+        baker.make(RepairRequests, staff=second, status="in_progress", user=self.user)
+        baker.make(RepairRequests, staff=None, status="new", user=self.user)
+        workload.rebuild()
+
+        preview = self.client.post("/api/repairRequests/rebalance/", {"dry_run": True}, format="json").json()
+        assert preview["moved"] == 4 and preview["before"] == {"min": 0, "max": 6}
+        assert self.loads()[first.pk] == 6
+
+        report = self.client.post("/api/repairRequests/rebalance/", {}, format="json").json()
+        assert report["after"] == {"min": 2, "max": 3}
+        assert sorted(self.loads().values()) == [2, 3, 3]
+        assert workload.compute() == workload.stored()
+        call_command("rebuild_workload", "--verify", stdout=io.StringIO())
+
+        # Суперпользователь выравнивает очередь каждого владельца отдельно
+        other = baker.make(User)
+        foreign = baker.make(Staff, post="Сантехник", user=other)
+        baker.make(RepairRequests, staff=foreign, status="new", user=other, _quantity=4)
+        admin = baker.make(User, is_superuser=True)
+        self.client.force_login(admin)
+        assert self.client.post("/api/repairRequests/rebalance/", {}, format="json").json()["moved"] == 0
+        assert set(RepairRequests.objects.filter(user=other).values_list("staff_id", flat=True)) == {foreign.pk}
+        self.client.force_login(self.user)
+
+        ordered = self.client.get("/api/staff/workload/", {"post": "Сантехник"}).json()
+        assert [row["open_requests"] for row in ordered] == sorted(row["open_requests"] for row in ordered)
+        assert len(ordered) == 2
+
+
+class OccupancyTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = baker.make(User)
+        self.client.force_login(self.user)
+        self.small = baker.make(Room, number="101", capacity=2, user=self.user)
+        self.large = baker.make(Room, number="102", capacity=4, user=self.user)
+        baker.make(Room, capacity=4, user=baker.make(User))
+
+    def occupancy(self):
+        return dict(Room.objects.filter(user=self.user).values_list("number", "occupancy"))
+
+    def test_counter_follows_students(self):
+        token = self.client.get("/api/rooms/changes/").json()["token"]
+        response = self.client.post("/api/students/", {"name": "Иванов", "room_id": self.small.pk})
+        # Заселённость - изменение комнаты для дельта-синхронизации
+        delta = self.client.get("/api/rooms/changes/", {"since": token}).json()
+        assert [(row["id"], row["free_beds"]) for row in delta["changed"]] == [(self.small.pk, 1)]
+        student = Student.objects.get(pk=response.json()["id"])
+        baker.make(Student, room=self.small, user=self.user)
+        assert self.occupancy() == {"101": 2, "102": 0}
+
+        self.client.patch(f"/api/students/{student.pk}/", {"room_id": self.large.pk})
+        assert self.occupancy() == {"101": 1, "102": 1}
+        self.client.patch("/api/students/bulk/", [{"id": student.pk, "room_id": self.small.pk}], format="json")
+        assert self.occupancy() == {"101": 2, "102": 0}
+        self.client.delete(f"/api/students/{student.pk}/")
+        assert self.occupancy() == {"101": 1, "102": 0}
+
+        # Правка комнаты не перезаписывает счётчик; список отдаёт свежие места
+        room = self.client.put(f"/api/rooms/{self.small.pk}/", {"number": "101а", "capacity": 3}, format="json").json()
+        assert (room["occupancy"], room["free_beds"]) == (1, 2)
+        room = self.client.patch(f"/api/rooms/{self.small.pk}/", {"capacity": 5}, format="json").json()
+        assert room["free_beds"] == 4
+        room = self.client.get(f"/api/rooms/{self.small.pk}/").json()
+        assert (room["occupancy"], room["free_beds"]) == (1, 4)
+        assert occupancy.compute() == occupancy.stored()
+
+    def test_available(self):
+        baker.make(Student, room=self.small, user=self.user)
+        baker.make(Student, room=self.large, user=self.user, _quantity=2)
+
+        rooms = self.client.get("/api/rooms/available/").json()
+        # Сначала самые заполненные, только свои, всегда постранично
+        assert [row["number"] for row in rooms["results"]] == ["101", "102"]
+        assert [row["free_beds"] for row in rooms["results"]] == [1, 2]
+
+        rooms = self.client.get("/api/rooms/available/", {"beds": 2, "page_size": 1}).json()
+        assert [row["number"] for row in rooms["results"]] == ["102"]
+        assert rooms["next"] is None
+
+        assert self.client.get("/api/rooms/available/", {"beds": 0}).status_code == 400
+        if connection.vendor != "sqlite":
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "EXPLAIN QUERY PLAN " + str(Room.objects.filter(user=self.user, free_beds__gte=1).order_by("free_beds", "id").query)
+            )
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+        assert "room_user_free_beds_idx" in plan and "TEMP B-TREE" not in plan
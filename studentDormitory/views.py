@@ -1,5 +1,10 @@
 from typing import Any
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET
 from django.views.generic import TemplateView
+from studentDormitory import images, pictures
 from studentDormitory.models import Student
 
 class ShowStudentsDormitoryView(TemplateView):
@@ -10,4 +15,21 @@ class ShowStudentsDormitoryView(TemplateView):
 		context['students'] = Student.objects.all()
 
 		return context
-	
+
+
+@require_GET
+def picture_variant(request, prefix, digest, size, extension):
+	"""
+	Запасной путь за адресом варианта фото: nginx отдаёт файл сам и
+	приходит сюда, только если файла нет (см. `pictures.restore_variant`).
+	"""
+	if size not in images.SIZES or extension not in images.FORMATS or digest[:2] != prefix:
+		raise Http404
+	name = images.variant_name(digest, size, extension)
+	if not default_storage.exists(name):
+		name = pictures.restore_variant(digest, size, extension)
+		if name is None:
+			raise Http404
+	response = FileResponse(default_storage.open(name, "rb"))
+	patch_cache_control(response, public=True, max_age=30 * 24 * 3600, immutable=True)
+	return response
@@ -0,0 +1,402 @@
+import json
+import tempfile
+from collections import defaultdict
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.http import FileResponse, Http404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.viewsets import GenericViewSet
+from rest_framework import mixins, serializers
+from rest_framework.response import Response
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.parsers import MultiPartParser, FormParser
+from app.middlewares import CsrfExemptSessionAuthentication, SignedTokenAuthentication, CachedBasicAuthentication
+from studentDormitory.pagination import KeysetPagination
+from studentDormitory.filters import apply_filters
+from studentDormitory.eager import eager_load
+from studentDormitory import stats, changes, exports, importers, response_cache, conditional, workload, occupancy
+from studentDormitory.signals import post_bulk_create, post_bulk_update
+
+
+class ChangesPagination(KeysetPagination):
+	# Первая синхронизация - вся таблица пользователя, только постранично
+	paginate_always = True
+	page_size = changes.PAGE_SIZE
+	max_page_size = changes.PAGE_SIZE
+
+
+class DormitoryViewset(
+	mixins.CreateModelMixin,
+	mixins.UpdateModelMixin,
+	mixins.RetrieveModelMixin,
+	mixins.DestroyModelMixin,
+	mixins.ListModelMixin,
+	GenericViewSet):
+	"""
+	Общая база CRUD-вьюсетов общежития: аутентификация, курсорная
+	пагинация, фильтры из `query_filters`, жадная подгрузка связей по
+	вложенным сериализаторам и ограничение выборки владельцем записи.
+
+	Запись идёт в одной транзакции с обновлением счётчиков `/stats/`.
+	Выгрузки в xlsx/docx строятся по колонкам из `export_columns`.
+	Массовые операции доступны на `<раздел>/bulk/`.
+
+	Ответы списка и карточки кэшируются по пользователю и полному адресу
+	запроса (см. `response_cache`); запись в модель или в модели вложенных
+	сериализаторов сдвигает версию, и старые ответы больше не читаются.
+	Кроме того, они несут ETag/Last-Modified и отвечают 304 на условный GET.
+	"""
+
+	authentication_classes =  (CsrfExemptSessionAuthentication, SignedTokenAuthentication, CachedBasicAuthentication)
+	# Выборки, /stats/ и /changes/ ограничены владельцем - без пользователя их нет
+	permission_classes = (IsAuthenticated,)
+	pagination_class = KeysetPagination
+	cursor_ordering = ("id",)
+	query_filters = ()
+	export_name = None
+	export_title = None
+	export_columns = ()
+	bulk_max_items = 1000
+	cache_responses = True
+
+	def get_queryset(self):
+		return self.build_queryset(self.request.user, self.request.query_params)
+
+	@classmethod
+	def build_queryset(cls, user, params):
+		"""Выборка вьюсета вне запроса, например для фоновой выгрузки."""
+		qs = cls.queryset.all()
+		qs = apply_filters(qs, params, cls.query_filters)
+		qs = eager_load(qs, cls.serializer_class)
+
+		return cls.scope_queryset(qs, user)
+
+	@staticmethod
+	def scope_queryset(qs, user):
+		if user.is_superuser:
+			return qs
+
+		return qs.filter(user=user)
+
+	def list(self, request, *args, **kwargs):
+		queryset = self.filter_queryset(self.get_queryset())
+		return self.conditional_response(queryset, super().list, request, *args, **kwargs)
+
+	def retrieve(self, request, *args, **kwargs):
+		lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+		try:
+			queryset = self.filter_queryset(self.get_queryset()).filter(**{self.lookup_field: lookup})
+		except (TypeError, ValueError, DjangoValidationError):
+			raise Http404
+		return self.conditional_response(queryset, super().retrieve, request, *args, **kwargs)
+
+	def conditional_response(self, queryset, view, request, *args, **kwargs):
+		"""
+		Отвечает 304 на If-None-Match/If-Modified-Since, ничего не
+		сериализуя. Отпечаток выборки хранится в кэше ответов рядом с
+		данными, так что при попадании в кэш база не нужна вовсе.
+		"""
+		key = data = None
+		if self.cache_responses:
+			key = response_cache.response_key(self.queryset.model, self.serializer_class, request.user, request.build_absolute_uri())
+			cached = response_cache.load(key)
+			if cached is not None:
+				data, etag, last_modified = cached
+		if data is None:
+			etag, last_modified = conditional.fingerprint(queryset, self.serializer_class, request.user)
+
+		response = None
+		if etag:
+			response = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+		if response is None:
+			if data is not None:
+				response = Response(data)
+			else:
+				response = view(request, *args, **kwargs)
+				if key and response.status_code == 200:
+					response_cache.store(key, (response.data, etag, last_modified))
+
+		if etag and response.status_code in (200, 304):
+			response["ETag"] = etag
+			response["Last-Modified"] = http_date(last_modified.timestamp())
+		# Браузер хранит ответ, но каждый раз сверяется с сервером
+		patch_cache_control(response, private=True, no_cache=True)
+		patch_vary_headers(response, ("Cookie", "Authorization"))
+		return response
+
+	def perform_create(self, serializer):
+		with transaction.atomic():
+			super().perform_create(serializer)
+
+	def perform_update(self, serializer):
+		with transaction.atomic():
+			super().perform_update(serializer)
+
+	def perform_destroy(self, instance):
+		with transaction.atomic(), stats.batch(), changes.batch(), workload.batch(), occupancy.batch():
+			super().perform_destroy(instance)
+
+	class StatsSerializer(serializers.Serializer):
+		count = serializers.IntegerField()
+		avg = serializers.FloatField(allow_null=True)
+		max = serializers.IntegerField(allow_null=True)
+		min = serializers.IntegerField(allow_null=True)
+		by_status = serializers.DictField(child=serializers.IntegerField(), required=False)
+		by_month = serializers.DictField(child=serializers.IntegerField(), required=False)
+
+	@action(detail=False, methods=["GET"], url_path="stats")
+	def get_stats(self, request, *args, **kwargs):
+		serializer = self.StatsSerializer(instance=stats.read(self.queryset.model, request.user))
+
+		return Response(serializer.data)
+
+	@action(detail=False, methods=["GET"], url_path="changes")
+	def get_changes(self, request, *args, **kwargs):
+		"""
+		Дельта-синхронизация. Без `since` отдаются все строки страницами
+		по id: пока `more` истинно, следующая страница - по ссылке `next`,
+		токен приходит с последней. С `since=<токен>` - только изменённые
+		после него строки и id удалённых; пока `more` истинно, нужно
+		запрашивать дальше с новым токеном. Фильтры списка здесь не
+		применяются: иначе строка, вышедшая из-под фильтра, не попала бы ни
+		в изменённые, ни в удалённые.
+		"""
+		queryset = self.build_queryset(request.user, {}).order_by("id")
+		since = request.query_params.get("since")
+		if not since:
+			return self.changes_snapshot(request, queryset)
+
+		try:
+			since = changes.parse_token(since)
+		except ValueError:
+			return Response({"error": "Неверный токен"}, status=400)
+
+		delta = changes.read(self.queryset.model, self.serializer_class, request.user, since)
+		rows = list(queryset.filter(delta["changed"]))
+		# Строка из журнала, которой уже нет в срезе, для клиента удалена
+		gone = delta["ids"] - {row.pk for row in rows}
+
+		return Response({
+			"token": changes.format_token(delta["token"]),
+			"changed": self.get_serializer(rows, many=True).data,
+			"deleted": sorted({*delta["deleted"], *gone}),
+			"more": delta["more"],
+		})
+
+	def changes_snapshot(self, request, queryset):
+		# Токен берётся до первой страницы и идёт дальше в ссылках: всё,
+		# что изменится, пока клиент листает, придёт по нему же
+		snapshot = request.query_params.get("snapshot")
+		if snapshot is None:
+			snapshot = changes.format_token(changes.latest_token())
+		else:
+			try:
+				changes.parse_token(snapshot)
+			except ValueError:
+				return Response({"error": "Неверный токен"}, status=400)
+
+		paginator = ChangesPagination()
+		rows = paginator.paginate_queryset(queryset, request)
+		next_link = paginator.get_next_link()
+		return Response({
+			"token": None if next_link else snapshot,
+			"changed": self.get_serializer(rows, many=True).data,
+			"deleted": [],
+			"more": next_link is not None,
+			"next": next_link and replace_query_param(next_link, "snapshot", snapshot),
+		})
+
+	def get_export_queryset(self):
+		return self.filter_queryset(self.get_queryset()).order_by(*self.cursor_ordering)
+
+	def export_response(self, writer, extension):
+		# Файл собирается на диске и отдаётся по частям; у xlsx память не
+		# растёт с таблицей, docx строится в памяти целиком (см. write_docx)
+		file_stream = tempfile.TemporaryFile()
+		writer(self.get_export_queryset(), self.export_columns, self.export_title, file_stream)
+		file_stream.seek(0)
+
+		return FileResponse(file_stream, as_attachment=True, filename=f"{self.export_name}.{extension}")
+
+	@action(detail=False, methods=["GET"], url_path="export-excel")
+	def export_to_excel(self, request, *args, **kwargs):
+		return self.export_response(exports.write_xlsx, "xlsx")
+
+	@action(detail=False, methods=["GET"], url_path="export-word")
+	def export_to_word(self, request, *args, **kwargs):
+		return self.export_response(exports.write_docx, "docx")
+
+
+	@action(detail=False, methods=["POST", "PATCH", "DELETE"], url_path="bulk")
+	def bulk(self, request, *args, **kwargs):
+		"""
+		POST - массив новых объектов, PATCH - массив изменений с `id`,
+		DELETE - `{"ids": [...]}`. Всё выполняется в одной транзакции:
+		bulk_create, UPDATE ... WHERE id IN и DELETE ... WHERE id IN.
+		Менять и удалять можно только свои записи, как и поштучно.
+		"""
+		handlers = {
+			"POST": self.perform_bulk_create,
+			"PATCH": self.perform_bulk_update,
+			"DELETE": self.perform_bulk_destroy,
+		}
+		return handlers[request.method](request)
+
+	def get_bulk_context(self, items):
+		serializer_class = self.get_serializer_class()
+		columns = set()
+		for item in items:
+			columns.update(item)
+		fields = importers.related_fields(serializer_class(), columns)
+
+		return {**self.get_serializer_context(), "related": importers.load_related(fields, items)}
+
+	def get_bulk_items(self, request):
+		items = request.data
+		if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+			return None, Response({"error": "Ожидается непустой массив объектов"}, status=400)
+		if len(items) > self.bulk_max_items:
+			return None, Response({"error": f"Не больше {self.bulk_max_items} объектов за раз"}, status=400)
+		return items, None
+
+	def perform_bulk_create(self, request):
+		items, error = self.get_bulk_items(request)
+		if error:
+			return error
+
+		context = self.get_bulk_context(items)
+		serializer = self.get_serializer_class()(data=items, many=True, context=context)
+		serializer.is_valid(raise_exception=True)
+
+		model = self.queryset.model
+		with transaction.atomic():
+			instances = self.build_bulk_instances(serializer.validated_data, request.user)
+			model.objects.bulk_create(instances)
+			post_bulk_create.send(sender=model, instances=instances)
+
+		return Response(self.get_serializer(instances, many=True).data, status=201)
+
+	def build_bulk_instances(self, validated_data, user):
+		model = self.queryset.model
+		return [model(**{**data, "user": user}) for data in validated_data]
+
+	def perform_bulk_update(self, request):
+		items, error = self.get_bulk_items(request)
+		if error:
+			return error
+
+		groups = defaultdict(list)
+		seen, duplicates = set(), set()
+		for item in items:
+			fields = dict(item)
+			pk = fields.pop("id", None)
+			if not isinstance(pk, int) or isinstance(pk, bool):
+				return Response({"error": "У каждого объекта должен быть целый id"}, status=400)
+			# Повтор строки дал бы две пары до/после на одно изменение - счётчики разъехались бы
+			if pk in seen:
+				duplicates.add(pk)
+			seen.add(pk)
+			if not request.user.is_superuser:
+				fields.pop("user", None)
+			if fields:
+				groups[json.dumps(fields, sort_keys=True, default=str)].append(pk)
+		if duplicates:
+			return Response({"error": "Каждый id можно указать только один раз", "duplicates": sorted(duplicates)}, status=400)
+
+		model = self.queryset.model
+		ids = [pk for pks in groups.values() for pk in pks]
+		scoped = self.scope_queryset(model.objects.all(), request.user)
+		attnames = [field.attname for field in model._meta.concrete_fields]
+		before = {row["id"]: row for row in scoped.filter(id__in=ids).values(*attnames)}
+		missing = sorted(set(ids) - before.keys())
+		if missing:
+			return Response({"error": "Объекты не найдены", "missing": missing}, status=404)
+
+		# Одинаковые изменения проверяются один раз и становятся одним UPDATE
+		context = self.get_bulk_context(items)
+		updates, errors = [], []
+		for payload, pks in groups.items():
+			serializer = self.get_serializer_class()(data=json.loads(payload), partial=True, context=context)
+			if not serializer.is_valid():
+				errors.extend({"id": pk, "errors": serializer.errors} for pk in pks)
+				continue
+			updates.append((pks, serializer.validated_data))
+		if errors:
+			return Response({"errors": errors}, status=400)
+
+		old, new = [], []
+		with transaction.atomic():
+			for pks, validated in updates:
+				# UPDATE не вызывает auto_now, время изменения ставится явно
+				validated = {**validated, "updated_at": timezone.now()}
+				scoped.filter(id__in=pks).update(**validated)
+				for pk in pks:
+					old.append(before[pk])
+					new.append(self._apply_changes(model, before[pk], validated))
+			post_bulk_update.send(sender=model, before=old, after=new)
+
+		return Response({"updated": len(before)})
+
+	def perform_bulk_destroy(self, request):
+		ids = request.data.get("ids") if isinstance(request.data, dict) else None
+		if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+			return Response({"error": "Ожидается {\"ids\": [...]}"}, status=400)
+		if len(ids) > self.bulk_max_items:
+			return Response({"error": f"Не больше {self.bulk_max_items} объектов за раз"}, status=400)
+
+		model = self.queryset.model
+		scoped = self.scope_queryset(model.objects.all(), request.user)
+		with transaction.atomic(), stats.batch(), changes.batch(), workload.batch(), occupancy.batch():
+			# Как в PATCH: чужие и несуществующие id - 404, ничего не удаляется
+			rows = scoped.filter(id__in=ids).select_for_update()
+			missing = sorted(set(ids) - set(rows.values_list("id", flat=True)))
+			if missing:
+				return Response({"error": "Объекты не найдены", "missing": missing}, status=404)
+			_, deleted = rows.delete()
+
+		return Response({"deleted": deleted.get(model._meta.label, 0)})
+
+	@staticmethod
+	def _apply_changes(model, values, validated):
+		values = dict(values)
+		for name, value in validated.items():
+			field = model._meta.get_field(name)
+			if field.is_relation:
+				values[field.attname] = value.pk if value is not None else None
+			else:
+				values[field.attname] = value
+		return values
+
+
+class ImportMixin:
+	"""
+	Массовая загрузка строк из xlsx/CSV: `POST <раздел>/import/` с файлом в
+	поле `file`. Колонки называются как поля сериализатора или как ключи
+	`import_aliases`; `dry_run=1` только проверяет файл.
+	"""
+
+	import_aliases = {}
+
+	@action(detail=False, methods=["POST"], url_path="import", parser_classes=(MultiPartParser, FormParser))
+	def import_rows(self, request, *args, **kwargs):
+		upload = request.FILES.get("file")
+		if upload is None:
+			return Response({"error": "Файл не передан"}, status=400)
+
+		dry_run = request.data.get("dry_run", "").lower() in ("1", "true", "yes")
+		try:
+			report = importers.import_rows(
+				self.get_serializer_class(),
+				importers.read_rows(upload),
+				request.user,
+				aliases=self.import_aliases,
+				dry_run=dry_run,
+			)
+		except importers.ImportFormatError as error:
+			return Response({"error": str(error)}, status=400)
+
+		return Response(report)
@@ -0,0 +1,278 @@
+"""
+Нагрузка персонала и автоматическое назначение заявок на ремонт.
+
+`Staff.open_requests` - число заявок сотрудника в статусах `new` и
+`in_progress`. Счётчик ведётся приращениями из обработчиков сигналов,
+как счётчики /stats/, поэтому наименее загруженный сотрудник находится
+одним запросом по индексу, без COUNT по заявкам. `rebuild` пересчитывает
+счётчик с нуля.
+"""
+import heapq
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from studentDormitory.models import Staff, RepairRequests
+
+OPEN_STATUSES = ("new", "in_progress")
+PREVIEW_LIMIT = 500
+
+
+def collect(rows, sign, deltas=None):
+	"""
+	Добавляет в `deltas` вклад строк заявок (словарей attname -> значение)
+	со знаком `sign`: +1 для вставки, -1 для удаления.
+	"""
+	if deltas is None:
+		deltas = defaultdict(int)
+	for values in rows:
+		if values.get("staff_id") and values.get("status") in OPEN_STATUSES:
+			deltas[values["staff_id"]] += sign
+	return deltas
+
+
+_pending = threading.local()
+
+
+@contextmanager
+def batch():
+	"""Как `stats.batch()`: приращения копятся и пишутся на выходе."""
+	if getattr(_pending, "deltas", None) is not None:
+		yield
+		return
+
+	_pending.deltas = defaultdict(int)
+	try:
+		yield
+		deltas, _pending.deltas = _pending.deltas, None
+		apply(deltas)
+	finally:
+		_pending.deltas = None
+
+
+def apply(deltas):
+	pending = getattr(_pending, "deltas", None)
+	if pending is not None:
+		for pk, delta in deltas.items():
+			pending[pk] += delta
+		return
+
+	# Один UPDATE на каждое значение приращения, а не на сотрудника
+	by_delta = defaultdict(list)
+	for pk, delta in deltas.items():
+		if delta:
+			by_delta[delta].append(pk)
+	for delta, pks in by_delta.items():
+		Staff.objects.filter(id__in=pks).update(open_requests=F("open_requests") + delta)
+
+
+def record_saved(instance, created):
+	deltas = collect([instance.current_values()], 1)
+	previous = None if created else instance.loaded_values()
+	if previous:
+		collect([previous], -1, deltas)
+	apply(deltas)
+
+
+def record_deleted(instance):
+	apply(collect([instance.loaded_values() or instance.current_values()], -1))
+
+
+def record_bulk_created(instances):
+	apply(collect((instance.current_values() for instance in instances), 1))
+
+
+def record_bulk_updated(before, after):
+	apply(collect(before, -1, collect(after, 1)))
+
+
+def candidates(owner_id, post=None):
+	"""
+	Сотрудники, которым можно назначить заявку владельца `owner_id`: только
+	его собственные - чужих сотрудников он не видит, даже если заявку
+	распределяет суперпользователь.
+	"""
+	staff = Staff.objects.filter(user_id=owner_id)
+	if post:
+		staff = staff.filter(post=post)
+	return staff
+
+
+def pick(owner_id, post=None):
+	"""
+	Наименее загруженный сотрудник (при равенстве - с меньшим id) или None.
+	Строка блокируется до конца транзакции; на PostgreSQL занятые соседней
+	транзакцией строки пропускаются, и одновременные заявки расходятся по
+	разным сотрудникам.
+	"""
+	ordered = candidates(owner_id, post).order_by("open_requests", "id")
+	with transaction.atomic():
+		return ordered.select_for_update(skip_locked=True).first() or ordered.first()
+
+
+def assign(pairs):
+	"""
+	Назначает исполнителей пачке новых заявок: `pairs` - пары (заявка,
+	должность или None); исполнитель берётся среди сотрудников владельца
+	заявки. Нагрузка читается один раз и дальше считается в памяти, так что
+	пачка расходится поровну. Возвращает заявки, для которых сотрудника не
+	нашлось.
+	"""
+	loads, heaps, unassigned = {}, {}, []
+	for request, post in pairs:
+		key = (request.user_id, post)
+		heap = heaps.get(key)
+		if heap is None:
+			rows = list(candidates(request.user_id, post).values_list("id", "open_requests"))
+			for pk, load in rows:
+				loads.setdefault(pk, load)
+			heap = heaps[key] = [(loads[pk], pk) for pk, _ in rows]
+			heapq.heapify(heap)
+
+		while heap and heap[0][0] != loads[heap[0][1]]:
+			# Сотрудника уже нагрузили через кучу другой должности
+			_, pk = heapq.heappop(heap)
+			heapq.heappush(heap, (loads[pk], pk))
+		if not heap:
+			unassigned.append(request)
+			continue
+
+		load, pk = heapq.heappop(heap)
+		request.staff_id = pk
+		loads[pk] = load + 1
+		heapq.heappush(heap, (load + 1, pk))
+	return unassigned
+
+
+def _spread(loads):
+	return {"min": min(loads.values(), default=0), "max": max(loads.values(), default=0)}
+
+
+def _balance(loads, backlog):
+	"""
+	Ходы (заявка, от кого, кому) для одного владельца: `loads` - нагрузка
+	его сотрудников (меняется на месте), `backlog` - пары (заявка,
+	исполнитель или None) в порядке очереди.
+	"""
+	movable = defaultdict(list)
+	moves = []
+	for pk, staff_id in backlog:
+		if staff_id is not None:
+			movable[staff_id].append(pk)
+		elif loads:
+			receiver = min(loads, key=lambda staff: (loads[staff], staff))
+			moves.append((pk, None, receiver))
+			loads[receiver] += 1
+
+	# Сотрудников немного, поэтому min/max по словарю на каждом шаге
+	while movable:
+		donor = max(movable, key=lambda staff: (loads[staff], -staff))
+		receiver = min(loads, key=lambda staff: (loads[staff], staff))
+		if loads[donor] - loads[receiver] <= 1:
+			break
+		moves.append((movable[donor].pop(), donor, receiver))
+		loads[donor] -= 1
+		loads[receiver] += 1
+		if not movable[donor]:
+			del movable[donor]
+	return moves
+
+
+def rebalance(user, post=None, dry_run=False):
+	"""
+	Выравнивает очередь: новые (`new`) заявки переходят от самых
+	загруженных сотрудников владельца заявки к наименее загруженным, пока
+	разница нагрузок больше одной заявки. У суперпользователя очередь
+	каждого владельца выравнивается отдельно, заявки между владельцами не
+	переходят. Заявки `in_progress` остаются у своих исполнителей, у
+	сотрудника уходят самые свежие заявки. Заявки без исполнителя (без
+	фильтра по должности) тоже распределяются.
+	"""
+	requests = RepairRequests.objects.filter(status="new")
+	staff = Staff.objects.all() if user.is_superuser else Staff.objects.filter(user=user)
+	if not user.is_superuser:
+		requests = requests.filter(user=user)
+	if post:
+		staff = staff.filter(post=post)
+
+	with transaction.atomic():
+		owners = defaultdict(dict)
+		for pk, owner, load in staff.select_for_update().values_list("id", "user_id", "open_requests"):
+			owners[owner][pk] = load
+		loads = {pk: load for owned in owners.values() for pk, load in owned.items()}
+		in_scope = Q(staff_id__in=loads) if post else Q(staff_id__in=loads) | Q(staff_id__isnull=True)
+		rows = requests.filter(in_scope).select_for_update().order_by("date", "id").values_list("id", "user_id", "staff_id")
+
+		backlog = defaultdict(list)
+		for pk, owner, staff_id in rows:
+			# Заявка, назначенная чужому сотруднику, в очередь владельца не входит
+			if staff_id is None or staff_id in owners[owner]:
+				backlog[owner].append((pk, staff_id))
+		before = _spread(loads)
+
+		moves = []
+		for owner, queue in backlog.items():
+			moves += _balance(owners[owner], queue)
+		loads = {pk: load for owned in owners.values() for pk, load in owned.items()}
+
+		if moves and not dry_run:
+			_move(moves)
+
+	return {
+		"dry_run": dry_run,
+		"backlog": sum(len(queue) for queue in backlog.values()),
+		"moved": len(moves),
+		"before": before,
+		"after": _spread(loads),
+		"moves": [{"id": pk, "from": donor, "to": receiver} for pk, donor, receiver in moves[:PREVIEW_LIMIT]],
+	}
+
+
+def _move(moves):
+	"""Один UPDATE на получателя; счётчики, журнал и кэш - через post_bulk_update."""
+	# signals сам импортирует этот модуль
+	from studentDormitory.signals import post_bulk_update
+
+	attnames = [field.attname for field in RepairRequests._meta.concrete_fields]
+	targets = {pk: receiver for pk, _, receiver in moves}
+	before = list(RepairRequests.objects.filter(id__in=targets).values(*attnames))
+
+	now = timezone.now()
+	by_receiver = defaultdict(list)
+	for pk, receiver in targets.items():
+		by_receiver[receiver].append(pk)
+	for receiver, pks in by_receiver.items():
+		RepairRequests.objects.filter(id__in=pks).update(staff_id=receiver, updated_at=now)
+
+	after = [{**values, "staff_id": targets[values["id"]], "updated_at": now} for values in before]
+	post_bulk_update.send(sender=RepairRequests, before=before, after=after)
+
+
+def compute():
+	"""Нагрузка по заявкам группировкой в SQL: {id сотрудника: заявок}."""
+	rows = Staff.objects.annotate(
+		load=Count("repairrequests", filter=Q(repairrequests__status__in=OPEN_STATUSES))
+	).values_list("id", "load")
+	return dict(rows)
+
+
+def stored():
+	return dict(Staff.objects.values_list("id", "open_requests"))
+
+
+def rebuild():
+	"""Пересчитывает счётчики с нуля. Возвращает число исправленных."""
+	with transaction.atomic():
+		actual = stored()
+		expected = compute()
+		fixed = {pk: load for pk, load in expected.items() if actual.get(pk) != load}
+		by_load = defaultdict(list)
+		for pk, load in fixed.items():
+			by_load[load].append(pk)
+		for load, pks in by_load.items():
+			Staff.objects.filter(id__in=pks).update(open_requests=load)
+	return len(fixed)